@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# benchmark.py - End-to-end pipeline benchmarks on synthetic portfolios
+"""
+Time and memory-profile the pipeline stages on synthetic portfolios of
+10k to 50M rows (src/data/synthetic.py) and append the results to a JSON
+history, comparing each stage with its previous run on the same machine.
+
+Stages: clean_data (src.data.preprocess), run_all_tests
+(CompleteHypothesisTester), optimize_premium (the vectorized portfolio
+path, plus per-policy calls on a sample) and create_plots (the top-level
+src/visualization/create_plots.py, from a cold cube and figure cache).
+Every stage runs in a fresh process so its peak RSS is its own; wall time,
+CPU time (including worker processes) and peak RSS are recorded.
+Generated portfolios are kept under --work-dir and reused.
+
+Usage:
+    python benchmark.py --sizes 10k 1m
+    python benchmark.py --sizes 10m --stages clean_data run_all_tests --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+NOTEBOOKS_DIR = Path(__file__).resolve().parent
+REPO_ROOT = NOTEBOOKS_DIR.parent
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000, '50m': 50_000_000}
+STAGES = ['clean_data', 'run_all_tests', 'optimize_premium', 'create_plots']
+RAW_PATH = 'data/raw/insurance_data.parquet'
+PROCESSED_PATH = 'data/processed/cleaned_data.parquet'
+MODEL_FEATURES = ['VehicleAge', 'CubicCapacity', 'VehicleType', 'Province', 'PreviousClaims', 'Gender']
+SINGLE_POLICY_CALLS = 1000
+REGRESSION_TOLERANCE = 0.2
+
+def reset_peak_rss():
+    """Restart the kernel's peak RSS counter of this process (Linux); False when unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def rss_mb(field='VmRSS'):
+    """Current (VmRSS) or peak (VmHWM) resident memory of this process in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class StageTimer:
+    """Wall time, CPU time (this process and its workers) and peak RSS of the enclosed block"""
+
+    def __enter__(self):
+        self.peak_reset = reset_peak_rss()
+        self.rss_before_mb = rss_mb('VmRSS')
+        self._usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        self.cpu_seconds = sum(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+                               for before, after in zip(self._usage, usage))
+        self.peak_rss_mb = rss_mb('VmHWM')
+        self.workers_peak_rss_mb = usage[1].ru_maxrss / 1024
+        return False
+
+    def result(self, rows):
+        return {
+            'rows': rows,
+            'seconds': self.seconds,
+            'rows_per_second': rows / self.seconds if self.seconds else None,
+            'cpu_seconds': self.cpu_seconds,
+            'rss_before_mb': self.rss_before_mb,
+            'peak_rss_mb': self.peak_rss_mb,
+            'stage_peak_mb': self.peak_rss_mb - self.rss_before_mb if self.peak_reset else None,
+            'workers_peak_rss_mb': self.workers_peak_rss_mb,
+        }
+
+# Stages: run in the child process with the size's work directory as cwd
+
+def bench_clean_data(rows, args):
+    import pandas as pd
+    from src.data.preprocess import calculate_business_metrics, clean_data, load_config
+    from src.data.schema import CategoryDictionary, apply_schema, load_schema
+    from src.data.storage import write_parquet
+
+    df = calculate_business_metrics(pd.read_parquet(RAW_PATH), verbose=False)
+    imputation = {}
+    with StageTimer() as timer:
+        cleaned = clean_data(df, imputation=imputation)
+
+    # Processed data in the pipeline's layout: input of the later stages
+    schema = load_schema(load_config(NOTEBOOKS_DIR / 'config' / 'params.yaml'))
+    write_parquet(apply_schema(cleaned, schema, CategoryDictionary()), PROCESSED_PATH)
+    return timer, {'output_rows': len(cleaned), 'imputed_columns': sorted(imputation)}
+
+def bench_run_all_tests(rows, args):
+    from src.analysis.hypothesis_complete import CompleteHypothesisTester
+
+    with StageTimer() as timer:
+        results = CompleteHypothesisTester(PROCESSED_PATH).run_all_tests()
+    return timer, {'tests': len(results)}
+
+class FrameModel:
+    """Claim model adapter: single-policy dicts are predicted as one-row frames, as the quote server does"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, X):
+        import pandas as pd
+        return self.model.predict(pd.DataFrame([X]) if isinstance(X, dict) else X)
+
+def load_claim_model(model_path, policies, seed=42):
+    """The trained model, or a stand-in random forest fitted on the portfolio when it cannot be loaded"""
+    try:
+        from src.models.compiled import load_model
+        return load_model(model_path), str(model_path)
+    except Exception as e:
+        print(f"Could not load {model_path} ({type(e).__name__}); fitting a stand-in model")
+
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    categorical = ['VehicleType', 'Province', 'Gender']
+    numerical = [col for col in MODEL_FEATURES if col not in categorical]
+    claims = policies[policies['TotalClaims'] > 0].head(20_000)
+    model = make_pipeline(
+        ColumnTransformer([
+            ('categorical', make_pipeline(SimpleImputer(strategy='most_frequent'),
+                                          OneHotEncoder(handle_unknown='ignore')), categorical),
+            ('numerical', SimpleImputer(strategy='median'), numerical),
+        ]),
+        RandomForestRegressor(n_estimators=50, max_depth=10, random_state=seed, n_jobs=1),
+    )
+    model.fit(claims[MODEL_FEATURES].astype({col: object for col in categorical}), claims['TotalClaims'])
+    return model, 'stand-in RandomForestRegressor(n_estimators=50, max_depth=10)'
+
+def bench_optimize_premium(rows, args):
+    import numpy as np
+    import pandas as pd
+    from src.models.premium_optimizer import optimize_premium, optimize_premium_batch
+
+    policies = pd.read_parquet(RAW_PATH, columns=MODEL_FEATURES + ['TotalPremium', 'TotalClaims'])
+    policies = policies.astype({col: object for col in ['VehicleType', 'Province', 'Gender']})
+    model, model_name = load_claim_model(NOTEBOOKS_DIR / args.model, policies, args.seed)
+    model = FrameModel(model)
+    premiums = policies['TotalPremium'].clip(lower=1.0)
+    features = policies[MODEL_FEATURES]
+
+    with StageTimer() as timer:
+        result = optimize_premium_batch(features, model, premiums)
+
+    # The per-policy path, on a sample
+    sample = features.head(SINGLE_POLICY_CALLS)
+    records = sample.astype(object).where(sample.notna(), None).to_dict('records')
+    start = time.perf_counter()
+    for policy, premium in zip(records, premiums):
+        optimize_premium(policy, model, float(premium))
+    single_ms = (time.perf_counter() - start) * 1000 / max(len(records), 1)
+    return timer, {'model': model_name, 'single_policy_ms': single_ms,
+                   'increase_share': float(np.mean(result['recommendation'] == 'INCREASE'))}
+
+def bench_create_plots(rows, args):
+    from src.visualization import create_plots
+
+    # Cold run: rebuild the cube and render every figure
+    Path('data/processed/plot_cube.json').unlink(missing_ok=True)
+    shutil.rmtree('reports/figures/.cache', ignore_errors=True)
+    with StageTimer() as timer:
+        create_plots.main(profile=args.plot_profile, jobs=args.jobs)
+    return timer, {'profile': args.plot_profile}
+
+BENCHMARKS = {
+    'clean_data': bench_clean_data,
+    'run_all_tests': bench_run_all_tests,
+    'optimize_premium': bench_optimize_premium,
+    'create_plots': bench_create_plots,
+}
+
+def run_stage(args):
+    """Child process: run one stage and write its measurements to args.result"""
+    if args.run_stage == 'create_plots':
+        # create_plots belongs to the top-level project, whose src would be shadowed by this one
+        sys.path = [str(REPO_ROOT)] + [p for p in sys.path if Path(p or '.').resolve() != NOTEBOOKS_DIR]
+    os.chdir(args.work_dir)
+    timer, details = BENCHMARKS[args.run_stage](args.rows, args)
+    with open(args.result, 'w') as f:
+        json.dump({**timer.result(args.rows), **details}, f)
+
+# Parent: data, child processes, history
+
+def prepare_portfolio(size_dir, rows, seed):
+    """Generate the raw portfolio unless the work directory already holds it; returns seconds spent"""
+    from src.data.synthetic import write_portfolio
+
+    manifest_path = size_dir / 'portfolio.json'
+    manifest = {'rows': rows, 'seed': seed}
+    if (size_dir / RAW_PATH).exists() and manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            if json.load(f) == manifest:
+                return 0.0
+    shutil.rmtree(size_dir, ignore_errors=True)
+    start = time.perf_counter()
+    write_portfolio(size_dir / RAW_PATH, rows, seed)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    return time.perf_counter() - start
+
+def launch_stage(stage, rows, size_dir, args):
+    """Run a stage in a fresh process; output goes to <size_dir>/<stage>.log"""
+    result_path = size_dir / f'{stage}.result.json'
+    result_path.unlink(missing_ok=True)
+    command = [sys.executable, str(Path(__file__).resolve()), '--run-stage', stage, '--rows', str(rows),
+               '--work-dir', str(size_dir), '--result', str(result_path), '--seed', str(args.seed),
+               '--model', args.model, '--plot-profile', args.plot_profile]
+    if args.jobs is not None:
+        command += ['--jobs', str(args.jobs)]
+    with open(size_dir / f'{stage}.log', 'w') as log:
+        try:
+            process = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            return {'stage': stage, 'rows': rows, 'status': 'timeout'}
+    if process.returncode != 0 or not result_path.exists():
+        return {'stage': stage, 'rows': rows, 'status': 'failed', 'returncode': process.returncode,
+                'log': str(size_dir / f'{stage}.log')}
+    with open(result_path, 'r') as f:
+        return {'stage': stage, 'status': 'ok', **json.load(f)}
+
+def host_info():
+    return {'machine': platform.machine(), 'system': platform.system(), 'python': platform.python_version(),
+            'cpus': os.cpu_count()}
+
+def git_commit():
+    """(commit, has uncommitted changes) of the repository, or (None, None) outside git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def load_history(path):
+    if not Path(path).exists():
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def previous_result(history, host, stage, rows):
+    """Latest successful result of the stage at this size on the same kind of machine"""
+    for run in reversed(history):
+        if run.get('host') != host:
+            continue
+        for result in run['results']:
+            if result['stage'] == stage and result['rows'] == rows and result['status'] == 'ok':
+                return run, result
+    return None, None
+
+def compare(result, previous_run, previous, tolerance):
+    """Relative change in time and peak memory against the previous result; flags regressions"""
+    if previous is None or result['status'] != 'ok':
+        return None
+    changes = {key: result[key] / previous[key] - 1 for key in ('seconds', 'peak_rss_mb') if previous[key]}
+    return {'commit': previous_run.get('commit'), 'timestamp': previous_run.get('timestamp'),
+            **{f'{key}_change': change for key, change in changes.items()},
+            'regression': any(change > tolerance for change in changes.values())}
+
+def print_results(results):
+    print(f"\n{'Stage':18} {'Rows':>12} {'Seconds':>10} {'Rows/s':>12} {'CPU s':>8} {'Peak MB':>9}  vs previous")
+    for result in results:
+        if result['status'] != 'ok':
+            print(f"{result['stage']:18} {result['rows']:>12,} {result['status'].upper():>10}")
+            continue
+        baseline = result.get('baseline')
+        change = ''
+        if baseline:
+            change = (f"time {baseline.get('seconds_change', 0):+.1%}, memory {baseline.get('peak_rss_mb_change', 0):+.1%}"
+                      f"{'  REGRESSION' if baseline['regression'] else ''}")
+        print(f"{result['stage']:18} {result['rows']:>12,} {result['seconds']:>10.3f} "
+              f"{result['rows_per_second']:>12,.0f} {result['cpu_seconds']:>8.2f} {result['peak_rss_mb']:>9.1f}  {change}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline benchmarks on synthetic portfolios')
+    parser.add_argument('--sizes', nargs='+', default=['10k', '1m'],
+                        help=f"Portfolio sizes: {', '.join(SIZES)} or a row count")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--seed', type=int, default=42, help='Portfolio seed')
+    parser.add_argument('--work-dir', default='data/benchmark', help='Generated portfolios and stage outputs')
+    parser.add_argument('--history', default='reports/benchmarks/history.json')
+    parser.add_argument('--model', default='models/random_forest.joblib', help='Claim model for optimize_premium')
+    parser.add_argument('--plot-profile', default='report', help='Render profile for create_plots')
+    parser.add_argument('--jobs', type=int, default=None, help='Render processes for create_plots')
+    parser.add_argument('--timeout', type=float, default=None, help='Seconds per stage')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help='Relative slowdown or memory growth reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 on a regression')
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args)
+        return 0
+
+    host = host_info()
+    history = load_history(args.history)
+    commit, dirty = git_commit()
+    results = []
+    for size in args.sizes:
+        rows = SIZES[size.lower()] if size.lower() in SIZES else int(size)
+        size_dir = (Path(args.work_dir) / f'{rows}_rows').resolve()
+        seconds = prepare_portfolio(size_dir, rows, args.seed)
+        if seconds:
+            print(f"Generated {rows:,} rows in {seconds:.1f}s")
+        for stage in STAGES:
+            if stage not in args.stages:
+                # Later stages read clean_data's output
+                if stage != 'clean_data' or (size_dir / PROCESSED_PATH).exists():
+                    continue
+            print(f"Running {stage} on {rows:,} rows...")
+            result = launch_stage(stage, rows, size_dir, args)
+            if stage not in args.stages:
+                continue
+            previous_run, previous = previous_result(history, host, stage, rows)
+            result['baseline'] = compare(result, previous_run, previous, args.tolerance)
+            results.append(result)
+
+    run = {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit,
+           'uncommitted_changes': dirty, 'host': host, 'seed': args.seed, 'results': results}
+    history.append(run)
+    Path(args.history).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=2)
+
+    print_results(results)
+    print(f"\nHistory: {args.history} ({len(history)} runs)")
+    regressions = [r for r in results if r.get('baseline') and r['baseline']['regression']]
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
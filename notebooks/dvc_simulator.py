@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 # dvc_simulator.py - Simple DVC command simulator for demonstration
+# status and repro run the real pipeline (src/utils/pipeline.py); push/pull are simulated
 import argparse
 import os
 import json
+import sys
 
-def dvc_status():
-    """Simulate dvc status command"""
-    print("Data and pipelines are up to date.")
-    print("All dependencies are consistent.")
+from src.utils import pipeline
+
+def dvc_status(targets=None):
+    """Show stages whose deps, params or outs changed since dvc.lock"""
+    pipeline.main(['status'] + list(targets or []))
     
 def dvc_push():
     """Simulate dvc push command"""
@@ -19,29 +22,30 @@ def dvc_pull():
     print("Pulling data from remote storage...")
     print("SUCCESS: 1 file pulled from myremote")
     
-def dvc_repro():
-    """Simulate dvc repro command"""
+def dvc_repro(targets=None, force=False):
+    """Reproduce changed stages, running independent ones in parallel"""
     print("Reproducing pipeline...")
-    print("Running stage 'preprocess'...")
-    print("Running stage 'eda'...")
-    print("Running stage 'hypothesis'...")
-    print("Running stage 'modeling'...")
+    argv = ['repro'] + list(targets or []) + (['--force'] if force else [])
+    if pipeline.main(argv) != 0:
+        sys.exit(1)
     print("SUCCESS: Pipeline reproduced successfully!")
     
 def main():
     parser = argparse.ArgumentParser(description='DVC Simulator')
     parser.add_argument('command', help='DVC command to simulate')
+    parser.add_argument('targets', nargs='*', help='Stages for status/repro')
+    parser.add_argument('--force', '-f', action='store_true', help='repro: run stages even if unchanged')
     
     args = parser.parse_args()
     
     if args.command == 'status':
-        dvc_status()
+        dvc_status(args.targets)
     elif args.command == 'push':
         dvc_push()
     elif args.command == 'pull':
         dvc_pull()
     elif args.command == 'repro':
-        dvc_repro()
+        dvc_repro(args.targets, args.force)
     elif args.command == '--version':
         print("3.0.0")
     else:
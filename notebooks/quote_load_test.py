@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# quote_load_test.py - Load generator for the premium quote server
+"""
+Fire quote requests at src/models/quote_server.py and report client-side
+latency and throughput, plus the server's own /stats.
+
+Usage:
+    python -m src.models.quote_server &
+    python quote_load_test.py --requests 20000 --concurrency 128
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+
+FEATURES = ['VehicleAge', 'CubicCapacity', 'VehicleType', 'Province', 'PreviousClaims', 'Gender']
+
+def sample_requests(data_path, n_requests, seed=42):
+    """Quote request bodies drawn from real policies"""
+    df = pd.read_csv(data_path, usecols=FEATURES + ['TotalPremium'])
+    df = df.sample(n_requests, replace=True, random_state=seed)
+    premiums = df.pop('TotalPremium').clip(lower=1.0)
+    policies = df.astype(object).where(df.notna(), None).to_dict('records')
+    return [json.dumps({'policy': policy, 'current_premium': float(premium)}).encode()
+            for policy, premium in zip(policies, premiums)]
+
+async def http_request(reader, writer, host, method, path, body=b''):
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def client(host, port, bodies, latencies, statuses):
+    """One keep-alive connection sending its share of requests back to back"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in bodies:
+            start = time.perf_counter()
+            status, _ = await http_request(reader, writer, host, 'POST', '/quote', body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def run_load(host, port, bodies, concurrency):
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, bodies[i::concurrency], latencies, statuses)
+                           for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, server_stats = await http_request(reader, writer, host, 'GET', '/stats')
+    writer.close()
+    return latencies, statuses, elapsed, server_stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Quote server load generator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=128)
+    parser.add_argument('--data', default='data/raw/insurance_data.csv')
+    args = parser.parse_args()
+
+    bodies = sample_requests(args.data, args.requests)
+    latencies, statuses, elapsed, server_stats = asyncio.run(
+        run_load(args.host, args.port, bodies, args.concurrency))
+
+    latencies_ms = np.asarray(latencies) * 1000
+    print(f"Requests:    {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:,.0f} req/s)")
+    print(f"Status:      {statuses}")
+    print(f"Latency:     p50 {np.percentile(latencies_ms, 50):.2f}ms, "
+          f"p99 {np.percentile(latencies_ms, 99):.2f}ms, max {latencies_ms.max():.2f}ms")
+    print(f"Server:      {json.dumps(server_stats, indent=2)}")
+
+if __name__ == "__main__":
+    main()
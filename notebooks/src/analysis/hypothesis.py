@@ -4,14 +4,16 @@ Hypothesis testing for insurance risk analysis.
 Tests the four business hypotheses.
 """
 
-import pandas as pd
-import numpy as np
-from scipy import stats
 import json
 
+from src.analysis.grouped import GroupMoments, anova_oneway
+from src.data.storage import load_processed
+
 class HypothesisTester:
-    def __init__(self, data_path):
-        self.df = pd.read_csv(data_path)
+    COLUMNS = ['Province', 'LossRatio']
+    
+    def __init__(self, data_path, filters=None):
+        self.df = load_processed(data_path, columns=self.COLUMNS, filters=filters)
         self.results = {}
     
     def test_province_risk(self):
@@ -21,22 +23,17 @@ class HypothesisTester:
         """
         print("Testing: Province risk differences")
         
-        provinces = self.df['Province'].unique()
-        loss_ratios = []
-        
-        for province in provinces:
-            province_data = self.df[self.df['Province'] == province]
-            if len(province_data) > 10:
-                loss_ratios.append(province_data['LossRatio'].values)
+        moments = GroupMoments.from_frame(self.df, 'Province', 'LossRatio')
+        moments = moments.subset(moments.rows > 10)
         
         # ANOVA test
-        f_stat, p_value = stats.f_oneway(*loss_ratios)
+        f_stat, p_value = anova_oneway(moments)
         
         result = {
             'test': 'ANOVA',
             'f_statistic': float(f_stat),
             'p_value': float(p_value),
-            'reject_null': p_value < 0.05,
+            'reject_null': bool(p_value < 0.05),
             'conclusion': 'REJECT' if p_value < 0.05 else 'FAIL TO REJECT'
         }
         
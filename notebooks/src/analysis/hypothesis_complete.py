@@ -1,23 +1,62 @@
 # src/analysis/hypothesis_complete.py
 """
 Complete hypothesis testing for all 4 business hypotheses.
+With --scan, tests every Province x VehicleType x Gender x postal-code band
+segment against the rest of the book instead (src/analysis/segment_scan.py).
 Version: 1.0
 """
 
 import pandas as pd
 import numpy as np
 from scipy import stats
+import argparse
 import json
+import yaml
 from pathlib import Path
 
+from src.analysis.grouped import anova_oneway, factorize, welch_ttest
+from src.analysis.resampling import ResamplingEngine
+from src.analysis.segment_scan import run_scan
+from src.analysis.stats_store import DEFAULT_STORE_PATH, SegmentStats
+from src.data.storage import load_processed
+from src.utils.instrument import traced
+
 class CompleteHypothesisTester:
     """Test all four business hypotheses from the report"""
     
-    def __init__(self, data_path):
-        self.df = pd.read_csv(data_path)
+    # Only these columns are read from the processed dataset
+    COLUMNS = ['Province', 'PostalCode', 'Gender', 'LossRatio', 'HasClaim']
+    
+    def __init__(self, data_path=None, filters=None, stats=None, resampling=None):
+        """
+        Parameters:
+        -----------
+        data_path : str, optional
+            Processed dataset (cleaned_data.csv or its Parquet sibling)
+        filters : list, optional
+            Row filters pushed down to the Parquet reader, e.g. to test a
+            subset of provinces without reading the other row groups
+        stats : SegmentStats, optional
+            Precomputed segment statistics; when given without data_path the
+            tests run from the statistics alone
+        resampling : ResamplingEngine, optional
+            Adds permutation p-values and bootstrap CIs next to the
+            parametric results (needs row-level data)
+        """
+        self.df = load_processed(data_path, columns=self.COLUMNS, filters=filters) if data_path else None
+        self.stats = stats
+        self.resampling = resampling
         self.results = {}
         self.alpha = 0.05  # Significance level
     
+    @property
+    def segment_stats(self):
+        """Sufficient statistics the tests are computed from (built from the data on first use)"""
+        if self.stats is None:
+            self.stats = SegmentStats.from_frame(self.df)
+        return self.stats
+    
+    @traced()
     def test_1_province_risk(self):
         """
         Hypothesis 1: "There are no risk differences across provinces."
@@ -26,20 +65,17 @@ class CompleteHypothesisTester:
         print("\nHYPOTHESIS 1: Province Risk Differences")
         print("-" * 40)
         
-        # Get loss ratios for each province
-        provinces = self.df['Province'].unique()
-        loss_ratios_by_province = []
+        if 'Province' not in self.segment_stats.moments:
+            print("Province statistics not found - skipping test")
+            return None
         
-        for province in provinces:
-            province_data = self.df[self.df['Province'] == province]
-            if len(province_data) >= 10:  # Ensure sufficient data
-                loss_ratios = province_data['LossRatio'].dropna().values
-                if len(loss_ratios) > 0:
-                    loss_ratios_by_province.append(loss_ratios)
+        # Loss ratio moments for every province
+        moments = self.segment_stats.moments['Province']
+        moments = moments.subset((moments.rows >= 10) & (moments.count > 0))  # Ensure sufficient data
         
         # Perform ANOVA
-        if len(loss_ratios_by_province) >= 2:
-            f_stat, p_value = stats.f_oneway(*loss_ratios_by_province)
+        if len(moments) >= 2:
+            f_stat, p_value = anova_oneway(moments)
             
             result = {
                 'test': 'One-way ANOVA',
@@ -47,7 +83,7 @@ class CompleteHypothesisTester:
                 'f_statistic': float(f_stat),
                 'p_value': float(p_value),
                 'alpha': self.alpha,
-                'reject_null': p_value < self.alpha,
+                'reject_null': bool(p_value < self.alpha),
                 'conclusion': 'REJECT' if p_value < self.alpha else 'FAIL TO REJECT',
                 'business_implication': 'Geographic-based pricing is justified'
             }
@@ -61,6 +97,7 @@ class CompleteHypothesisTester:
         
         return None
     
+    @traced()
     def test_2_3_zipcode_density(self):
         """
         Hypotheses 2 & 3: No risk or margin differences between zip codes
@@ -69,25 +106,27 @@ class CompleteHypothesisTester:
         print("\nHYPOTHESES 2 & 3: Zip Code Density Effects")
         print("-" * 40)
         
-        if 'PostalCode' not in self.df.columns:
+        if 'PostalCode' not in self.segment_stats.moments:
             print("PostalCode column not found - skipping test")
             return None
         
-        # Use frequency as density proxy
-        zipcode_counts = self.df['PostalCode'].value_counts()
-        median_count = zipcode_counts.median()
+        # Use frequency as density proxy (categorical dtype lists unseen codes too)
+        zip_moments = self.segment_stats.moments['PostalCode']
+        zipcode_counts = zip_moments.rows
+        observed = zipcode_counts > 0
+        median_count = np.median(zipcode_counts[observed])
+        high_density_zip = zipcode_counts > median_count
         
-        high_density_zips = zipcode_counts[zipcode_counts > median_count].index
-        low_density_zips = zipcode_counts[zipcode_counts <= median_count].index
+        if self.df is not None:
+            self.df['HighDensity'] = self.df['PostalCode'].isin(zip_moments.labels[high_density_zip])
         
-        self.df['HighDensity'] = self.df['PostalCode'].isin(high_density_zips)
+        # Test for risk difference (Loss Ratio): pool postal-code moments into density bands
+        density = zip_moments.regroup(np.where(observed, high_density_zip.astype(np.int64), -1), [False, True])
+        high_n, high_mean, high_m2 = density.get(True)
+        low_n, low_mean, low_m2 = density.get(False)
         
-        # Test for risk difference (Loss Ratio)
-        high_density_lr = self.df[self.df['HighDensity']]['LossRatio'].dropna()
-        low_density_lr = self.df[~self.df['HighDensity']]['LossRatio'].dropna()
-        
-        if len(high_density_lr) > 0 and len(low_density_lr) > 0:
-            t_stat, p_value = stats.ttest_ind(high_density_lr, low_density_lr, equal_var=False)
+        if high_n > 0 and low_n > 0:
+            t_stat, p_value = welch_ttest(high_n, high_mean, high_m2, low_n, low_mean, low_m2)
             
             result = {
                 'test': "Welch's t-test",
@@ -95,7 +134,7 @@ class CompleteHypothesisTester:
                 't_statistic': float(t_stat),
                 'p_value': float(p_value),
                 'alpha': self.alpha,
-                'reject_null': p_value < self.alpha,
+                'reject_null': bool(p_value < self.alpha),
                 'conclusion': 'REJECT' if p_value < self.alpha else 'FAIL TO REJECT',
                 'business_implication': 'Zip-code level analysis can reveal profit pockets'
             }
@@ -109,6 +148,7 @@ class CompleteHypothesisTester:
         
         return None
     
+    @traced()
     def test_4_gender_difference(self):
         """
         Hypothesis 4: "There is no risk difference between women and men."
@@ -117,12 +157,13 @@ class CompleteHypothesisTester:
         print("\nHYPOTHESIS 4: Gender Risk Difference")
         print("-" * 40)
         
-        if 'Gender' not in self.df.columns or 'HasClaim' not in self.df.columns:
+        if 'Gender' not in self.segment_stats.claims:
             print("Required columns not found - skipping test")
             return None
         
-        # Create contingency table
-        contingency = pd.crosstab(self.df['Gender'], self.df['HasClaim'])
+        # Contingency table from the stored claim/no-claim counts
+        contingency = self.segment_stats.claims['Gender']
+        contingency = contingency.loc[contingency.sum(axis=1) > 0, contingency.sum(axis=0) > 0]
         
         # Perform chi-square test
         chi2, p_value, dof, expected = stats.chi2_contingency(contingency)
@@ -134,7 +175,7 @@ class CompleteHypothesisTester:
             'p_value': float(p_value),
             'degrees_freedom': int(dof),
             'alpha': self.alpha,
-            'reject_null': p_value < self.alpha,
+            'reject_null': bool(p_value < self.alpha),
             'conclusion': 'REJECT' if p_value < self.alpha else 'FAIL TO REJECT',
             'business_interpretation': 'Statistical difference exists but pricing must use multidimensional assessment'
         }
@@ -160,6 +201,66 @@ class CompleteHypothesisTester:
         self.results['hypothesis_4'] = result
         return result
     
+    @traced()
+    def resample_tests(self):
+        """
+        Permutation p-values and bootstrap confidence intervals for the tests
+        that have run, stored under 'resampling' in each result.
+        """
+        if self.df is None or self.resampling is None:
+            print("Resampling needs row-level data and a ResamplingEngine - skipping")
+            return None
+        
+        print("\nRESAMPLING: permutation p-values and bootstrap CIs")
+        print("-" * 40)
+        engine = self.resampling
+        loss_ratio = self.df['LossRatio'].to_numpy(dtype=np.float64, na_value=np.nan)
+        
+        if 'hypothesis_1' in self.results:
+            # Same provinces as the ANOVA: at least 10 rows
+            codes, labels = factorize(self.df['Province'])
+            rows = np.bincount(codes[codes >= 0], minlength=len(labels))
+            kept = rows >= 10
+            remap = np.where(kept, np.cumsum(kept) - 1, -1)
+            codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+            self.results['hypothesis_1']['resampling'] = {
+                'permutation': engine.permutation_test(codes, loss_ratio, 'anova_f'),
+                'bootstrap': engine.bootstrap_ci(codes, loss_ratio, 'mean_range'),
+            }
+        
+        if 'hypothesis_2_3' in self.results and 'HighDensity' in self.df.columns:
+            # Group 1 = high density, so the effect is high minus low; rows without a postal
+            # code are in neither band, as in the parametric test
+            codes = np.where(self.df['PostalCode'].isna(), -1, self.df['HighDensity'].to_numpy(dtype=np.int64))
+            self.results['hypothesis_2_3']['resampling'] = {
+                'permutation': engine.permutation_test(codes, loss_ratio, 'welch_t'),
+                'bootstrap': engine.bootstrap_ci(codes, loss_ratio, 'mean_difference'),
+            }
+        
+        if 'hypothesis_4' in self.results:
+            has_claim = self.df['HasClaim'].to_numpy(dtype=np.float64, na_value=np.nan)
+            codes, labels = factorize(self.df['Gender'])
+            resampled = {'permutation': engine.permutation_test(codes, has_claim, 'chi2')}
+            if 'Male' in labels and 'Female' in labels:
+                # Group 1 = Male, group 0 = Female: effect is the claim-rate difference
+                gender = self.df['Gender'].astype(object)
+                codes = np.select([gender == 'Female', gender == 'Male'], [0, 1], default=-1)
+                resampled['bootstrap'] = engine.bootstrap_ci(codes, has_claim, 'mean_difference')
+            self.results['hypothesis_4']['resampling'] = resampled
+        
+        for key, result in self.results.items():
+            if 'resampling' in result:
+                permutation = result['resampling']['permutation']
+                if 'reason' in permutation:
+                    print(f"{key}: permutation test skipped - {permutation['reason']}")
+                    continue
+                print(f"{key}: permutation p={permutation['p_value']:.4f} "
+                      f"({permutation['n_resamples']} resamples"
+                      f"{', stopped early' if permutation['stopped_early'] else ''})")
+        
+        return self.results
+    
+    @traced()
     def run_all_tests(self):
         """Run all four hypothesis tests"""
         print("=" * 60)
@@ -170,6 +271,9 @@ class CompleteHypothesisTester:
         test2_3 = self.test_2_3_zipcode_density()
         test4 = self.test_4_gender_difference()
         
+        if self.resampling is not None:
+            self.resample_tests()
+        
         # Save results
         Path('reports').mkdir(exist_ok=True)
         with open('reports/hypothesis_results_complete.json', 'w') as f:
@@ -181,15 +285,58 @@ class CompleteHypothesisTester:
         
         return self.results
 
+def update_stats_store(batch_path, batch_id, store_path=DEFAULT_STORE_PATH):
+    """Fold one batch of processed rows (e.g. a new policy month) into the persisted store"""
+    batch = load_processed(batch_path, columns=CompleteHypothesisTester.COLUMNS)
+    store = SegmentStats.load(store_path).merge(SegmentStats.from_frame(batch, batch_id=batch_id))
+    store.save(store_path)
+    print(f"Merged {len(batch)} rows from {batch_path} as batch '{batch_id}' into {store_path}")
+    return store
+
 # Example usage
 if __name__ == "__main__":
-    # Load data
-    data_path = 'data/processed/cleaned_data.csv'
+    parser = argparse.ArgumentParser(description="Run the four business hypothesis tests")
+    parser.add_argument('--data', default='data/processed/cleaned_data.csv',
+                        help="Processed dataset to test (full recompute)")
+    parser.add_argument('--stats', default=None,
+                        help="Segment statistics store; tests run from it instead of the data")
+    parser.add_argument('--append', default=None,
+                        help="Processed batch to merge into --stats before testing")
+    parser.add_argument('--batch-id', default=None,
+                        help="Identifier of the --append batch (e.g. 2024-06), guards against double counting")
+    parser.add_argument('--resample', action='store_true',
+                        help="Add permutation p-values and bootstrap CIs (hypothesis.resampling in config/params.yaml)")
+    parser.add_argument('--scan', action='store_true',
+                        help="Test every segment against the rest of the book with FDR control (hypothesis.scan)")
+    args = parser.parse_args()
+    
+    engine = None
+    hypothesis_config = {}
+    if args.resample or args.scan:
+        with open('config/params.yaml', 'r') as f:
+            hypothesis_config = yaml.safe_load(f).get('hypothesis', {})
+    if args.resample:
+        engine = ResamplingEngine.from_config(hypothesis_config.get('resampling'),
+                                              alpha=hypothesis_config.get('alpha', 0.05))
     
-    print(f"Loading data from {data_path}")
     try:
-        tester = CompleteHypothesisTester(data_path)
-        results = tester.run_all_tests()
-        print("\nResults saved to: reports/hypothesis_results_complete.json")
+        if args.scan:
+            print(f"Scanning segments of {args.data}")
+            run_scan(args.data, hypothesis_config.get('scan'), hypothesis_config.get('alpha', 0.05))
+        else:
+            if args.stats:
+                if args.append:
+                    store = update_stats_store(args.append, args.batch_id or args.append, args.stats)
+                elif Path(args.stats).exists():
+                    store = SegmentStats.load(args.stats)
+                else:
+                    # First run: seed the store from the full history
+                    store = update_stats_store(args.data, 'initial', args.stats)
+                tester = CompleteHypothesisTester(stats=store)
+            else:
+                print(f"Loading data from {args.data}")
+                tester = CompleteHypothesisTester(args.data, resampling=engine)
+            results = tester.run_all_tests()
+            print("\nResults saved to: reports/hypothesis_results_complete.json")
     except FileNotFoundError:
         print("Data file not found. Please run preprocessing first.")
@@ -0,0 +1,284 @@
+# src/analysis/resampling.py
+"""
+Permutation p-values and bootstrap confidence intervals for the hypothesis tests.
+
+Each test is reduced to integer group codes plus one value column. A batch
+of B resamples is evaluated at once: values are shuffled row-wise (or given
+Poisson(1) bootstrap weights), and per-resample group count/sum/sum-of-squares
+come from a single np.bincount over offset codes. Batches run on a process
+pool; every batch draws from its own child of one SeedSequence, so results
+are identical for any number of workers. Permutation tests stop early once
+a Clopper-Pearson interval for the p-value lies entirely on one side of alpha.
+Version: 1.0
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+
+# ---------------------------------------------------------------------------
+# Statistics on per-resample group moments: arrays of shape (B, groups)
+# ---------------------------------------------------------------------------
+
+def anova_f(count, s1, s2):
+    """One-way ANOVA F per resample"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_ss = np.where(count > 0, s1 ** 2 / count, 0.0).sum(axis=1)
+        n_total = count.sum(axis=1)
+        n_groups = (count > 0).sum(axis=1)
+        between = group_ss - s1.sum(axis=1) ** 2 / n_total
+        within = s2.sum(axis=1) - group_ss
+        return (between / (n_groups - 1)) / (within / (n_total - n_groups))
+
+def welch_t_abs(count, s1, s2):
+    """|Welch t| between groups 0 and 1 per resample (two-sided)"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s1 / count
+        var = (s2 - s1 * mean) / (count - 1)
+        se = np.sqrt(var[:, 0] / count[:, 0] + var[:, 1] / count[:, 1])
+        return np.abs(mean[:, 1] - mean[:, 0]) / se
+
+def chi2_pearson(count, s1, s2):
+    """Pearson chi-square of group x (value 0/1) counts per resample"""
+    observed = np.stack([count - s1, s1], axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = (observed.sum(axis=2, keepdims=True) * observed.sum(axis=1, keepdims=True)
+                    / observed.sum(axis=(1, 2), keepdims=True))
+        return np.nansum((observed - expected) ** 2 / expected, axis=(1, 2))
+
+def mean_range(count, s1, s2):
+    """Spread between the highest and lowest group mean"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s1 / count
+    return np.nanmax(mean, axis=1) - np.nanmin(mean, axis=1)
+
+def mean_difference(count, s1, s2):
+    """Mean of group 1 minus mean of group 0"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return s1[:, 1] / count[:, 1] - s1[:, 0] / count[:, 0]
+
+STATISTICS = {
+    'anova_f': anova_f,
+    'welch_t': welch_t_abs,
+    'chi2': chi2_pearson,
+    'mean_range': mean_range,
+    'mean_difference': mean_difference,
+}
+# Statistics unchanged by adding a constant to every value. Their values are centred on the
+# overall mean before the sums are taken, so s2 - s1 * mean does not cancel (as in GroupMoments)
+SHIFT_INVARIANT = {'anova_f', 'welch_t', 'mean_range', 'mean_difference'}
+
+# ---------------------------------------------------------------------------
+# Batch evaluation (runs in worker processes)
+# ---------------------------------------------------------------------------
+
+_WORKER_DATA = {}
+
+def _init_worker(codes, values, n_groups):
+    """Ship the data once per worker instead of once per batch"""
+    _WORKER_DATA['codes'] = codes
+    _WORKER_DATA['values'] = values
+    _WORKER_DATA['n_groups'] = n_groups
+
+def batch_moments(codes, values, n_groups, rng, batch, kind):
+    """Group count/sum/sum-of-squares for `batch` permuted or bootstrap-weighted copies"""
+    n = len(codes)
+    offsets = np.arange(batch, dtype=np.int64)[:, None] * n_groups
+    flat = (offsets + codes[None, :]).ravel()
+    size = batch * n_groups
+    if kind == 'permutation':
+        x = rng.permuted(np.tile(values, (batch, 1)), axis=1).ravel()
+        count = np.broadcast_to(np.bincount(codes, minlength=n_groups).astype(np.float64), (batch, n_groups))
+        weighted = x
+    elif kind == 'bootstrap':
+        weights = rng.poisson(1.0, size=batch * n).astype(np.float64)
+        x = np.tile(values, batch)
+        count = np.bincount(flat, weights=weights, minlength=size).reshape(batch, n_groups)
+        weighted = weights * x
+    else:
+        raise ValueError(f"Unknown resampling kind: {kind}")
+    s1 = np.bincount(flat, weights=weighted, minlength=size).reshape(batch, n_groups)
+    s2 = np.bincount(flat, weights=weighted * x, minlength=size).reshape(batch, n_groups)
+    return count, s1, s2
+
+def _run_batch(kind, statistic, batch, seed):
+    rng = np.random.default_rng(seed)
+    moments = batch_moments(_WORKER_DATA['codes'], _WORKER_DATA['values'], _WORKER_DATA['n_groups'],
+                            rng, batch, kind)
+    return STATISTICS[statistic](*moments)
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+class ResamplingEngine:
+    """Batched, parallel permutation tests and Poisson-bootstrap confidence intervals"""
+
+    def __init__(self, n_permutations=10000, n_bootstrap=2000, confidence=0.95, alpha=0.05,
+                 n_jobs=None, seed=42, memory_budget_mb=256, decision_level=0.001):
+        self.n_permutations = int(n_permutations)
+        self.n_bootstrap = int(n_bootstrap)
+        self.confidence = confidence
+        self.alpha = alpha
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.seed = seed
+        self.memory_budget_mb = memory_budget_mb
+        self.decision_level = decision_level  # error rate of the early-stopping decision
+
+    @classmethod
+    def from_config(cls, config, alpha=0.05):
+        """Build from the hypothesis.resampling section of params.yaml"""
+        return cls(alpha=alpha, **(config or {}))
+
+    def _batch_size(self, n_rows):
+        # ~5 float64/int64 arrays of batch x rows are alive per batch
+        return int(max(1, min(1000, self.memory_budget_mb * 1024 * 1024 // (40 * max(n_rows, 1)))))
+
+    def _batches(self, total, n_rows, stream):
+        """Batch sizes and child seeds; the seed of batch i depends only on (seed, stream, i)"""
+        batch = self._batch_size(n_rows)
+        sizes = [batch] * (total // batch) + ([total % batch] if total % batch else [])
+        seeds = np.random.SeedSequence([self.seed, stream]).spawn(len(sizes))
+        return sizes, seeds
+
+    def _map(self, codes, values, n_groups, kind, statistic, sizes, seeds, should_stop=None):
+        """Evaluate batches in waves of n_jobs, in order; stop between waves if asked"""
+        results = []
+        if self.n_jobs == 1:
+            _init_worker(codes, values, n_groups)
+            for size, seed in zip(sizes, seeds):
+                results.append(_run_batch(kind, statistic, size, seed))
+                if should_stop and should_stop(results):
+                    break
+            return results
+
+        with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker,
+                                 initargs=(codes, values, n_groups)) as pool:
+            for start in range(0, len(sizes), self.n_jobs):
+                wave = [pool.submit(_run_batch, kind, statistic, size, seed)
+                        for size, seed in zip(sizes[start:start + self.n_jobs],
+                                              seeds[start:start + self.n_jobs])]
+                for future in wave:
+                    results.append(future.result())
+                    if should_stop and should_stop(results):
+                        for pending in wave:
+                            pending.cancel()
+                        return results
+        return results
+
+    @staticmethod
+    def _prepare(codes, values, statistic):
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        keep = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[keep], values[keep]
+        if statistic in SHIFT_INVARIANT and len(values):
+            values = values - values.mean()
+        n_groups = int(codes.max()) + 1 if len(codes) else 0
+        code_dtype = np.int16 if n_groups < np.iinfo(np.int16).max else np.int64
+        return codes.astype(code_dtype), values, n_groups
+
+    @staticmethod
+    def _two_groups(counts, statistic):
+        """Why the statistic cannot be computed from these group counts, or None if it can"""
+        present = counts[0] > 0
+        if present.sum() < 2:
+            return f"{statistic} needs at least two non-empty groups, got {int(present.sum())}"
+        if statistic in ('welch_t', 'mean_difference') and not present[:2].all():
+            return f"{statistic} compares groups 0 and 1, but group {int(np.argmin(present[:2]))} is empty"
+        return None
+
+    def _decided(self, exceed, n):
+        """True once the exact binomial CI of the p-value excludes alpha"""
+        low = stats.beta.ppf(self.decision_level / 2, exceed, n - exceed + 1) if exceed > 0 else 0.0
+        high = stats.beta.ppf(1 - self.decision_level / 2, exceed + 1, n - exceed) if exceed < n else 1.0
+        return high < self.alpha or low > self.alpha
+
+    def permutation_test(self, codes, values, statistic):
+        """
+        Permutation p-value of a statistic over group codes.
+
+        Parameters:
+        -----------
+        codes : array-like of int
+            Group code per row (-1 rows are ignored)
+        values : array-like of float
+            Value per row (NaN rows are ignored)
+        statistic : str
+            Key of STATISTICS; larger means more extreme
+
+        Returns:
+        --------
+        dict: observed statistic, p-value, resamples used (permutations with a
+        non-finite statistic are left out of the p-value and counted in
+        n_non_finite) and whether it stopped early. When the observed statistic
+        is not finite (e.g. a one-row group or a constant outcome) the p-value
+        is NaN, the null is not rejected and 'reason' says why.
+        """
+        codes, values, n_groups = self._prepare(codes, values, statistic)
+        counts = np.bincount(codes, minlength=n_groups).astype(np.float64)[None, :]
+        result = {'method': 'permutation', 'statistic': statistic, 'observed': np.nan, 'p_value': np.nan,
+                  'n_resamples': 0, 'n_non_finite': 0, 'stopped_early': False, 'reject_null': False}
+        reason = self._two_groups(counts, statistic)
+        if reason is not None:
+            return {**result, 'reason': reason}
+        observed = float(STATISTICS[statistic](
+            counts,
+            np.bincount(codes, weights=values, minlength=n_groups)[None, :],
+            np.bincount(codes, weights=values * values, minlength=n_groups)[None, :])[0])
+        if not np.isfinite(observed):
+            return {**result, 'observed': observed, 'reason': f"observed {statistic} is not finite"}
+
+        sizes, seeds = self._batches(self.n_permutations, len(codes), stream=0)
+        state = {'exceed': 0, 'n': 0, 'non_finite': 0, 'seen': 0}
+
+        def should_stop(results):
+            for batch_stats in results[state['seen']:]:
+                finite = np.isfinite(batch_stats)
+                state['exceed'] += int(np.sum(batch_stats[finite] >= observed * (1 - 1e-12)))
+                state['n'] += int(finite.sum())
+                state['non_finite'] += int((~finite).sum())
+            state['seen'] = len(results)
+            return self._decided(state['exceed'], state['n'])
+
+        self._map(codes, values, n_groups, 'permutation', statistic, sizes, seeds, should_stop)
+        p_value = (state['exceed'] + 1) / (state['n'] + 1)
+        return {
+            **result,
+            'observed': observed,
+            'p_value': float(p_value),
+            'n_resamples': int(state['n']),
+            'n_non_finite': int(state['non_finite']),
+            'stopped_early': bool(state['n'] + state['non_finite'] < self.n_permutations),
+            'reject_null': bool(p_value < self.alpha),
+        }
+
+    def bootstrap_ci(self, codes, values, effect):
+        """
+        Percentile CI of a group-level effect (STATISTICS key) under a Poisson bootstrap.
+
+        Replicates with a non-finite effect (a group drawn empty) are left out
+        and counted in n_dropped, so the CI is conditional on every group being
+        drawn. Without two groups, or without finite replicates, the CI is NaN
+        and 'reason' says why.
+        """
+        codes, values, n_groups = self._prepare(codes, values, effect)
+        counts = np.bincount(codes, minlength=n_groups).astype(np.float64)[None, :]
+        result = {'method': 'poisson_bootstrap', 'effect': effect, 'estimate': np.nan, 'ci_low': np.nan,
+                  'ci_high': np.nan, 'confidence': self.confidence, 'n_resamples': 0, 'n_dropped': 0}
+        reason = self._two_groups(counts, effect)
+        if reason is not None:
+            return {**result, 'reason': reason}
+        estimate = float(STATISTICS[effect](
+            counts, np.bincount(codes, weights=values, minlength=n_groups)[None, :],
+            np.bincount(codes, weights=values * values, minlength=n_groups)[None, :])[0])
+
+        sizes, seeds = self._batches(self.n_bootstrap, len(codes), stream=1)
+        replicates = np.concatenate(self._map(codes, values, n_groups, 'bootstrap', effect, sizes, seeds))
+        finite = np.isfinite(replicates)
+        result.update(estimate=estimate, n_resamples=int(finite.sum()), n_dropped=int((~finite).sum()))
+        if not finite.any():
+            return {**result, 'reason': f"no bootstrap replicate of {effect} is finite"}
+        tail = (1 - self.confidence) / 2 * 100
+        low, high = np.percentile(replicates[finite], [tail, 100 - tail])
+        return {**result, 'ci_low': float(low), 'ci_high': float(high)}
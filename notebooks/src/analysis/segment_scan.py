@@ -0,0 +1,177 @@
+# src/analysis/segment_scan.py
+"""
+Segment scan: every segment against the rest of the book.
+
+Segments are the combinations of the scan dimensions (by default
+Province x VehicleType x Gender x PostalBand, the postal code's policy
+density band). The keys are factorized once and LossRatio moments and
+claim counts are accumulated per segment in one bincount pass; each
+segment's complement follows from the book totals by subtraction. Welch's
+t on LossRatio and a 2x2 chi-square on claim frequency are then computed
+for all segments at once. Both tests' p-values are corrected together as one
+family with Benjamini-Hochberg (or Benjamini-Yekutieli) FDR control, so a
+segment flagged by either test is within the stated FDR. The result is a
+ranked table, one row per segment, written to Parquet or CSV.
+Version: 1.0
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy import stats
+
+from src.analysis.grouped import GroupMoments, chi2_2x2, factorize, welch_ttest
+from src.data.storage import available_columns, load_processed
+from src.utils.instrument import traced
+
+POSTAL_BAND = 'PostalBand'
+DEFAULT_SCAN = {
+    'dimensions': ['Province', 'VehicleType', 'Gender', POSTAL_BAND],
+    'postal_bands': 4,
+    'value': 'LossRatio',
+    'flag': 'HasClaim',
+    'min_rows': 30,
+    'fdr_method': 'bh',
+    'output_path': 'reports/hypothesis_scan.parquet',
+}
+
+def postal_code_bands(postal_codes, n_bands=4):
+    """
+    Policy-density band of each row's postal code: postal codes are split
+    into n_bands quantile bands of their policy counts (ties share a band,
+    so some bands can stay empty).
+    """
+    codes, labels = factorize(postal_codes)
+    counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    observed = counts > 0
+    edges = np.quantile(counts[observed], np.linspace(0, 1, n_bands + 1)[1:-1]) if observed.any() else []
+    code_band = np.searchsorted(edges, counts, side='left')
+    band_labels = [f'density {band + 1}/{n_bands}' for band in range(n_bands)]
+    return pd.Categorical.from_codes(np.where(codes >= 0, code_band[np.maximum(codes, 0)], -1), band_labels)
+
+def fdr_adjust(p_values, method='bh'):
+    """FDR-adjusted p-values (q-values) of the non-NaN entries; NaN stays NaN"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full(len(p_values), np.nan)
+    tested = ~np.isnan(p_values)
+    if tested.any():
+        adjusted[tested] = stats.false_discovery_control(p_values[tested], method=method)
+    return adjusted
+
+@traced()
+def segment_scan(df, dimensions=DEFAULT_SCAN['dimensions'], value='LossRatio', flag='HasClaim', min_rows=30,
+                 fdr_method='bh', alpha=0.05):
+    """
+    Test every segment against its complement.
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        Processed rows with the dimension, value and flag columns
+    dimensions : list of str
+        Key columns whose combinations are the segments
+    value : str
+        Column compared with Welch's t (segment mean vs complement mean)
+    flag : str
+        Binary column compared with a 2x2 chi-square (segment vs complement)
+    min_rows : int
+        Segments, and complements, with fewer rows are reported but not tested
+    fdr_method : str
+        'bh' (Benjamini-Hochberg) or 'by' (Benjamini-Yekutieli, any dependence)
+    alpha : float
+        FDR level of the significant flag, over both tests of all segments
+
+    Returns:
+    --------
+    pd.DataFrame: one row per segment, ranked by the smaller q-value of the two tests
+    """
+    codes, labels = factorize(*[df[dim] for dim in dimensions])
+    if len(dimensions) == 1:
+        labels = pd.MultiIndex.from_arrays([labels], names=dimensions)
+    segments = GroupMoments.from_codes(codes, labels, df[value].to_numpy(dtype=np.float64, na_value=np.nan))
+
+    # Complement moments: the book's totals minus the segment (parallel-variance decomposition)
+    count = segments.count.astype(np.float64)
+    mean = np.nan_to_num(segments.mean)
+    n_total = count.sum()
+    book_mean = (count * mean).sum() / n_total if n_total else np.nan
+    book_m2 = segments.m2.sum() + (count * (mean - book_mean) ** 2).sum()
+    rest_count = n_total - count
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rest_mean = (n_total * book_mean - count * mean) / rest_count
+        rest_m2 = np.maximum(book_m2 - segments.m2 - count * rest_count / n_total * (mean - rest_mean) ** 2, 0.0)
+
+    # Claim counts per segment, from the rows with a flag
+    flags = df[flag].to_numpy(dtype=np.float64, na_value=np.nan)
+    flagged = (codes >= 0) & ~np.isnan(flags)
+    exposure = np.bincount(codes[flagged], minlength=len(labels)).astype(np.float64)
+    claims = np.bincount(codes[flagged], weights=(flags[flagged] > 0), minlength=len(labels))
+    rest_exposure, rest_claims = exposure.sum() - exposure, claims.sum() - claims
+
+    rows = segments.rows
+    tested = (rows >= min_rows) & (rows.sum() - rows >= min_rows)
+    t_stat, t_p = welch_ttest(count, segments.mean, segments.m2, rest_count, rest_mean, rest_m2)
+    chi2, chi2_p = chi2_2x2(claims, exposure - claims, rest_claims, rest_exposure - rest_claims)
+    t_p = np.where(tested, t_p, np.nan)
+    chi2_p = np.where(tested, chi2_p, np.nan)
+    # One correction over both families: flagging on either q-value then keeps the FDR at alpha
+    t_q, chi2_q = np.split(fdr_adjust(np.concatenate([t_p, chi2_p]), fdr_method), 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frequency = claims / exposure
+        rest_frequency = rest_claims / rest_exposure
+    result = labels.to_frame(index=False)
+    result = result.assign(**{
+        'rows': rows,
+        f'{value}_mean': segments.mean,
+        f'{value}_complement_mean': rest_mean,
+        f'{value}_difference': segments.mean - rest_mean,
+        'welch_t': np.where(tested, t_stat, np.nan),
+        'welch_p': t_p,
+        'welch_q': t_q,
+        'claim_frequency': frequency,
+        'complement_claim_frequency': rest_frequency,
+        'claim_frequency_difference': frequency - rest_frequency,
+        'chi2': np.where(tested, chi2, np.nan),
+        'chi2_p': chi2_p,
+        'chi2_q': chi2_q,
+        'tested': tested,
+    })
+    result['min_q'] = result[['welch_q', 'chi2_q']].min(axis=1)
+    result['significant'] = result['min_q'] < alpha
+    result = result.sort_values(['min_q', 'rows'], ascending=[True, False], na_position='last', kind='stable')
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    return result.reset_index(drop=True)
+
+def write_table(result, path):
+    """Write the scan table as Parquet, or as CSV when path ends in .csv"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.csv':
+        result.to_csv(path, index=False)
+    else:
+        result.to_parquet(path, index=False)
+    return path
+
+def run_scan(data_path, scan_config=None, alpha=0.05):
+    """Scan the processed dataset as configured in hypothesis.scan and write the ranked table"""
+    config = {**DEFAULT_SCAN, **(scan_config or {})}
+    dimensions = list(config['dimensions'])
+    source_columns = ['PostalCode' if dim == POSTAL_BAND else dim for dim in dimensions]
+    columns = [col for col in dict.fromkeys(source_columns + [config['value'], config['flag']])
+               if col in available_columns(data_path)]
+    missing = [dim for dim, col in zip(dimensions, source_columns) if col not in columns]
+    if missing:
+        print(f"Scan dimensions not in the data are skipped: {missing}")
+        dimensions = [dim for dim in dimensions if dim not in missing]
+
+    df = load_processed(data_path, columns=columns)
+    if POSTAL_BAND in dimensions:
+        df[POSTAL_BAND] = postal_code_bands(df['PostalCode'], int(config['postal_bands']))
+    result = segment_scan(df, dimensions, config['value'], config['flag'], int(config['min_rows']),
+                          config['fdr_method'], alpha)
+
+    path = write_table(result, config['output_path'])
+    print(f"Scanned {len(result)} segments of {' x '.join(dimensions)} ({int(result['tested'].sum())} tested, "
+          f"{int(result['significant'].sum())} significant at FDR {alpha} with {config['fdr_method'].upper()})")
+    print(f"Ranked results saved to: {path}")
+    return result
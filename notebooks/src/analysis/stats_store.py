@@ -0,0 +1,93 @@
+# src/analysis/stats_store.py
+"""
+Persisted, mergeable sufficient statistics for the hypothesis tests.
+
+For each segment dimension (Province, PostalCode, Gender) the store keeps
+per-segment LossRatio moments (row count, non-null count, mean and M2 --
+equivalent to count/sum/sum-of-squares but stable under merging) and the
+claim/no-claim contingency counts. A new month is folded in by merging its
+statistics, and the ANOVA, Welch t-test and chi-square results are then
+rebuilt from the store without rereading the history.
+Version: 1.0
+"""
+import json
+import pandas as pd
+from pathlib import Path
+
+from src.analysis.grouped import GroupMoments, contingency_table
+
+DIMENSIONS = ['Province', 'PostalCode', 'Gender']
+DEFAULT_STORE_PATH = 'data/processed/segment_stats.json'
+
+class SegmentStats:
+    """Per-dimension LossRatio moments and HasClaim counts, plus the batches they cover"""
+
+    def __init__(self, moments=None, claims=None, batches=None):
+        self.moments = moments or {}
+        self.claims = claims or {}
+        self.batches = list(batches or [])
+
+    @classmethod
+    def from_frame(cls, df, dimensions=DIMENSIONS, batch_id=None, value='LossRatio', flag='HasClaim'):
+        """Statistics of one batch of processed rows"""
+        moments, claims = {}, {}
+        for dim in dimensions:
+            if dim not in df.columns:
+                continue
+            if value in df.columns:
+                moments[dim] = GroupMoments.from_frame(df, dim, value)
+            if flag in df.columns:
+                claims[dim] = contingency_table(df[dim], df[flag])
+        return cls(moments, claims, [batch_id] if batch_id is not None else [])
+
+    def merge(self, other):
+        """Statistics covering both self and other; refuses to count a batch twice"""
+        overlap = set(self.batches) & set(other.batches)
+        if overlap:
+            raise ValueError(f"Batches already merged into the store: {sorted(overlap)}")
+
+        moments = dict(self.moments)
+        for dim, batch_moments in other.moments.items():
+            moments[dim] = moments[dim].merge(batch_moments) if dim in moments else batch_moments
+
+        claims = dict(self.claims)
+        for dim, batch_claims in other.claims.items():
+            if dim in claims:
+                merged = claims[dim].add(batch_claims, fill_value=0).fillna(0).astype('int64')
+                claims[dim] = merged.sort_index().sort_index(axis=1)
+            else:
+                claims[dim] = batch_claims
+
+        return SegmentStats(moments, claims, self.batches + other.batches)
+
+    def to_dict(self):
+        return {
+            'version': 1,
+            'batches': self.batches,
+            'moments': {dim: moments.to_dict() for dim, moments in self.moments.items()},
+            'claims': {dim: {'labels': table.index.tolist(),
+                             'columns': table.columns.tolist(),
+                             'counts': table.to_numpy().tolist()}
+                       for dim, table in self.claims.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        moments = {dim: GroupMoments.from_dict(values) for dim, values in data['moments'].items()}
+        claims = {dim: pd.DataFrame(values['counts'], index=values['labels'], columns=values['columns'])
+                  for dim, values in data['claims'].items()}
+        return cls(moments, claims, data.get('batches', []))
+
+    def save(self, path=DEFAULT_STORE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        return path
+
+    @classmethod
+    def load(cls, path=DEFAULT_STORE_PATH):
+        """Load a store; a missing file is an empty store"""
+        if not Path(path).exists():
+            return cls()
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
@@ -9,7 +9,21 @@ import numpy as np
 import yaml
 import json
 from pathlib import Path
+import argparse
 import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from src.data.schema import (CategoryDictionary, apply_schema, categories_memory_usage,
+                             categories_path, compact_numeric_dtype, default_memory_usage,
+                             float32_exact, load_schema)
+from src.data.dedup import Deduplicator, first_occurrences, fingerprint_columns
+from src.data.quantiles import DEFAULT_ERROR, QuantileSketch, median_imputation
+from src.data.storage import DEFAULT_ROW_GROUP_SIZE, ParquetChunkWriter, write_parquet
+from src.data.validation import Validator
+from src.utils.instrument import traced
+from src.utils.shared import SharedColumns
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,32 +34,66 @@ def load_config(config_path="config/params.yaml"):
     with open(config_path, 'r') as f:
         return yaml.safe_load(f)
 
-def calculate_business_metrics(df):
+@traced()
+def load_data(input_path, schema, chunksize=None):
+    """Load raw data (or an iterator of chunks), parsing declared categorical columns straight into categories"""
+    dtype = {col: 'category' for col in schema['categorical_cols']}
+    return pd.read_csv(input_path, dtype=dtype, chunksize=chunksize)
+
+@traced()
+def calculate_business_metrics(df, verbose=True):
     """Calculate key business metrics"""
-    logger.info("Calculating business metrics...")
+    if verbose:
+        logger.info("Calculating business metrics...")
     
-    # Calculate Loss Ratio
+    # Calculate Loss Ratio (undefined, not infinite, without premium)
     if 'TotalClaims' in df.columns and 'TotalPremium' in df.columns:
-        df['LossRatio'] = df['TotalClaims'] / df['TotalPremium']
+        df['LossRatio'] = df['TotalClaims'] / df['TotalPremium'].where(df['TotalPremium'] != 0)
         df['HasClaim'] = (df['TotalClaims'] > 0).astype(int)
-        logger.info(f"Loss Ratio calculated. Range: {df['LossRatio'].min():.3f} to {df['LossRatio'].max():.3f}")
+        if verbose:
+            logger.info(f"Loss Ratio calculated. Range: {df['LossRatio'].min():.3f} to {df['LossRatio'].max():.3f}")
+            zero_premium = int((df['TotalPremium'] == 0).sum())
+            if zero_premium:
+                logger.warning(f"Loss Ratio left undefined for {zero_premium} rows with zero premium")
     
     # Calculate Vehicle Age if not present
     if 'VehicleAge' not in df.columns and 'Year' in df.columns:
         current_year = pd.Timestamp.now().year
         df['VehicleAge'] = current_year - df['Year']
-        logger.info(f"VehicleAge calculated. Range: {df['VehicleAge'].min()} to {df['VehicleAge'].max()} years")
+        if verbose:
+            logger.info(f"VehicleAge calculated. Range: {df['VehicleAge'].min()} to {df['VehicleAge'].max()} years")
     
     return df
 
-def clean_data(df):
-    """Clean and validate data"""
+def imputation_columns(df):
+    """Split columns into median-imputed (numeric) and mode-imputed (categorical)"""
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+    return numeric_cols, categorical_cols
+
+def mode_imputation(value, missing):
+    value = value.item() if isinstance(value, np.generic) else value
+    return value, {'method': 'mode', 'value': value if isinstance(value, (int, float)) else str(value),
+                   'missing': int(missing)}
+
+@traced()
+def clean_data(df, quantile_error=DEFAULT_ERROR, imputation=None, key=None):
+    """
+    Clean and validate data
+    
+    Rows are duplicates when all columns, or just the `key` columns, match.
+    Numeric columns are filled with the median of a QuantileSketch (exact
+    when quantile_error is None or the column is small). Pass a dict as
+    `imputation` to collect the fill value and distribution of every
+    imputed column.
+    """
     logger.info("Cleaning data...")
+    imputation = {} if imputation is None else imputation
     
     initial_rows = len(df)
     
     # Remove duplicates
-    df = df.drop_duplicates()
+    df = df.drop_duplicates(subset=key)
     duplicates_removed = initial_rows - len(df)
     if duplicates_removed > 0:
         logger.warning(f"Removed {duplicates_removed} duplicate rows")
@@ -55,42 +103,64 @@ def clean_data(df):
     if missing_counts.sum() > 0:
         logger.warning(f"Missing values found: {missing_counts[missing_counts > 0].to_dict()}")
         
+        numeric_cols, categorical_cols = imputation_columns(df)
+        
         # Fill numeric columns with median
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
         for col in numeric_cols:
             if df[col].isnull().any():
-                df[col] = df[col].fillna(df[col].median())
+                fill, imputation[col] = median_imputation(QuantileSketch(quantile_error).update(df[col]),
+                                                          missing_counts[col])
+                df[col] = df[col].fillna(fill)
                 logger.info(f"Filled missing values in {col} with median")
         
         # Fill categorical columns with mode
-        categorical_cols = df.select_dtypes(include=['object']).columns
         for col in categorical_cols:
             if df[col].isnull().any():
-                df[col] = df[col].fillna(df[col].mode()[0])
+                fill, imputation[col] = mode_imputation(df[col].mode()[0], missing_counts[col])
+                df[col] = df[col].fillna(fill)
                 logger.info(f"Filled missing values in {col} with mode")
     else:
         logger.info("No missing values found")
     
     return df
 
-def save_metrics(df, output_path):
-    """Save preprocessing metrics"""
+def memory_metrics(memory_before_bytes, memory_after_bytes):
+    """Memory footprint after the compact schema, and the reduction it achieved"""
+    metrics = {'memory_usage_mb': float(memory_after_bytes / 1024 / 1024)}
+    if memory_before_bytes:
+        metrics['memory_usage_before_mb'] = float(memory_before_bytes / 1024 / 1024)
+        metrics['memory_reduction_pct'] = float((1 - memory_after_bytes / memory_before_bytes) * 100)
+    return metrics
+
+def save_metrics(df, output_path, memory_before_bytes=None, imputation=None, original_rows=None, dedup_key=None,
+                 validation=None):
+    """Save preprocessing metrics; original_rows is the raw row count, validation the Validator report"""
+    original_rows = len(df) if original_rows is None else original_rows
+    quarantined = validation['rows_quarantined'] if validation else 0
     metrics = {
         'preprocessing': {
-            'original_rows': int(len(df)),
-            'duplicates_removed': int(duplicates_removed) if 'duplicates_removed' in locals() else 0,
+            'original_rows': int(original_rows),
+            'rows_quarantined': int(quarantined),
+            'duplicates_removed': int(original_rows - quarantined - len(df)),
+            'dedup_key': dedup_key,
             'final_rows': int(len(df)),
             'columns_count': int(len(df.columns)),
-            'memory_usage_mb': float(df.memory_usage().sum() / 1024 / 1024)
+            **memory_metrics(memory_before_bytes, df.memory_usage(deep=True).sum())
         },
         'business_metrics': {
             'overall_loss_ratio': float(df['LossRatio'].mean()) if 'LossRatio' in df.columns else None,
             'claim_frequency': float(df['HasClaim'].mean()) if 'HasClaim' in df.columns else None,
             'total_premium': float(df['TotalPremium'].sum()) if 'TotalPremium' in df.columns else None,
             'total_claims': float(df['TotalClaims'].sum()) if 'TotalClaims' in df.columns else None
-        }
+        },
+        'imputation': imputation or {},
+        'validation': validation or {}
     }
     
+    return write_metrics(metrics, output_path)
+
+def write_metrics(metrics, output_path):
+    """Write a metrics dictionary as JSON"""
     # Ensure directory exists
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     
@@ -100,41 +170,545 @@ def save_metrics(df, output_path):
     logger.info(f"Metrics saved to {output_path}")
     return metrics
 
-def main():
+# ---------------------------------------------------------------------------
+# Streaming mode
+# ---------------------------------------------------------------------------
+# The streaming path parses the CSV once, in bounded chunks, and spills the
+# deduplicated chunks to a scratch directory. Global medians/modes are then
+# computed from value counts of the columns that actually contain nulls, and
+# a final pass over the spill imputes and appends to the output CSV. Peak
+# memory is one chunk plus 8 bytes per distinct row for duplicate detection
+# (a Deduplicator with max_memory_rows spills those to disk as well).
+
+def common_dtype(left, right):
+    """Dtype the full column would have had if parsed in one piece"""
+    if left == right:
+        return left
+    numeric = pd.api.types.is_numeric_dtype
+    if numeric(left) and numeric(right) and not (pd.api.types.is_bool_dtype(left) or pd.api.types.is_bool_dtype(right)):
+        return np.result_type(left, right)
+    return np.dtype(object)
+
+def observed_counts(series):
+    """Value counts of the non-null values, with a plain (non-categorical) index"""
+    counts = series.value_counts()
+    counts = counts[counts > 0]
+    if isinstance(counts.index, pd.CategoricalIndex):
+        counts.index = counts.index.astype(counts.index.categories.dtype)
+    return counts
+
+def median_from_counts(counts):
+    """Exact median from a value -> count Series"""
+    if counts.empty:
+        return np.nan
+    counts = counts.sort_index()
+    cumulative = counts.cumsum().to_numpy()
+    total = cumulative[-1]
+    lower = counts.index[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = counts.index[np.searchsorted(cumulative, total // 2, side='right')]
+    return (lower + upper) / 2
+
+def mode_from_counts(counts):
+    """Most frequent value, smallest value on ties (matches Series.mode()[0])"""
+    return counts[counts == counts.max()].index.min()
+
+@traced()
+def clean_data_streaming(input_path, output_path, chunksize=100_000, write_csv=True,
+                         row_group_size=DEFAULT_ROW_GROUP_SIZE, schema=None, dictionary=None,
+                         quantile_error=DEFAULT_ERROR, dedup=None, validator=None):
+    """
+    Chunked equivalent of calculate_business_metrics + clean_data + apply_schema.
+    
+    Produces the same CSV/Parquet output as the in-memory path and returns the
+    metrics dictionary that save_metrics would have written. Medians come
+    from quantile sketches built during the first pass; with quantile_error
+    None they are exact, from value counts gathered in a second pass.
+    Duplicates are dropped by `dedup` (a Deduplicator; whole-row 64-bit
+    fingerprints kept in memory by default). A Validator, if given, checks
+    and quarantines rows of every chunk first.
+    """
+    logger.info(f"Streaming {input_path} in chunks of {chunksize} rows")
+    
+    schema = schema or {'categorical_cols': [], 'numerical_cols': []}
+    dictionary = dictionary or CategoryDictionary()
+    dedup = dedup or Deduplicator()
+    dtypes = {}
+    null_counts = None
+    sketches = {}
+    category_values = {col: set() for col in schema['categorical_cols']}
+    numeric_ranges = {}
+    stats = {'original_rows': 0, 'final_rows': 0, 'memory_bytes': 0, 'memory_before_bytes': 0,
+             'loss_ratio_sum': 0.0, 'loss_ratio_count': 0,
+             'has_claim_sum': 0, 'total_premium': 0.0, 'total_claims': 0.0}
+    
+    with tempfile.TemporaryDirectory(prefix='preprocess_spill_') as spill_dir:
+        spill_files = []
+        
+        # Pass 1: parse, derive metrics, drop duplicates across chunks, spill
+        for i, chunk in enumerate(load_data(input_path, schema, chunksize=chunksize)):
+            stats['original_rows'] += len(chunk)
+            if validator is not None:
+                chunk = validator.apply(chunk)
+            chunk = calculate_business_metrics(chunk, verbose=False)
+            chunk = chunk[dedup.new_rows(chunk)]
+            
+            for col, dtype in chunk.dtypes.items():
+                dtypes[col] = common_dtype(dtypes.get(col, dtype), dtype)
+            chunk_nulls = chunk.isnull().sum()
+            null_counts = chunk_nulls if null_counts is None else null_counts.add(chunk_nulls, fill_value=0)
+            if quantile_error is not None:
+                for col in chunk.select_dtypes(include=[np.number]).columns:
+                    sketches.setdefault(col, QuantileSketch(quantile_error)).update(chunk[col])
+            
+            # Global inputs for the compact schema: category values and numeric ranges
+            for col, values in category_values.items():
+                if col in chunk.columns:
+                    values.update(chunk[col].dropna().unique())
+            for col in schema['numerical_cols']:
+                if col in chunk.columns and pd.api.types.is_numeric_dtype(chunk[col]) and chunk[col].notna().any():
+                    low, high, exact = numeric_ranges.get(col, (np.inf, -np.inf, True))
+                    numeric_ranges[col] = (min(low, chunk[col].min()), max(high, chunk[col].max()),
+                                           exact and float32_exact(chunk[col]))
+            
+            spill_path = Path(spill_dir) / f'chunk_{i:06d}.pkl'
+            chunk.to_pickle(spill_path)
+            spill_files.append(spill_path)
+        
+        stats['final_rows'] = len(dedup.seen)
+        duplicates_removed = dedup.duplicates_removed
+        dedup.close()
+        if duplicates_removed > 0:
+            logger.warning(f"Removed {duplicates_removed} duplicate rows")
+        
+        # Pass 2: global medians/modes, only for the columns that need them
+        fill_values, imputation = {}, {}
+        null_cols = [] if null_counts is None else list(null_counts[null_counts > 0].index)
+        if null_cols:
+            logger.warning(f"Missing values found: {null_counts[null_counts > 0].astype(int).to_dict()}")
+            empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+            numeric_cols, categorical_cols = imputation_columns(empty)
+            count_cols = [col for col in null_cols if col not in numeric_cols or col not in sketches]
+            counts = {col: pd.Series(dtype='int64') for col in count_cols}
+            for spill_path in spill_files if count_cols else []:
+                chunk = pd.read_pickle(spill_path)
+                for col in count_cols:
+                    counts[col] = counts[col].add(observed_counts(chunk[col]), fill_value=0)
+            for col in null_cols:
+                if col in numeric_cols:
+                    if col in sketches:
+                        fill_values[col], imputation[col] = median_imputation(sketches[col], null_counts[col])
+                    else:
+                        fill_values[col] = median_from_counts(counts[col])
+                        imputation[col] = {'method': 'median', 'value': float(fill_values[col]),
+                                           'missing': int(null_counts[col])}
+                    logger.info(f"Filled missing values in {col} with median")
+                elif col in categorical_cols:
+                    fill_values[col], imputation[col] = mode_imputation(mode_from_counts(counts[col]), null_counts[col])
+                    logger.info(f"Filled missing values in {col} with mode")
+        else:
+            logger.info("No missing values found")
+        
+        # Fix the compact schema from global statistics so every chunk is cast identically
+        for col, values in category_values.items():
+            if col in fill_values:
+                values.add(fill_values[col])
+            dictionary.update(col, list(values))
+        numeric_dtypes = {}
+        for col, (low, high, exact) in numeric_ranges.items():
+            if col in fill_values:
+                low, high = min(low, fill_values[col]), max(high, fill_values[col])
+                exact = exact and float32_exact([fill_values[col]])
+            numeric_dtypes[col] = compact_numeric_dtype(dtypes[col], low, high, exact)
+        
+        # Pass 3: impute with the global statistics and append to the output
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        header_written = False
+        parquet_writer = ParquetChunkWriter(output_path, row_group_size=row_group_size)
+        for spill_path in spill_files:
+            chunk = pd.read_pickle(spill_path)
+            chunk = chunk.astype({col: dtype for col, dtype in dtypes.items() if chunk[col].dtype != dtype})
+            if fill_values:
+                chunk = chunk.fillna(fill_values)
+            
+            stats['memory_before_bytes'] += default_memory_usage(chunk)
+            if 'LossRatio' in chunk.columns:
+                stats['loss_ratio_sum'] += float(chunk['LossRatio'].sum())
+                stats['loss_ratio_count'] += int(chunk['LossRatio'].count())
+            if 'HasClaim' in chunk.columns:
+                stats['has_claim_sum'] += int(chunk['HasClaim'].sum())
+            if 'TotalPremium' in chunk.columns:
+                stats['total_premium'] += float(chunk['TotalPremium'].sum())
+            if 'TotalClaims' in chunk.columns:
+                stats['total_claims'] += float(chunk['TotalClaims'].sum())
+            
+            chunk = apply_schema(chunk, schema, dictionary, numeric_dtypes=numeric_dtypes)
+            stats['memory_bytes'] += int(chunk.memory_usage(deep=True).sum()) - categories_memory_usage(chunk)
+            
+            parquet_writer.write(chunk)
+            if write_csv:
+                chunk.to_csv(output_path, index=False, mode='a' if header_written else 'w', header=not header_written)
+            header_written = True
+        
+        empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+        empty = apply_schema(empty, schema, dictionary, numeric_dtypes=numeric_dtypes)
+        stats['memory_bytes'] += categories_memory_usage(empty)
+        parquet_writer.close(empty_frame=empty)
+        if write_csv and not header_written:
+            empty.to_csv(output_path, index=False)
+    
+    logger.info(f"Streamed {stats['final_rows']} rows to {output_path}")
+    
+    rows = stats['final_rows']
+    return {
+        'preprocessing': {
+            'original_rows': int(stats['original_rows']),
+            'rows_quarantined': int(validator.rows_quarantined) if validator is not None else 0,
+            'duplicates_removed': int(duplicates_removed),
+            'dedup_key': dedup.key,
+            'final_rows': int(rows),
+            'columns_count': int(len(dtypes)),
+            **memory_metrics(stats['memory_before_bytes'], stats['memory_bytes'])
+        },
+        'business_metrics': {
+            'overall_loss_ratio': stats['loss_ratio_sum'] / stats['loss_ratio_count'] if stats['loss_ratio_count'] else None,
+            'claim_frequency': stats['has_claim_sum'] / rows if 'HasClaim' in dtypes and rows else None,
+            'total_premium': stats['total_premium'] if 'TotalPremium' in dtypes else None,
+            'total_claims': stats['total_claims'] if 'TotalClaims' in dtypes else None
+        },
+        'imputation': imputation,
+        'validation': validator.report() if validator is not None else {}
+    }
+
+# ---------------------------------------------------------------------------
+# Partitioned mode
+# ---------------------------------------------------------------------------
+# The partitioned path runs calculate_business_metrics + clean_data on a
+# process pool. Columns are copied once into shared memory (numeric columns
+# as they are, the others as global factorize codes), so workers read and
+# write their rows without pickling frames. The work happens in three
+# rounds over the partitions, with a combine step in the parent in between:
+#   1. business metrics, row fingerprints and null counts per partition;
+#      the parent keeps the first occurrence of every fingerprint in row order
+#   2. quantile sketches (numeric) and value counts (other) of the columns
+#      with nulls, over the kept rows; the parent merges them into global
+#      medians/modes
+#   3. imputation and compaction of the kept rows into output buffers
+# Every row is written to a position fixed by its original row number, so
+# the result is identical for any number of workers or partitioning.
+
+# Columns calculate_business_metrics (re)computes; worker results are written back for these
+BUSINESS_METRIC_COLUMNS = ['LossRatio', 'HasClaim', 'VehicleAge']
+MIN_PARTITION_ROWS = 50_000
+
+_PARTITION_DATA = {}
+
+def _is_plain_numeric(dtype):
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biuf'
+
+def _init_partition_worker(specs, layout):
+    """Attach the shared columns once per worker"""
+    _PARTITION_DATA['blocks'], _PARTITION_DATA['arrays'] = SharedColumns.attach(specs)
+    _PARTITION_DATA.update(layout)
+
+def partition_rows(df, n_partitions, partition_by=None):
+    """
+    Row selections for the workers: contiguous row ranges, or whole groups
+    of `partition_by` (e.g. Province) packed largest-first into partitions.
+    """
+    n = len(df)
+    if partition_by is None:
+        bounds = np.linspace(0, n, n_partitions + 1).astype(np.int64)
+        return [slice(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+    codes, _ = pd.factorize(df[partition_by], use_na_sentinel=False)
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes)
+    groups = np.split(order, np.cumsum(sizes)[:-1])
+    bins = [[] for _ in range(min(n_partitions, len(groups)))]
+    loads = np.zeros(len(bins), dtype=np.int64)
+    for g in np.argsort(-sizes, kind='stable'):
+        target = int(np.argmin(loads))
+        bins[target].append(groups[g])
+        loads[target] += sizes[g]
+    return [np.sort(np.concatenate(rows)) for rows in bins if rows]
+
+def _null_mask(values, coded):
+    return values < 0 if coded else pd.isna(values)
+
+def _map_metrics(rows):
+    """Round 1: business metrics into the shared output columns, row fingerprints, null counts"""
+    arrays = _PARTITION_DATA['arrays']
+    inputs, coded = _PARTITION_DATA['inputs'], _PARTITION_DATA['coded']
+    frame = pd.DataFrame({col: arrays[col][rows] for col in inputs if col not in coded}, copy=False)
+    frame = calculate_business_metrics(frame, verbose=False)
+    for col in _PARTITION_DATA['derived']:
+        arrays[f'derived:{col}'][rows] = frame[col].to_numpy()
+    
+    # Fingerprints over the key columns; codes are global, so equal rows hash equally in any partition
+    columns = ((values, _null_mask(values, col in coded))
+               for values, col in ((arrays[col][rows], col) for col in _PARTITION_DATA['key']))
+    words = _PARTITION_DATA['hash_bits'] // 64
+    fingerprints = fingerprint_columns(columns, len(frame), _PARTITION_DATA['hash_bits'])
+    arrays['hash'].reshape(-1, words)[rows] = fingerprints.reshape(-1, words)
+    
+    nulls = {}
+    for col, source in _PARTITION_DATA['sources'].items():
+        count = int(_null_mask(arrays[source][rows], col in coded).sum())
+        if count:
+            nulls[col] = count
+    return nulls
+
+def _map_counts(rows, columns, quantile_error):
+    """Round 2: null counts, and quantile sketches or code bincounts, over the kept rows"""
+    arrays = _PARTITION_DATA['arrays']
+    coded = _PARTITION_DATA['coded']
+    keep = arrays['keep'][rows]
+    nulls, counts = {}, {}
+    for col in columns:
+        values = arrays[_PARTITION_DATA['sources'][col]][rows][keep]
+        missing = _null_mask(values, col in coded)
+        nulls[col] = int(missing.sum())
+        if col in coded:
+            counts[col] = np.bincount(values[~missing], minlength=coded[col])
+        else:
+            counts[col] = QuantileSketch(quantile_error).update(values[~missing])
+    return nulls, counts
+
+def _map_impute(rows, fill_values):
+    """Round 3: impute the kept rows and write them to their final positions"""
+    arrays = _PARTITION_DATA['arrays']
+    coded = _PARTITION_DATA['coded']
+    keep = arrays['keep'][rows]
+    dest = arrays['dest'][rows][keep]
+    for col, source in _PARTITION_DATA['sources'].items():
+        values = arrays[source][rows][keep]
+        if col in fill_values:
+            values = np.where(_null_mask(values, col in coded), fill_values[col], values)
+        arrays[f'out:{col}'][dest] = values
+
+@traced()
+def clean_data_parallel(df, workers=None, partition_by=None, min_partition_rows=MIN_PARTITION_ROWS,
+                        quantile_error=DEFAULT_ERROR, imputation=None, key=None, hash_bits=64):
+    """
+    Partitioned equivalent of calculate_business_metrics + clean_data.
+    
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        Raw data, as returned by load_data
+    workers : int, optional
+        Worker processes (default: all cores)
+    partition_by : str, optional
+        Column whose groups stay within one partition (default: row ranges,
+        which balance best when one group dominates)
+    min_partition_rows : int
+        Smaller inputs use fewer partitions; one partition runs in process
+    quantile_error : float, optional
+        Rank error of the median sketches; None for exact medians
+    imputation : dict, optional
+        Collects the fill value and distribution of every imputed column
+    key : list, optional
+        Columns identifying a row for duplicate removal (default: all)
+    hash_bits : int
+        Row fingerprint size for duplicate detection, 64 or 128
+    
+    Returns:
+    --------
+    pd.DataFrame
+        Equal to clean_data(calculate_business_metrics(df)), index included,
+        when medians are exact; otherwise medians are within the sketch error
+    """
+    workers = workers or os.cpu_count() or 1
+    n_partitions = min(workers, max(len(df) // max(min_partition_rows, 1), 1))
+    if n_partitions <= 1:
+        return clean_data(calculate_business_metrics(df), quantile_error, imputation, key)
+    imputation = {} if imputation is None else imputation
+    
+    logger.info(f"Cleaning data on {workers} workers...")
+    inputs = list(df.columns)
+    template = calculate_business_metrics(df.head(0).copy(), verbose=False)
+    derived = [col for col in BUSINESS_METRIC_COLUMNS if col in template.columns]
+    
+    shared = SharedColumns()
+    try:
+        # Inputs into shared memory: numeric as-is, everything else as global codes
+        coded, labels = {}, {}
+        for col in inputs:
+            series = df[col]
+            if _is_plain_numeric(series.dtype):
+                shared.add(col, series.to_numpy())
+            else:
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+                else:
+                    codes, uniques = pd.factorize(series)
+                shared.add(col, codes.astype(np.int64))
+                coded[col], labels[col] = len(uniques), uniques
+        for col in derived:
+            if not _is_plain_numeric(template[col].dtype):
+                raise TypeError(f"Business metric column {col} must be numeric, got {template[col].dtype}")
+            shared.empty(f'derived:{col}', template[col].dtype, len(df))
+        sources = {col: f'derived:{col}' if col in derived else col for col in template.columns}
+        for col in template.columns:  # sized for the worst case: no duplicates
+            shared.empty(f'out:{col}', np.int64 if col in coded else shared.arrays[sources[col]].dtype, len(df))
+        shared.empty('hash', np.uint64, len(df) * (hash_bits // 64))
+        shared.empty('keep', bool, len(df))
+        shared.empty('dest', np.int64, len(df))
+        
+        missing = [col for col in key or [] if col not in inputs]
+        if missing:
+            raise KeyError(f"Deduplication key columns not found: {missing}")
+        partitions = partition_rows(df, n_partitions, partition_by)
+        layout = {'inputs': inputs, 'coded': coded, 'derived': derived, 'sources': sources,
+                  'key': list(key) if key is not None else inputs, 'hash_bits': hash_bits}
+        with ProcessPoolExecutor(max_workers=min(workers, len(partitions)), initializer=_init_partition_worker,
+                                 initargs=(shared.specs, layout)) as pool:
+            # Round 1 + combine: first occurrence of every row, in row order
+            null_cols = set()
+            for nulls in pool.map(_map_metrics, partitions):
+                null_cols.update(nulls)
+            keep = shared.arrays['keep']
+            fingerprints = shared.arrays['hash'].reshape(len(df), -1)
+            keep[:] = first_occurrences(fingerprints if hash_bits > 64 else fingerprints[:, 0])
+            shared.arrays['dest'][:] = np.cumsum(keep) - 1
+            final_rows = int(keep.sum())
+            duplicates_removed = len(df) - final_rows
+            if duplicates_removed > 0:
+                logger.warning(f"Removed {duplicates_removed} duplicate rows")
+            
+            # Round 2 + combine: exact global medians/modes of the kept rows
+            null_cols = [col for col in template.columns if col in null_cols]
+            null_counts, counts = {}, {}
+            for nulls, partial in pool.map(_map_counts, partitions, [null_cols] * len(partitions),
+                                           [quantile_error] * len(partitions)):
+                for col in null_cols:
+                    null_counts[col] = null_counts.get(col, 0) + nulls[col]
+                    counts[col] = partial[col] if col not in counts else (
+                        counts[col] + partial[col] if col in coded else counts[col].merge(partial[col]))
+            null_counts = {col: count for col, count in null_counts.items() if count > 0}
+            
+            fill_values = {}
+            if null_counts:
+                logger.warning(f"Missing values found: {null_counts}")
+                numeric_cols, categorical_cols = imputation_columns(template)
+                for col in null_counts:
+                    if col in coded:
+                        if col not in categorical_cols:
+                            continue
+                        value_counts = pd.Series(counts[col], index=pd.Index(labels[col]))
+                        mode, imputation[col] = mode_imputation(mode_from_counts(value_counts[value_counts > 0]),
+                                                                null_counts[col])
+                        fill_values[col] = labels[col].get_loc(mode)
+                        logger.info(f"Filled missing values in {col} with mode")
+                    elif col in numeric_cols:
+                        fill_values[col], imputation[col] = median_imputation(counts[col], null_counts[col])
+                        logger.info(f"Filled missing values in {col} with median")
+            else:
+                logger.info("No missing values found")
+            
+            # Round 3: impute and compact into the output columns
+            list(pool.map(_map_impute, partitions, [fill_values] * len(partitions)))
+        
+        # Reassemble: decode the coded columns, copy everything out of shared memory
+        data = {}
+        for col in template.columns:
+            values = shared.arrays[f'out:{col}'][:final_rows]
+            if isinstance(template[col].dtype, pd.CategoricalDtype):
+                data[col] = pd.Categorical.from_codes(values, dtype=template[col].dtype)
+            elif col in coded:
+                data[col] = labels[col].array.take(values, allow_fill=True)
+            else:
+                data[col] = values.copy()
+        result = pd.DataFrame(data, index=df.index[shared.arrays['keep']])
+    finally:
+        shared.release()
+    return result
+
+def main(chunksize=None, workers=None):
     """Main preprocessing function"""
     logger.info("Starting data preprocessing pipeline...")
     
     # Load configuration
     config = load_config()
     logger.info(f"Loaded configuration from config/params.yaml")
+    preprocess_config = config.get('preprocess', {})
+    if chunksize is None:
+        chunksize = preprocess_config.get('chunksize')
+    if workers is None:
+        workers = preprocess_config.get('workers', 1)
+    write_csv = preprocess_config.get('write_csv', True)
+    row_group_size = preprocess_config.get('row_group_size', DEFAULT_ROW_GROUP_SIZE)
+    quantile_error = preprocess_config.get('quantile_error', DEFAULT_ERROR)
+    dedup_config = preprocess_config.get('dedup', {}) or {}
+    schema = load_schema(config)
     
     # Load data
     input_path = "data/raw/insurance_data.csv"
     output_path = "data/processed/cleaned_data.csv"
     metrics_path = "reports/metrics/preprocess_metrics.json"
+    dictionary = CategoryDictionary.load(categories_path(output_path))
+    validator = Validator.from_config(config)
+    
+    if chunksize:
+        metrics = clean_data_streaming(input_path, output_path, chunksize=chunksize,
+                                       write_csv=write_csv, row_group_size=row_group_size,
+                                       schema=schema, dictionary=dictionary,
+                                       quantile_error=quantile_error,
+                                       dedup=Deduplicator.from_config(config), validator=validator)
+        dictionary.save(categories_path(output_path))
+        write_metrics(metrics, metrics_path)
+        logger.info("Preprocessing pipeline completed successfully!")
+        return metrics
     
     logger.info(f"Loading data from {input_path}")
     try:
-        df = pd.read_csv(input_path)
+        df = load_data(input_path, schema)
         logger.info(f"Successfully loaded {len(df)} rows, {len(df.columns)} columns")
     except FileNotFoundError:
         logger.error(f"File not found: {input_path}")
         raise
     
+    # Validate: quarantine rows that fail the configured rules
+    original_rows = len(df)
+    df = validator.apply(df)
+    report = validator.report()
+    if report['rows_quarantined']:
+        logger.warning(f"Quarantined {report['rows_quarantined']} rows to {report['quarantine_path']}")
+    
     # Process data
-    df = calculate_business_metrics(df)
-    df = clean_data(df)
+    imputation = {}
+    if workers == 1:
+        df = calculate_business_metrics(df)
+        df = clean_data(df, quantile_error, imputation, dedup_config.get('key'))
+    else:
+        df = clean_data_parallel(df, workers or None, preprocess_config.get('partition_by'),
+                                 quantile_error=quantile_error, imputation=imputation,
+                                 key=dedup_config.get('key'), hash_bits=dedup_config.get('hash_bits', 64))
     
-    # Save processed data
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(output_path, index=False)
-    logger.info(f"Processed data saved to {output_path}")
+    # Compact dtypes: stable category codes, narrowest safe numerics
+    memory_before_bytes = default_memory_usage(df)
+    df = apply_schema(df, schema, dictionary)
+    dictionary.save(categories_path(output_path))
+    
+    # Save processed data (Parquet for downstream stages, CSV for notebooks)
+    parquet_output = write_parquet(df, output_path, row_group_size=row_group_size)
+    logger.info(f"Processed data saved to {parquet_output}")
+    if write_csv:
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(output_path, index=False)
+        logger.info(f"Processed data saved to {output_path}")
     
     # Save metrics
-    metrics = save_metrics(df, metrics_path)
+    metrics = save_metrics(df, metrics_path, memory_before_bytes=memory_before_bytes, imputation=imputation,
+                           original_rows=original_rows, dedup_key=dedup_config.get('key'), validation=report)
     
     logger.info("Preprocessing pipeline completed successfully!")
     return df
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ACIS data preprocessing")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Stream the raw CSV in chunks of this many rows (overrides preprocess.chunksize)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes for cleaning in memory, 0 = all cores (overrides preprocess.workers)")
+    args = parser.parse_args()
+    main(chunksize=args.chunksize, workers=args.workers)
@@ -0,0 +1,153 @@
+# src/data/schema.py
+"""
+Compact dtype schema for the processed dataset.
+
+Columns listed under preprocessing.categorical_cols are held as pandas
+categoricals whose category order (and therefore code) is fixed by a
+dictionary persisted next to the data (cleaned_data.categories.json). New
+values are appended, so a code never changes meaning between runs.
+Columns listed under preprocessing.numerical_cols are downcast to the
+narrowest integer type that holds their range, and floats to float32 only
+when that is lossless.
+Version: 1.0
+"""
+import json
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+def load_schema(config):
+    """Declared categorical/numerical columns from the params.yaml config"""
+    preprocessing = config.get('preprocessing', {}) or {}
+    return {
+        'categorical_cols': list(preprocessing.get('categorical_cols', []) or []),
+        'numerical_cols': list(preprocessing.get('numerical_cols', []) or []),
+    }
+
+def categories_path(data_path):
+    """Category dictionary stored alongside a processed data file"""
+    return Path(data_path).with_suffix('.categories.json')
+
+class CategoryDictionary:
+    """Append-only value -> code mapping per categorical column"""
+
+    def __init__(self, categories=None):
+        self.categories = {col: list(values) for col, values in (categories or {}).items()}
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.categories, f, indent=2, default=_json_scalar)
+        return path
+
+    def update(self, col, values):
+        """Append unseen values (sorted, for determinism) to the column's dictionary"""
+        known = self.categories.setdefault(col, [])
+        seen = set(known)
+        new_values = sorted({_python_scalar(v) for v in pd.unique(pd.Series(values).dropna())} - seen)
+        known.extend(new_values)
+        return known
+
+    def dtype(self, col):
+        return pd.CategoricalDtype(categories=self.categories.get(col, []), ordered=False)
+
+def _python_scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+def _json_scalar(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def narrowest_integer(min_value, max_value):
+    """Smallest signed integer dtype holding [min_value, max_value]"""
+    for int_type in INTEGER_TYPES:
+        info = np.iinfo(int_type)
+        if info.min <= min_value and max_value <= info.max:
+            return np.dtype(int_type)
+    return np.dtype(np.int64)
+
+def float32_exact(values):
+    """True if every value survives a float64 -> float32 -> float64 roundtrip"""
+    values = np.asarray(values, dtype='float64')
+    with np.errstate(over='ignore'):
+        return bool(np.array_equal(values.astype('float32').astype('float64'), values, equal_nan=True))
+
+def compact_numeric_dtype(dtype, min_value, max_value, exact_in_float32):
+    """Target dtype for a numeric column given its global range"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return np.dtype(dtype)
+    if pd.api.types.is_integer_dtype(dtype):
+        if pd.isna(min_value):
+            return np.dtype(dtype)
+        return narrowest_integer(min_value, max_value)
+    if pd.api.types.is_float_dtype(dtype):
+        return np.dtype('float32') if exact_in_float32 else np.dtype('float64')
+    return np.dtype(dtype)
+
+def numeric_targets(df, numerical_cols):
+    """Compact dtypes for the declared numeric columns of an in-memory frame"""
+    targets = {}
+    for col in numerical_cols:
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        targets[col] = compact_numeric_dtype(df[col].dtype, df[col].min(), df[col].max(),
+                                             float32_exact(df[col]) if pd.api.types.is_float_dtype(df[col]) else False)
+    return targets
+
+def apply_schema(df, schema, dictionary, numeric_dtypes=None):
+    """
+    Cast declared columns to their compact dtypes.
+
+    Categorical columns take the (extended) persisted dictionary; numeric
+    columns take numeric_dtypes when given (e.g. precomputed over a whole
+    stream), otherwise the narrowest safe type for this frame.
+    """
+    for col in schema['categorical_cols']:
+        if col in df.columns:
+            dictionary.update(col, df[col])
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.set_categories(dictionary.categories[col])
+            else:
+                df[col] = df[col].astype(dictionary.dtype(col))
+    if numeric_dtypes is None:
+        numeric_dtypes = numeric_targets(df, schema['numerical_cols'])
+    casts = {col: dtype for col, dtype in numeric_dtypes.items() if col in df.columns and df[col].dtype != dtype}
+    return df.astype(casts) if casts else df
+
+def default_memory_usage(df):
+    """
+    Bytes the frame would occupy with read_csv's default dtypes.
+
+    Categorical columns are costed as object columns of Python strings and
+    numeric columns as 64-bit, so the before/after reduction can be reported
+    without materialising the uncompressed frame.
+    """
+    total = int(df.index.memory_usage())
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            counts = series.value_counts(sort=False)
+            item_sizes = np.array([sys.getsizeof(value) for value in counts.index], dtype=np.int64)
+            total += 8 * len(series) + int((counts.to_numpy() * item_sizes).sum())
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            total += 8 * len(series)
+        else:
+            total += int(series.memory_usage(index=False, deep=True))
+    return total
+
+def categories_memory_usage(df):
+    """Bytes held by the category arrays (shared by every chunk cast to the same dtype)"""
+    return int(sum(df[col].cat.categories.memory_usage(deep=True)
+                   for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)))
@@ -0,0 +1,173 @@
+# src/data/synthetic.py
+"""
+Synthetic insurance portfolios in the raw data layout, at any size.
+
+Every column is drawn with whole-array numpy operations, so a million rows
+take under a second and large portfolios are written chunk by chunk
+in bounded memory. The portfolio follows the shape of the real data:
+provinces and vehicle types with their own claim frequency and severity,
+postal codes concentrated within each province (a few dense urban codes,
+a long tail of rural ones), premiums driven by cover and engine size, and
+heavy-tailed claim amounts (lognormal body, Pareto large-loss tail). A
+small share of missing values and duplicated rows exercises cleaning.
+A portfolio is fully determined by its seed and chunk size.
+Version: 1.0
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from src.data.storage import ParquetChunkWriter
+
+RAW_COLUMNS = ['PolicyID', 'UnderwrittenCoverID', 'PolicyStartDate', 'Province', 'VehicleType', 'Gender',
+               'Age', 'VehicleAge', 'CubicCapacity', 'PostalCode', 'PreviousClaims', 'TotalPremium',
+               'TotalClaims', 'LossRatio', 'HasClaim']
+
+# Share of policies, claim frequency factor, postal code range and number of distinct codes
+PROVINCES = {
+    'Western Cape': (0.31, 0.9, (6500, 8299), 900),
+    'Gauteng':      (0.25, 1.3, (1, 2199), 1200),
+    'Free State':   (0.15, 0.7, (9300, 9999), 300),
+    'KZN':          (0.15, 1.1, (2900, 4730), 800),
+    'Eastern Cape': (0.14, 1.0, (4731, 6499), 600),
+}
+# Share of policies and claim severity factor
+VEHICLE_TYPES = {
+    'Sedan': (0.35, 1.0), 'SUV': (0.25, 1.4), 'Bakkie': (0.20, 1.2), 'Hatchback': (0.15, 0.8), 'Coupe': (0.05, 1.6),
+}
+GENDERS = {'Male': 0.55, 'Female': 0.45}
+# Cover and its base premium
+COVERS = {'COMP+': 12000, 'COMP': 10000, 'TPFT': 7000, 'TPO': 5000}
+CUBIC_CAPACITIES = [1000, 1200, 1400, 1600, 1800, 2000, 2500, 3000, 3500]
+
+BASE_FREQUENCY = 0.25
+SEVERITY_MEDIAN = 4000.0
+SEVERITY_SIGMA = 1.0
+LARGE_LOSS_SHARE = 0.02
+LARGE_LOSS_ALPHA = 1.5
+START_DATE = np.datetime64('2020-01-01')
+POLICY_DAYS = 3 * 365
+FIRST_POLICY_ID = 100001
+CHUNK_ROWS = 1_000_000
+
+def _postal_code_table(seed):
+    """Postal codes per province with Zipf weights, as one cumulative table offset by province index"""
+    rng = np.random.default_rng([seed, 0])
+    codes, cumulative = [], []
+    for i, (_, _, (low, high), n_codes) in enumerate(PROVINCES.values()):
+        province_codes = rng.choice(np.arange(low, high + 1), size=min(n_codes, high - low + 1), replace=False)
+        weights = 1.0 / np.arange(1, len(province_codes) + 1) ** 1.1
+        codes.append(province_codes)
+        cumulative.append(i + np.cumsum(weights) / weights.sum())
+    cumulative = np.concatenate(cumulative)
+    cumulative[np.cumsum([len(c) for c in codes]) - 1] = np.arange(1, len(codes) + 1)  # exact province ends
+    return np.concatenate(codes), cumulative
+
+def _choice(rng, options, n):
+    """Category codes drawn with the weights of an {option: weight} mapping"""
+    weights = np.array([value[0] if isinstance(value, tuple) else value for value in options.values()], dtype=float)
+    return rng.choice(len(weights), size=n, p=weights / weights.sum())
+
+def generate_portfolio(n_rows, seed=42, start_row=0, missing_rate=0.01, duplicate_rate=0.001):
+    """
+    Generate n_rows policies in the raw insurance_data.csv layout.
+
+    Parameters:
+    -----------
+    n_rows : int
+        Number of rows
+    seed : int
+        Portfolio seed
+    start_row : int
+        Position of the first row in the portfolio; rows are drawn from a
+        generator keyed by (seed, start_row), so a chunked portfolio is
+        reproducible
+    missing_rate : float
+        Share of missing values in Gender, VehicleType, Age and CubicCapacity
+    duplicate_rate : float
+        Share of rows replaced by a copy of another row of the same chunk
+
+    Returns:
+    --------
+    DataFrame
+    """
+    rng = np.random.default_rng([seed, 1, start_row])
+    province_names = list(PROVINCES)
+    vehicle_names = list(VEHICLE_TYPES)
+    covers = list(COVERS)
+
+    province = _choice(rng, PROVINCES, n_rows)
+    vehicle = _choice(rng, VEHICLE_TYPES, n_rows)
+    gender = _choice(rng, GENDERS, n_rows)
+    cover = rng.integers(len(covers), size=n_rows)
+    codes, cumulative = _postal_code_table(seed)
+    postal_code = codes[np.minimum(np.searchsorted(cumulative, province + rng.random(n_rows)), len(codes) - 1)]
+
+    age = rng.integers(18, 75, size=n_rows)
+    vehicle_age = rng.integers(0, 25, size=n_rows)
+    cubic_capacity = np.asarray(CUBIC_CAPACITIES)[rng.integers(len(CUBIC_CAPACITIES), size=n_rows)]
+    previous_claims = np.minimum(rng.poisson(0.8, size=n_rows), 3)
+    start_day = rng.integers(POLICY_DAYS, size=n_rows)
+
+    base_premium = np.asarray(list(COVERS.values()), dtype=float)[cover]
+    premium = base_premium * (cubic_capacity / 2000.0) ** 0.5 * rng.lognormal(0.0, 0.25, size=n_rows)
+    premium = np.maximum(np.round(premium), 500).astype(np.int64)
+
+    # Claims: frequency by province, age and claim history; heavy-tailed severity by vehicle type
+    province_frequency = np.array([value[1] for value in PROVINCES.values()])[province]
+    young_driver = np.where(age < 25, 1.5, 1.0)
+    frequency = np.minimum(BASE_FREQUENCY * province_frequency * young_driver * (1 + 0.3 * previous_claims), 0.95)
+    has_claim = rng.random(n_rows) < frequency
+    severity = SEVERITY_MEDIAN * rng.lognormal(0.0, SEVERITY_SIGMA, size=n_rows)
+    large = rng.random(n_rows) < LARGE_LOSS_SHARE
+    severity[large] = SEVERITY_MEDIAN * 5 * (1 + rng.pareto(LARGE_LOSS_ALPHA, size=int(large.sum())))
+    severity *= np.array([value[1] for value in VEHICLE_TYPES.values()])[vehicle]
+    claims = np.where(has_claim, np.round(severity), 0).astype(np.int64)
+
+    df = pd.DataFrame({
+        'PolicyID': np.arange(FIRST_POLICY_ID + start_row, FIRST_POLICY_ID + start_row + n_rows),
+        'UnderwrittenCoverID': pd.Categorical.from_codes(cover, covers),
+        'PolicyStartDate': pd.Categorical.from_codes(start_day, np.datetime_as_string(
+            START_DATE + np.arange(POLICY_DAYS).astype('timedelta64[D]'), unit='D')),
+        'Province': pd.Categorical.from_codes(province, province_names),
+        'VehicleType': pd.Categorical.from_codes(vehicle, vehicle_names),
+        'Gender': pd.Categorical.from_codes(gender, list(GENDERS)),
+        'Age': age,
+        'VehicleAge': vehicle_age,
+        'CubicCapacity': cubic_capacity,
+        'PostalCode': postal_code,
+        'PreviousClaims': previous_claims,
+        'TotalPremium': premium,
+        'TotalClaims': claims,
+        'LossRatio': claims / premium,
+        'HasClaim': has_claim.astype(np.int64),
+    })
+
+    if missing_rate:
+        for col in ['Gender', 'VehicleType', 'Age', 'CubicCapacity']:
+            values = df[col] if col in ('Gender', 'VehicleType') else df[col].astype(np.float64)
+            df[col] = values.where(rng.random(n_rows) >= missing_rate)  # float even without misses: one schema for all chunks
+    if duplicate_rate and n_rows > 1:
+        rows = np.arange(n_rows)
+        copies = np.flatnonzero(rng.random(n_rows) < duplicate_rate)
+        rows[copies] = rng.integers(n_rows, size=len(copies))
+        df = df.take(rows).reset_index(drop=True)
+    return df
+
+def iter_portfolio(n_rows, seed=42, chunk_rows=CHUNK_ROWS, **kwargs):
+    """The portfolio of n_rows rows as DataFrame chunks of at most chunk_rows rows"""
+    for start in range(0, n_rows, chunk_rows):
+        yield generate_portfolio(min(chunk_rows, n_rows - start), seed, start_row=start, **kwargs)
+
+def write_portfolio(path, n_rows, seed=42, chunk_rows=CHUNK_ROWS, **kwargs):
+    """Write a portfolio to .parquet (chunk by chunk) or .csv; returns the path"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.parquet':
+        with ParquetChunkWriter(path) as writer:
+            for chunk in iter_portfolio(n_rows, seed, chunk_rows, **kwargs):
+                writer.write(chunk)
+        return path
+    for i, chunk in enumerate(iter_portfolio(n_rows, seed, chunk_rows, **kwargs)):
+        chunk.to_csv(path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+    return path
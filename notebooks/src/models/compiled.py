@@ -0,0 +1,331 @@
+# src/models/compiled.py
+"""
+Compiled tree-ensemble inference for the claim-severity model.
+
+compile_model() flattens a fitted tree ensemble -- RandomForestRegressor,
+ExtraTreesRegressor, GradientBoostingRegressor or a DecisionTreeRegressor,
+bare or inside a ClaimModel -- into node arrays shared by all trees
+(feature, threshold, children = left/right pairs, value, and the training
+sample cover used by src/models/explain.py), with every leaf pointing to
+itself. CompiledForest evaluates a batch by moving all (tree, row) pairs
+one level down per step, for as many steps as the deepest tree: a few
+numpy gathers per level, no Python work per row or per tree. A single
+policy dict skips the DataFrame and sparse encoding and is encoded straight
+into one dense row. Inputs are compared as float32 and tree outputs summed
+in tree order, as sklearn does, so predictions equal the original model's
+(up to summation order when the original predicts with n_jobs > 1).
+
+save() writes the arrays as .npy files next to a JSON header (encoder,
+aggregation) in one directory; load() memory-maps them, so a quote server
+worker starts without unpickling sklearn objects and all workers share
+the same pages.
+
+Usage:
+    python -m src.models.compiled models/random_forest.joblib [--output DIR] [--check-rows N]
+Version: 1.0
+"""
+import argparse
+import json
+import logging
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy import sparse
+
+from src.models.design import DesignEncoder
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+NODE_ARRAYS = ['feature', 'threshold', 'children', 'value', 'cover', 'missing_left', 'roots']
+HEADER = 'model.json'
+BLOCK_ROWS = 1024  # rows per evaluation block: keeps the (trees x rows) work arrays in cache
+DATA_PATH = 'data/processed/cleaned_data.csv'
+
+def _trees(estimator):
+    """(trees, aggregation, scale, base) of a supported sklearn tree model"""
+    name = type(estimator).__name__
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor'):
+        return [tree.tree_ for tree in estimator.estimators_], 'mean', 1.0, 0.0
+    if name in ('DecisionTreeRegressor', 'ExtraTreeRegressor'):
+        return [estimator.tree_], 'mean', 1.0, 0.0
+    if name == 'GradientBoostingRegressor':
+        init = estimator.init_
+        if isinstance(init, str):  # init='zero'
+            base = 0.0
+        elif hasattr(init, 'constant_'):
+            base = float(np.ravel(init.constant_)[0])
+        else:
+            raise ValueError("GradientBoostingRegressor with an estimator as init cannot be compiled")
+        return [tree.tree_ for tree in estimator.estimators_[:, 0]], 'sum', float(estimator.learning_rate), base
+    raise ValueError(f"Cannot compile {name}: supported are random forest, extra trees, gradient boosting "
+                     f"and decision tree regressors")
+
+def compile_model(model):
+    """
+    Flatten a fitted tree ensemble into a CompiledForest.
+
+    Parameters:
+    -----------
+    model : ClaimModel or sklearn tree model
+        A ClaimModel keeps its encoder and model version; a bare estimator
+        is fed its feature_names_in_ columns as they are
+
+    Returns:
+    --------
+    CompiledForest
+    """
+    encoder = getattr(model, 'encoder', None)
+    estimator = model.estimator if encoder is not None else model
+    trees, aggregation, scale, base = _trees(estimator)
+    if getattr(estimator, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output regressors can be compiled")
+
+    sizes = np.array([tree.node_count for tree in trees])
+    # Node indices are intp, so that evaluation gathers with them directly
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    feature, threshold, children, value, cover, missing_left = [], [], [], [], [], []
+    for root, tree in zip(roots, trees):
+        nodes = np.arange(tree.node_count, dtype=np.intp) + root
+        leaf = tree.children_left < 0
+        feature.append(np.where(leaf, 0, tree.feature).astype(np.intp))
+        threshold.append(np.where(leaf, np.inf, tree.threshold))
+        children.append(np.column_stack([np.where(leaf, nodes, tree.children_left + root),
+                                         np.where(leaf, nodes, tree.children_right + root)]).astype(np.intp))
+        value.append(tree.value.reshape(tree.node_count, -1)[:, 0])
+        cover.append(tree.weighted_n_node_samples)
+        missing = getattr(tree, 'missing_go_to_left', None)  # sklearn >= 1.3
+        missing_left.append(np.zeros(tree.node_count, dtype=bool) if missing is None else missing.astype(bool))
+
+    arrays = {
+        'feature': np.concatenate(feature), 'threshold': np.concatenate(threshold).astype(np.float64),
+        'children': np.concatenate(children),
+        'value': np.concatenate(value).astype(np.float64), 'cover': np.concatenate(cover).astype(np.float64),
+        'missing_left': np.concatenate(missing_left),
+        'roots': roots,
+    }
+    meta = {
+        'estimator': type(estimator).__name__,
+        'n_trees': len(trees),
+        'n_nodes': int(sizes.sum()),
+        'depth': int(max(tree.max_depth for tree in trees)),
+        'n_features': int(estimator.n_features_in_),
+        'aggregation': aggregation,
+        'scale': scale,
+        'base': base,
+        'encoder': encoder_spec(encoder) if encoder is not None else None,
+        'features': list(getattr(estimator, 'feature_names_in_', [])) if encoder is None else encoder.features,
+        'model_version': getattr(model, 'model_version', None) or joblib.hash(arrays),
+    }
+    return CompiledForest(arrays, meta)
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+def encoder_spec(encoder):
+    """JSON-serializable state of a fitted DesignEncoder"""
+    return {
+        'numerical': encoder.numerical,
+        'categorical': encoder.categorical,
+        'medians': {col: float(value) for col, value in encoder.medians.items()},
+        'categories': {col: [_plain(value) for value in values] for col, values in encoder.categories.items()},
+    }
+
+def encoder_from_spec(spec):
+    encoder = DesignEncoder(spec['numerical'], spec['categorical'])
+    encoder.medians = dict(spec['medians'])
+    encoder.categories = {col: list(values) for col, values in spec['categories'].items()}
+    return encoder
+
+class CompiledForest:
+    """Flat-array tree ensemble with predict(DataFrame or dict), like the model it was compiled from"""
+
+    def __init__(self, arrays, meta):
+        self.meta = dict(meta)
+        for name in NODE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_trees = meta['n_trees']
+        self.depth = meta['depth']
+        self.aggregation = meta['aggregation']
+        self.scale = meta['scale']
+        self.base = meta['base']
+        self.model_version = meta['model_version']
+        self.encoder = encoder_from_spec(meta['encoder']) if meta.get('encoder') else None
+        self._has_missing_left = bool(self.missing_left.any())
+
+        # Single-row encoding: feature -> column of the dense row
+        if self.encoder is not None:
+            self._numerical = [(col, j, self.encoder.medians[col]) for j, col in enumerate(self.encoder.numerical)]
+            self._categorical, offset = [], len(self.encoder.numerical)
+            for col in self.encoder.categorical:
+                values = self.encoder.categories[col]
+                self._categorical.append((col, {value: offset + i for i, value in enumerate(values)}))
+                offset += len(values)
+
+    @property
+    def features(self):
+        return self.encoder.features if self.encoder is not None else self.meta['features']
+
+    def save(self, path):
+        """Write the node arrays and header into directory path"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(path / f'{name}.npy', np.ascontiguousarray(getattr(self, name)))
+        with open(path / HEADER, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Compiled model from a directory written by save(); arrays are memory-mapped read-only"""
+        path = Path(path)
+        with open(path / HEADER, 'r') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r' if mmap else None).view(np.ndarray)
+                  for name in NODE_ARRAYS}
+        return cls(arrays, meta)
+
+    def _dense(self, X):
+        """float32 design rows of a DataFrame (encoded, or its feature columns), a sparse matrix or an array"""
+        if isinstance(X, pd.DataFrame):
+            if self.encoder is not None:
+                return self.encoder.transform(X).toarray().astype(np.float32)
+            X = X[self.meta['features']] if self.meta['features'] else X
+            return X.to_numpy(dtype=np.float32, na_value=np.nan)
+        if sparse.issparse(X):
+            return X.toarray().astype(np.float32)
+        return np.asarray(X, dtype=np.float32)
+
+    def _encode_row(self, policy):
+        """One policy dict as a dense float32 row, without building a DataFrame"""
+        if self.encoder is None:
+            return np.array([np.nan if policy.get(col) is None else policy[col] for col in self.meta['features']],
+                            dtype=np.float32)
+        row = np.zeros(self.encoder.n_columns, dtype=np.float32)
+        for col, j, median in self._numerical:
+            try:
+                value = float(policy.get(col))
+            except (TypeError, ValueError):
+                value = np.nan
+            row[j] = median if value != value else value
+        for col, columns in self._categorical:
+            j = columns.get(policy.get(col))
+            if j is not None:
+                row[j] = 1.0
+        return row
+
+    @property
+    def left(self):
+        return self.children[:, 0]
+
+    @property
+    def right(self):
+        return self.children[:, 1]
+
+    def _descend(self, X, node, offsets):
+        """Move nodes down to their leaves; offsets locate each node's row in X.ravel()"""
+        flat = X.ravel()
+        children = self.children.ravel()
+        missing = self._has_missing_left and bool(np.isnan(X).any())
+        for _ in range(self.depth):
+            x = flat.take(offsets + self.feature.take(node))
+            go_right = ~(x <= self.threshold.take(node))
+            if missing:
+                go_right &= ~(np.isnan(x) & self.missing_left.take(node))
+            node = children.take(2 * node + go_right)
+        return node
+
+    def _leaves(self, X):
+        """Leaf of every (tree, row) pair: shape (n_trees, n_rows)"""
+        node = np.repeat(self.roots[:, None], len(X), axis=1)
+        return self._descend(X, node, np.arange(len(X), dtype=np.intp) * X.shape[1])
+
+    def _aggregate(self, values):
+        """Tree outputs (n_trees, n_rows) -> predictions, summed tree by tree as sklearn does"""
+        if self.aggregation == 'mean':
+            return np.add.reduce(values, axis=0) / self.n_trees
+        out = np.full(values.shape[1], self.base)
+        for tree_values in values:
+            out += self.scale * tree_values
+        return out
+
+    def predict(self, X):
+        """Predictions for a DataFrame, a policy dict (fast path) or an array of encoded rows"""
+        if isinstance(X, dict):
+            return np.array([self.predict_row(self._encode_row(X))])
+        X = self._dense(X)
+        if len(X) == 1:
+            return np.array([self.predict_row(X[0])])
+        out = np.empty(len(X))
+        for start in range(0, len(X), BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            out[start:start + len(block)] = self._aggregate(self.value[self._leaves(block)])
+        return out
+
+    def predict_row(self, x):
+        """Prediction for one encoded float32 row"""
+        node = self._descend(x[None, :], self.roots, 0)
+        if self.aggregation == 'mean':
+            total = 0.0
+            for value in self.value[node].tolist():
+                total += value
+            return total / self.n_trees
+        total = self.base
+        for value in self.value[node].tolist():
+            total += self.scale * value
+        return total
+
+def load_model(path):
+    """Claim model from a compiled model directory or a joblib file"""
+    path = Path(path)
+    if (path / HEADER).exists():
+        return CompiledForest.load(path)
+    return joblib.load(path)
+
+def compare_predictions(model, compiled, X):
+    """Largest absolute and relative difference between the original and compiled predictions"""
+    expected = np.asarray(model.predict(X), dtype=np.float64)
+    actual = compiled.predict(X)
+    diff = np.abs(actual - expected)
+    return {
+        'rows': len(expected),
+        'exact_rows': int((diff == 0).sum()),
+        'max_abs_diff': float(diff.max()) if len(diff) else 0.0,
+        'max_rel_diff': float((diff / np.maximum(np.abs(expected), 1e-300)).max()) if len(diff) else 0.0,
+    }
+
+def main(model_path, output=None, check_rows=1000, rtol=1e-9):
+    """Compile a trained model, check it against the original on processed rows, and save it"""
+    output = Path(output) if output else Path(model_path).with_suffix('.compiled')
+    model = joblib.load(model_path)
+    start = time.perf_counter()
+    compiled = compile_model(model)
+    logger.info(f"Compiled {compiled.meta['estimator']} from {model_path}: {compiled.n_trees} trees, "
+                f"{compiled.meta['n_nodes']} nodes, depth {compiled.depth} ({time.perf_counter() - start:.2f}s)")
+
+    if check_rows:
+        from src.data.storage import load_processed
+        sample = load_processed(DATA_PATH, columns=compiled.features).head(check_rows)
+        check = compare_predictions(model, compiled, sample)
+        logger.info(f"Check on {check['rows']} rows: {check['exact_rows']} identical, "
+                    f"max abs diff {check['max_abs_diff']:.3g}, max rel diff {check['max_rel_diff']:.3g}")
+        if check['max_rel_diff'] > rtol:
+            raise ValueError(f"Compiled predictions differ from {model_path} by up to {check['max_rel_diff']:.3g} "
+                             f"(tolerance {rtol:g})")
+        compiled.meta['check'] = check
+
+    compiled.save(output)
+    logger.info(f"Saved {output} ({compiled.model_version})")
+    return compiled
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a tree-ensemble claim model to memory-mappable node arrays")
+    parser.add_argument('model', nargs='?', default='models/random_forest.joblib', help="Joblib model to compile")
+    parser.add_argument('--output', default=None, help="Output directory (default: <model>.compiled)")
+    parser.add_argument('--check-rows', type=int, default=1000,
+                        help="Processed rows to compare predictions on (0 skips the check)")
+    args = parser.parse_args()
+    main(args.model, args.output, args.check_rows)
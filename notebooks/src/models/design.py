@@ -0,0 +1,112 @@
+# src/models/design.py
+"""
+Sparse design matrices and the claim model that scores from them.
+
+DesignEncoder maps the model features to a CSR matrix: numerical columns
+first (missing values filled with the training median), then one one-hot
+block per categorical column. Categorical columns are encoded from their
+category codes -- the processed data's stable codes when the dtype already
+matches, otherwise via pd.Categorical -- with one entry per row and block,
+so the matrix is built straight from integer arrays instead of a dense
+dummy frame. Missing and unseen categories get no entry (all-zero block).
+
+ClaimModel bundles an encoder with a fitted estimator behind predict(X) for
+a DataFrame or a single policy dict, which is what optimize_premium, the
+quote server and PredictionCache expect of a claim model.
+Version: 1.0
+"""
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+class DesignEncoder:
+    """Feature columns -> CSR design matrix"""
+
+    def __init__(self, numerical, categorical):
+        self.numerical = list(numerical)
+        self.categorical = list(categorical)
+        self.medians = {}
+        self.categories = {}
+
+    @property
+    def features(self):
+        return self.numerical + self.categorical
+
+    @property
+    def feature_names(self):
+        return self.numerical + [f'{col}={value}' for col in self.categorical for value in self.categories[col]]
+
+    @property
+    def n_columns(self):
+        return len(self.numerical) + sum(len(values) for values in self.categories.values())
+
+    def fit(self, df):
+        for col in self.numerical:
+            median = pd.to_numeric(df[col], errors='coerce').median()
+            self.medians[col] = 0.0 if pd.isna(median) else float(median)
+        for col in self.categorical:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                self.categories[col] = list(series.cat.categories)
+            else:
+                self.categories[col] = sorted(pd.unique(series.dropna()).tolist(), key=str)
+        return self
+
+    def codes(self, series, col):
+        """Category codes of a column against the fitted categories; -1 for missing or unseen"""
+        categories = self.categories[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) and list(series.cat.categories) == categories:
+            return series.cat.codes.to_numpy()
+        return pd.Index(categories, dtype=object).get_indexer(pd.Index(series, dtype=object))
+
+    def transform(self, df):
+        """CSR matrix with one row per row of df"""
+        if isinstance(df, dict):
+            df = pd.DataFrame([df])
+        n_rows, width = len(df), len(self.numerical) + len(self.categorical)
+        indices = np.empty((n_rows, width), dtype=np.int32)
+        data = np.empty((n_rows, width), dtype=np.float64)
+
+        for j, col in enumerate(self.numerical):
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            indices[:, j] = j
+            data[:, j] = np.where(np.isnan(values), self.medians[col], values)
+
+        # One slot per row and categorical block: the category's column, or a zero to be dropped
+        offset = len(self.numerical)
+        for j, col in enumerate(self.categorical, start=len(self.numerical)):
+            codes = self.codes(df[col], col).astype(np.int64)
+            indices[:, j] = offset + np.maximum(codes, 0)
+            data[:, j] = codes >= 0
+            offset += len(self.categories[col])
+
+        matrix = sparse.csr_matrix((data.ravel(), indices.ravel(), np.arange(0, n_rows * width + 1, width)),
+                                   shape=(n_rows, self.n_columns))
+        matrix.eliminate_zeros()
+        return matrix
+
+class ClaimModel:
+    """A fitted estimator and the encoder of its features"""
+
+    def __init__(self, encoder, estimator, name=None, params=None, model_version=None):
+        self.encoder = encoder
+        self.estimator = estimator
+        self.name = name or type(estimator).__name__
+        self.params = dict(params or {})
+        self.model_version = model_version
+
+    @property
+    def features(self):
+        return self.encoder.features
+
+    def predict(self, X):
+        return self.estimator.predict(self.encoder.transform(X))
+
+def design_digest(matrix, target=None):
+    """Content hash of a design matrix (and target), for model versions"""
+    digest = hashlib.sha1()
+    for array in (matrix.data, matrix.indices, matrix.indptr) + (() if target is None else (np.asarray(target),)):
+        digest.update(np.ascontiguousarray(array).data)
+    digest.update(str(matrix.shape).encode())
+    return digest.hexdigest()
@@ -0,0 +1,531 @@
+# src/models/explain.py
+"""
+Batched, cached TreeSHAP explanations of premium recommendations.
+
+TreeExplainer computes exact path-dependent TreeSHAP values on the node
+arrays of a CompiledForest (src/models/compiled.py), vectorized over
+(rows, leaves) of all trees at once. The players are the model features,
+not the design columns: a categorical feature's one-hot block is one
+player, so Province gets one value rather than one per province. For a
+leaf reached through groups k with cover ratios z_k, a row's value for
+group k is the leaf value times (o_k - z_k) times a Shapley-weighted
+coefficient sum of prod_{j != k} (z_j + o_j t), where o_k says whether the
+row satisfies all of the leaf's splits on group k. A value depends on the
+row only through which of its leaf's features it fails, so while they fit
+in table_mb the values of every leaf for every such pattern are computed
+once, and explaining a row is one gather per leaf.
+
+explain_batch() encodes the policies once, reduces every encoded row to a
+64-bit hash and explains each distinct row once. Values already in the
+ExplanationStore for the model version are reused; the rest are computed
+in row blocks on a process pool and appended to the store.
+explain_recommendations() prices the policies with optimize_premium_batch
+and returns, per policy, the top-k features pushing its premium in the
+direction of its INCREASE/DECREASE recommendation.
+
+Usage:
+    python -m src.models.explain [--model PATH] [--top-k K] [--workers N] [--sample N]
+Version: 1.0
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+from math import factorial
+from pathlib import Path
+from scipy import sparse
+
+from src.models.compiled import CompiledForest, compile_model, load_model
+from src.models.prediction_cache import PredictionCache
+from src.models.premium_optimizer import optimize_premium_batch, resolve_rating_table
+from src.models.rating_table import RatingTableSource
+from src.utils.instrument import span, traced
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DATA_PATH = 'data/processed/cleaned_data.csv'
+TABLE_MB = 256          # largest leaf x failure-pattern table; above it values are computed per row
+DEFAULT_EXPLAIN = {
+    'model_path': 'models/random_forest.joblib',
+    'store_path': 'data/explanations',
+    'output_path': 'reports/explanations/premium_drivers.parquet',
+    'metrics_path': 'reports/metrics/explain_metrics.json',
+    'premium_column': 'TotalPremium',
+    'top_k': 3,
+    'workers': None,
+    'batch_rows': 256,
+    'table_mb': TABLE_MB,
+    'sample': None,
+}
+BLOCK_CELLS = 1 << 20   # (rows x leaves x slots) cells per vectorized step
+MAX_PATH_FEATURES = 64  # failed splits of a path are kept as bits of its features' slots
+
+_EXPLAIN_DATA = {}
+
+def _shapley_weights(size):
+    """w(s) = s! (size - 1 - s)! / size! for coalitions of s of the other size - 1 players"""
+    return np.array([factorial(s) * factorial(size - 1 - s) / factorial(size) for s in range(size)])
+
+class TreeExplainer:
+    """
+    Exact path-dependent TreeSHAP for a compiled tree ensemble.
+
+    Parameters:
+    -----------
+    model : CompiledForest, ClaimModel or sklearn tree model
+        The claim severity model (a PredictionCache is unwrapped); models
+        that are not compiled yet are compiled first
+    table_mb : float
+        Memory for the precomputed values of each leaf per pattern of failed
+        splits; 0 computes every row's values from scratch
+    """
+
+    def __init__(self, model, table_mb=TABLE_MB):
+        if isinstance(model, PredictionCache):
+            model = model.model
+        self.model = model if isinstance(model, CompiledForest) else compile_model(model)
+        self.model_version = str(self.model.model_version)
+        self.table_mb = table_mb
+        self.feature_names, self.column_group = self._groups()
+        self._prepare_paths()
+
+    def _groups(self):
+        """Feature names and the feature (group) of every design column"""
+        encoder = self.model.encoder
+        if encoder is None:
+            names = list(self.model.features) or [f'x{j}' for j in range(self.model.meta['n_features'])]
+            return names, np.arange(len(names), dtype=np.intp)
+        names = list(encoder.numerical) + list(encoder.categorical)
+        sizes = [1] * len(encoder.numerical) + [len(encoder.categories[col]) for col in encoder.categorical]
+        return names, np.repeat(np.arange(len(names), dtype=np.intp), sizes)
+
+    def _prepare_paths(self):
+        """Root-to-leaf paths of all trees as (leaves x depth) step arrays, built level by level"""
+        model = self.model
+        children, cover = model.children, model.cover
+        nodes = np.arange(len(children), dtype=np.intp)
+        internal = children[:, 0] != nodes
+        parent = np.full(len(children), -1, dtype=np.intp)
+        parent[children[internal, 0]] = nodes[internal]
+        parent[children[internal, 1]] = nodes[internal]
+
+        leaves = nodes[~internal]
+        depth = max(model.depth, 1)
+        step_node = np.zeros((len(leaves), depth), dtype=np.intp)
+        step_left = np.zeros((len(leaves), depth), dtype=bool)
+        step_group = np.full((len(leaves), depth), -1, dtype=np.intp)
+        ratio = np.ones((len(leaves), depth))
+        current = leaves
+        for s in range(depth):
+            up = parent[current]
+            valid = up >= 0
+            above = np.where(valid, up, 0)
+            step_node[:, s] = above
+            step_left[:, s] = valid & (children[above, 0] == current)
+            step_group[:, s] = np.where(valid, self.column_group[model.feature[above]], -1)
+            ratio[:, s] = np.where(valid, cover[current] / np.where(valid, cover[above], 1.0), 1.0)
+            current = np.where(valid, up, current)
+        roots = current
+
+        # Per leaf and feature: product of the cover ratios of its splits, and whether it splits on it
+        n_groups = len(self.feature_names)
+        z = np.ones((len(leaves), n_groups))
+        present = np.zeros((len(leaves), n_groups), dtype=bool)
+        for g in range(n_groups):
+            on_group = step_group == g
+            z[:, g] = np.where(on_group, ratio, 1.0).prod(axis=1)
+            present[:, g] = on_group.any(axis=1)
+
+        # Compact each path to its own features, padded with null players (z = o = 1) to a common width;
+        # all per-leaf arrays are stored slot- or step-major so that every vectorized step is contiguous
+        width = max(int(present.sum(axis=1).max()), 1) if len(leaves) else 1
+        if width > MAX_PATH_FEATURES:
+            raise ValueError(f"TreeExplainer supports up to {MAX_PATH_FEATURES} features per path, got {width}")
+        order = np.argsort(~present, axis=1, kind='stable')[:, :width]
+        local_present = np.take_along_axis(present, order, axis=1)
+        self.local_group = np.where(local_present, order, -1).T
+        self.z = np.ascontiguousarray(np.where(local_present, np.take_along_axis(z, order, axis=1), 1.0).T)
+        self.z_safe = np.where(self.z > 0, self.z, 1.0)
+        self.width = width
+
+        # Failed splits are collected as bits of the leaf's slot for their feature
+        slot_of = np.full((len(leaves), n_groups + 1), width, dtype=np.intp)
+        np.put_along_axis(slot_of, order, np.where(local_present, np.arange(width), width), axis=1)
+        step_slot = np.take_along_axis(slot_of, np.where(step_group >= 0, step_group, n_groups), axis=1)
+        self.slot_dtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                               if np.iinfo(dtype).bits >= width)
+        slot_bits = np.where(step_slot < width, np.left_shift(1, np.minimum(step_slot, 63)), 0).astype(self.slot_dtype)
+        self.step_node = np.ascontiguousarray(step_node.T)
+        self.fail_if_left = np.ascontiguousarray(np.where(step_left, 0, slot_bits).T)
+        self.fail_if_right = np.ascontiguousarray(np.where(step_left, slot_bits, 0).T)
+
+        scale = 1.0 / model.n_trees if model.aggregation == 'mean' else model.scale
+        self.leaf_value = model.value[leaves] * scale
+        self.expected_value = float((self.leaf_value * cover[leaves] / cover[roots]).sum()
+                                    + (model.base if model.aggregation == 'sum' else 0.0))
+        self.weights = _shapley_weights(width)
+
+        # (leaf, slot) -> feature, for summing slot values into features with one sparse product
+        groups = self.local_group.T.ravel()
+        slots = np.flatnonzero(groups >= 0)
+        self.scatter = sparse.csr_matrix((np.ones(len(slots)), (slots, groups[slots])),
+                                         shape=(len(groups), n_groups))
+        self._tabulate(local_present.sum(axis=1))
+
+    def _tabulate(self, path_features):
+        """
+        Slot values of every leaf for every pattern of features whose splits a
+        row fails, when they fit in table_mb; a row's values are then one
+        gather per leaf instead of the polynomial arithmetic.
+        """
+        self.table = self.leaf_offset = None
+        sizes = np.left_shift(1, np.minimum(path_features, 40)).astype(np.int64)
+        if sizes.sum() * self.width * 8 > self.table_mb * 2 ** 20:
+            return
+        self.leaf_offset = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+        self.table = np.zeros((int(sizes.sum()), self.width))
+        for n_features in np.unique(path_features):
+            leaves = np.flatnonzero(path_features == n_features)
+            patterns = np.arange(1 << int(n_features), dtype=self.slot_dtype)
+            block = max(1, BLOCK_CELLS // (len(leaves) * (self.width + 1)))
+            for start in range(0, len(patterns), block):
+                fail = np.repeat(patterns[start:start + block, None], len(leaves), axis=1)
+                rows = self.leaf_offset[leaves] + fail
+                self.table[rows] = self._slot_values(fail, leaves).transpose(1, 2, 0)
+
+    def encode(self, X):
+        """float32 design rows of a DataFrame, a policy dict or encoded rows"""
+        if isinstance(X, dict):
+            return self.model._encode_row(X)[None, :]
+        return self.model._dense(X)
+
+    def shap_values(self, X):
+        """
+        SHAP values of the model's predictions.
+
+        Parameters:
+        -----------
+        X : DataFrame, dict or array of encoded rows
+            Policies to explain
+
+        Returns:
+        --------
+        np.ndarray: (rows, features); each row sums to its prediction minus expected_value
+        """
+        X = self.encode(X)
+        out = np.zeros((len(X), len(self.feature_names)))
+        block = max(1, BLOCK_CELLS // max(len(self.leaf_value) * (self.width + 1), 1))
+        for start in range(0, len(X), block):
+            out[start:start + block] = self._block_values(X[start:start + block])
+        return out
+
+    def _block_values(self, X):
+        """SHAP values of a few rows, with all their (row, leaf) pairs at once"""
+        model = self.model
+        x = X[:, model.feature]
+        goes_left = x <= model.threshold
+        if model._has_missing_left:
+            goes_left |= np.isnan(x) & model.missing_left
+        fail = np.zeros((len(X), len(self.leaf_value)), dtype=self.slot_dtype)
+        for nodes, if_left, if_right in zip(self.step_node, self.fail_if_left, self.fail_if_right):
+            fail |= np.where(goes_left.take(nodes, axis=1), if_left, if_right)
+
+        if self.table is not None:
+            slot_values = self.table.take(self.leaf_offset + fail, axis=0)
+        else:
+            slot_values = self._slot_values(fail).transpose(1, 2, 0)
+        return np.asarray(self.scatter.T @ slot_values.reshape(len(X), -1).T).T
+
+    def _slot_values(self, fail, leaves=slice(None)):
+        """(slots, rows, leaves) values of the given leaves for bit patterns of failed slots"""
+        width, weights = self.width, self.weights
+        z, z_safe = self.z[:, leaves], self.z_safe[:, leaves]
+        o = np.empty((width,) + fail.shape)
+        for k in range(width):
+            o[k] = ((fail >> k) & 1) == 0
+
+        # Coefficients of P(t) = prod_k (z_k + o_k t), lowest power first
+        poly = np.zeros((width + 1,) + fail.shape)
+        poly[0] = 1.0
+        for k in range(width):
+            poly[1:k + 2] = poly[1:k + 2] * z[k] + poly[:k + 1] * o[k]
+            poly[0] *= z[k]
+
+        # Divide out each player's own factor and take the Shapley-weighted coefficient sum: by
+        # synthetic division when the row satisfies its splits (o_k = 1), by the constant z_k otherwise
+        unmet = np.tensordot(weights, poly[:width], axes=1)
+        values = np.empty_like(o)
+        for k in range(width):
+            zk, ok = z[k], o[k]
+            quotient = poly[width].copy()
+            met = weights[width - 1] * quotient
+            for i in range(width - 1, 0, -1):
+                quotient = poly[i] - zk * quotient
+                met += weights[i - 1] * quotient
+            values[k] = np.where(ok > 0, met, unmet / z_safe[k]) * (ok - zk)
+        return values * self.leaf_value[leaves]
+
+def feature_hashes(rows):
+    """uint64 hash of each encoded feature vector"""
+    return pd.util.hash_pandas_object(pd.DataFrame(rows), index=False).to_numpy()
+
+class ExplanationStore:
+    """
+    SHAP values persisted per model version, keyed by feature vector hash.
+
+    Each model version is a directory of Parquet parts (feature_hash plus
+    one column per feature); save() appends a part, lookup() reads them all.
+
+    Parameters:
+    -----------
+    root : str or Path
+        Store directory
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _version_dir(self, model_version):
+        return self.root / str(model_version).replace(os.sep, '_')
+
+    def load(self, model_version, feature_names):
+        """Stored values of a model version, indexed by feature hash"""
+        parts = sorted(self._version_dir(model_version).glob('part-*.parquet'))
+        if not parts:
+            return pd.DataFrame(columns=feature_names, index=pd.Index([], dtype=np.uint64, name='feature_hash'))
+        stored = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+        stored = stored.drop_duplicates('feature_hash').set_index('feature_hash')
+        return stored.reindex(columns=feature_names)
+
+    def lookup(self, model_version, hashes, feature_names):
+        """(found mask, values) for an array of feature hashes"""
+        stored = self.load(model_version, feature_names)
+        positions = stored.index.get_indexer(pd.Index(hashes, dtype=np.uint64))
+        found = positions >= 0
+        values = np.full((len(hashes), len(feature_names)), np.nan)
+        values[found] = stored.to_numpy(dtype=np.float64)[positions[found]]
+        found &= ~np.isnan(values).any(axis=1)
+        return found, values
+
+    def save(self, model_version, hashes, values, feature_names):
+        """Append values for new feature hashes as one Parquet part"""
+        if len(hashes) == 0:
+            return None
+        directory = self._version_dir(model_version)
+        directory.mkdir(parents=True, exist_ok=True)
+        part = pd.DataFrame(values, columns=feature_names)
+        part.insert(0, 'feature_hash', np.asarray(hashes, dtype=np.uint64))
+        path = directory / f'part-{time.time_ns()}-{os.getpid()}.parquet'
+        temporary = path.with_suffix('.tmp')
+        part.to_parquet(temporary, index=False)
+        os.replace(temporary, path)
+        return path
+
+def _init_explain_worker(explainer):
+    _EXPLAIN_DATA['explainer'] = explainer
+
+def _explain_block(rows):
+    return _EXPLAIN_DATA['explainer'].shap_values(rows)
+
+@traced()
+def explain_batch(X, explainer, store=None, workers=1, batch_rows=DEFAULT_EXPLAIN['batch_rows']):
+    """
+    SHAP values of many policies, each distinct feature vector computed once.
+
+    Parameters:
+    -----------
+    X : DataFrame
+        Policies with the model features
+    explainer : TreeExplainer
+        Explainer of the claim severity model
+    store : ExplanationStore, optional
+        Values of earlier runs are read from, and new values written to, the store
+    workers : int, optional
+        Worker processes for the distinct rows not in the store (default: all cores)
+    batch_rows : int
+        Distinct rows per worker task
+
+    Returns:
+    --------
+    tuple: (DataFrame of SHAP values indexed like X, dict of counts and timings)
+    """
+    start = time.perf_counter()
+    rows = explainer.encode(X)
+    hashes = feature_hashes(rows)
+    unique_hashes, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    names = explainer.feature_names
+
+    if store is not None:
+        found, values = store.lookup(explainer.model_version, unique_hashes, names)
+    else:
+        found, values = np.zeros(len(unique_hashes), dtype=bool), np.empty((len(unique_hashes), len(names)))
+    missing = np.flatnonzero(~found)
+    blocks = [rows[first[missing[i:i + batch_rows]]] for i in range(0, len(missing), batch_rows)]
+
+    workers = min(workers or os.cpu_count() or 1, len(blocks))
+    with span('tree_shap', 'explain', rows=len(missing), workers=workers):
+        if workers <= 1:
+            computed = [explainer.shap_values(block) for block in blocks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_explain_worker,
+                                     initargs=(explainer,)) as pool:
+                computed = list(pool.map(_explain_block, blocks))
+    if computed:
+        values[missing] = np.concatenate(computed)
+        if store is not None:
+            store.save(explainer.model_version, unique_hashes[missing], values[missing], names)
+
+    stats = {
+        'rows': len(rows),
+        'unique_rows': len(unique_hashes),
+        'stored_rows': int(found.sum()),
+        'computed_rows': len(missing),
+        'workers': max(workers, 1),
+        'seconds': time.perf_counter() - start,
+    }
+    index = X.index if isinstance(X, pd.DataFrame) else None
+    return pd.DataFrame(values[inverse.reshape(-1)], index=index, columns=names), stats
+
+def top_drivers(policies, results, impacts, top_k=3):
+    """
+    Long table of each policy's top-k premium drivers in the direction of its recommendation.
+
+    Parameters:
+    -----------
+    policies : DataFrame
+        Priced policies (feature values are taken from here)
+    results : dict
+        optimize_premium_batch output for the policies
+    impacts : DataFrame
+        Premium impact of each feature, one row per policy
+    top_k : int
+        Drivers per policy; fewer when fewer features push in the recommended direction
+
+    Returns:
+    --------
+    pd.DataFrame: policy, recommendation, adjustment_percentage, rank, feature, value, premium_impact
+    """
+    names = list(impacts.columns)
+    increase = np.asarray(results['recommendation']) == 'INCREASE'
+    signed = impacts.to_numpy() * np.where(increase, 1.0, -1.0)[:, None]
+    k = min(int(top_k), len(names))
+    order = np.argsort(-signed, axis=1, kind='stable')[:, :k]
+    keep = (np.take_along_axis(signed, order, axis=1) > 0).ravel()
+    rows = np.repeat(np.arange(len(signed)), k)[keep]
+    groups = order.ravel()[keep]
+
+    feature_values = policies.reindex(columns=names).astype(object).to_numpy()
+    return pd.DataFrame({
+        'policy': policies.index.to_numpy()[rows],
+        'recommendation': np.asarray(results['recommendation'])[rows],
+        'adjustment_percentage': np.asarray(results['adjustment_percentage'])[rows],
+        'rank': np.tile(np.arange(1, k + 1), len(signed))[keep],
+        'feature': np.asarray(names, dtype=object)[groups],
+        'value': feature_values[rows, groups],
+        'premium_impact': impacts.to_numpy()[rows, groups],
+    })
+
+@traced()
+def explain_recommendations(policies, claim_model, current_premiums, rating_table=None, top_k=3, explainer=None,
+                            store=None, workers=1, batch_rows=DEFAULT_EXPLAIN['batch_rows']):
+    """
+    Premium recommendations for a portfolio with the top-k drivers of each.
+
+    A feature's premium impact is its SHAP value on the predicted severity
+    times the policy's claim probability and the premium loading, so the
+    impacts of a policy add up to its optimized premium minus the premium
+    of an average severity at the same probability.
+
+    Parameters:
+    -----------
+    policies : DataFrame
+        One row per policy, as for optimize_premium_batch
+    claim_model : trained model
+        Claim severity tree model, compiled model or PredictionCache
+    current_premiums : array-like, float or str
+        Current premium per policy, a single premium, or the name of a column
+    rating_table : RatingTable or RatingTableSource, optional
+        Rating factors
+    top_k : int
+        Drivers per policy
+    explainer : TreeExplainer, optional
+        Reused explainer (default: built from claim_model)
+    store : ExplanationStore, optional
+        Cache of SHAP values across runs
+    workers : int, optional
+        Worker processes for TreeSHAP
+    batch_rows : int
+        Distinct rows per worker task
+
+    Returns:
+    --------
+    tuple: (drivers DataFrame from top_drivers, explain_batch counts and timings)
+    """
+    table = resolve_rating_table(rating_table)
+    results = optimize_premium_batch(policies, claim_model, current_premiums, table)
+    explainer = explainer or TreeExplainer(claim_model)
+    values, stats = explain_batch(policies, explainer, store, workers, batch_rows)
+    loading = np.asarray(results['estimated_probability']) * table.premium_loading
+    impacts = values.mul(loading, axis=0)
+    return top_drivers(policies, results, impacts, top_k), stats
+
+def load_config(config_path="config/params.yaml"):
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
+def main(model_path=None, top_k=None, workers=None, sample=None):
+    """Explain the recommendations for the processed portfolio and save the drivers with run metrics"""
+    from src.data.storage import available_columns, load_processed
+
+    config = load_config()
+    settings = {**DEFAULT_EXPLAIN, **(config.get('explain', {}) or {})}
+    model_path = model_path or settings['model_path']
+    top_k = top_k or settings['top_k']
+    workers = workers or settings['workers'] or os.cpu_count()
+    sample = sample or settings['sample']
+
+    explainer = TreeExplainer(load_model(model_path), settings['table_mb'])
+    pricing_columns = ['Province', 'VehicleType', 'PreviousClaims', settings['premium_column']]
+    columns = [col for col in dict.fromkeys(list(explainer.model.features) + pricing_columns)
+               if col in available_columns(DATA_PATH)]
+    policies = load_processed(DATA_PATH, columns=columns)
+    if sample:
+        policies = policies.head(int(sample))
+    rating_source = RatingTableSource(config.get('pricing', {}).get('rating_table_path'), config)
+
+    logger.info(f"Explaining {len(policies)} policies with {explainer.model_version} "
+                f"({len(explainer.leaf_value)} leaves, {len(explainer.feature_names)} features)")
+    drivers, stats = explain_recommendations(policies, explainer.model, settings['premium_column'],
+                                             rating_source, top_k, explainer,
+                                             ExplanationStore(settings['store_path']), workers,
+                                             int(settings['batch_rows']))
+    logger.info(f"{stats['unique_rows']} distinct feature vectors: {stats['stored_rows']} from the store, "
+                f"{stats['computed_rows']} computed on {stats['workers']} workers in {stats['seconds']:.2f}s")
+
+    output_path = Path(settings['output_path'])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    drivers.astype({'value': str}).to_parquet(output_path, index=False)
+    logger.info(f"Saved {len(drivers)} drivers to {output_path}")
+
+    metrics = {'model_version': explainer.model_version, 'top_k': top_k, 'policies': len(policies),
+               'drivers': len(drivers), 'expected_value': explainer.expected_value, **stats}
+    metrics_path = Path(settings['metrics_path'])
+    metrics_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(metrics_path, 'w') as f:
+        json.dump(metrics, f, indent=2)
+    return drivers
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Top-k TreeSHAP drivers of the premium recommendations")
+    parser.add_argument('--model', default=None, help="Claim severity model: joblib file or compiled model directory")
+    parser.add_argument('--top-k', type=int, default=None, help="Drivers per policy")
+    parser.add_argument('--workers', type=int, default=None, help="TreeSHAP worker processes")
+    parser.add_argument('--sample', type=int, default=None, help="Explain only the first N policies")
+    args = parser.parse_args()
+    main(args.model, args.top_k, args.workers, args.sample)
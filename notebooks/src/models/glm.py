@@ -0,0 +1,458 @@
+# src/models/glm.py
+"""
+Frequency-severity GLMs fitted out of core.
+
+GLM fits a log-link GLM of the Tweedie family -- power 1 is Poisson (claim
+frequency), power 2 is Gamma (claim severity), powers in between are
+compound Poisson-Gamma -- by iteratively reweighted least squares over
+streamed chunks. A pass reads the data one chunk at a time and keeps only
+X'WX, X'Wz and the deviance of the current coefficients
+(NormalEquations); these add up across chunks and across worker processes
+(each reads its own Parquet row groups), so memory is bounded by the chunk
+size and the number of coefficients, not by the number of rows.
+
+Categorical factors are handled by code: a factor contributes bincounts of
+its codes to the normal equations and one coefficient gather to the linear
+predictor; no dummy columns are built. The most frequent level of every
+factor is its reference level; missing and unseen levels score as the
+reference. Missing numerical values are filled with the training mean. An
+exposure column enters as a log offset, so frequencies are per unit of
+exposure.
+
+FrequencySeverityModel pairs a frequency and a severity GLM. Its predict()
+is the expected severity, so it can be used wherever a claim model is, and
+its predict_frequency() replaces the rating table's constant claim
+probability in optimize_premium. The stage that fits both is
+src/models/train_glm.py.
+Version: 1.0
+"""
+import logging
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.special import xlogy
+
+from src.data.storage import iter_processed, row_group_count
+from src.utils.instrument import span, traced
+
+logger = logging.getLogger(__name__)
+
+FAMILIES = {'poisson': 1.0, 'gamma': 2.0}
+DEFAULT_MAX_ITER = 25
+DEFAULT_TOL = 1e-8
+MAX_STEP_HALVINGS = 10
+MAX_ETA = 700.0  # exp() overflow guard
+
+def family_power(family):
+    """Tweedie variance power of a family name ('poisson', 'gamma') or power"""
+    power = FAMILIES.get(family, family) if isinstance(family, str) else family
+    power = float(power)
+    if not 1.0 <= power <= 2.0:
+        raise ValueError(f"Unsupported Tweedie power {power}: use 1 (Poisson), 2 (Gamma) or a value in between")
+    return power
+
+def unit_deviance(y, mu, power):
+    """Tweedie unit deviance of observations y at means mu"""
+    if power == 1.0:
+        return 2 * (xlogy(y, y) - xlogy(y, mu) - (y - mu))
+    if power == 2.0:
+        return 2 * ((y - mu) / mu - np.log(y / mu))
+    return 2 * (np.power(y, 2 - power) / ((1 - power) * (2 - power))
+                - y * np.power(mu, 1 - power) / (1 - power) + np.power(mu, 2 - power) / (2 - power))
+
+class NormalEquations:
+    """X'WX, X'Wz, deviance and Pearson chi-square of one IRLS pass; partial results merge by addition"""
+
+    def __init__(self, size):
+        self.xtwx = np.zeros((size, size))
+        self.xtwz = np.zeros(size)
+        self.deviance = 0.0
+        self.pearson = 0.0
+        self.rows = 0
+
+    def merge(self, other):
+        self.xtwx += other.xtwx
+        self.xtwz += other.xtwz
+        self.deviance += other.deviance
+        self.pearson += other.pearson
+        self.rows += other.rows
+        return self
+
+class DataSummary:
+    """What the first pass learns: level counts, numerical means and totals for the starting values"""
+
+    def __init__(self):
+        self.rows = 0
+        self.skipped_rows = 0
+        self.weighted_target = 0.0
+        self.weighted_exposure = 0.0
+        self.sums = {}
+        self.counts = {}
+        self.levels = {}  # factor -> pd.Series of row counts per level
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.skipped_rows += other.skipped_rows
+        self.weighted_target += other.weighted_target
+        self.weighted_exposure += other.weighted_exposure
+        for col, value in other.sums.items():
+            self.sums[col] = self.sums.get(col, 0.0) + value
+            self.counts[col] = self.counts.get(col, 0) + other.counts[col]
+        for col, counts in other.levels.items():
+            self.levels[col] = counts if col not in self.levels else self.levels[col].add(counts, fill_value=0)
+        return self
+
+class GLM:
+    """
+    Log-link Tweedie GLM fitted by chunked IRLS.
+
+    Parameters:
+    -----------
+    numerical : list of str
+        Numerical features (one coefficient each)
+    categorical : list of str
+        Factors (one coefficient per non-reference level)
+    family : str or float
+        'poisson', 'gamma' or a Tweedie power in [1, 2]
+    exposure : str, optional
+        Exposure column, used as a log offset (default: exposure 1 per row)
+    weights : str, optional
+        Prior weight column (e.g. the claim count of a severity row)
+    max_iter : int
+        Maximum IRLS passes after the first
+    tol : float
+        Convergence on the relative deviance change, as R's glm
+    """
+
+    def __init__(self, numerical, categorical, family='poisson', exposure=None, weights=None,
+                 max_iter=DEFAULT_MAX_ITER, tol=DEFAULT_TOL):
+        self.numerical = list(numerical)
+        self.categorical = list(categorical)
+        self.family = family
+        self.power = family_power(family)
+        self.exposure = exposure
+        self.weights = weights
+        self.max_iter = int(max_iter)
+        self.tol = float(tol)
+        self.target = None
+        self.levels = {}
+        self.reference = {}
+        self.means = {}
+        self.coef = None
+        self.std_errors = None
+        self.dispersion = None
+        self.deviance = None
+        self.rows = 0
+        self.skipped_rows = 0
+        self.iterations = 0
+        self.converged = False
+        self.fit_seconds = None
+
+    @property
+    def features(self):
+        return self.numerical + self.categorical
+
+    @property
+    def columns(self):
+        """Columns a fit reads"""
+        return self.features + [col for col in (self.exposure, self.weights) if col]
+
+    @property
+    def terms(self):
+        return ['(Intercept)'] + self.numerical + [f'{col}={level}' for col in self.categorical
+                                                   for level in self.levels[col]]
+
+    def _offsets(self):
+        """Start of every factor's block in the coefficient vector"""
+        offsets, start = [], 1 + len(self.numerical)
+        for col in self.categorical:
+            offsets.append(start)
+            start += len(self.levels[col])
+        return offsets, start
+
+    def _inputs(self, df, target=None):
+        """Numerical matrix (intercept first), factor codes, log offset, prior weights and target of the valid rows; valid mask"""
+        n_rows = len(df)
+        valid = np.ones(n_rows, dtype=bool)
+        y = None
+        if target is not None:
+            y = pd.to_numeric(df[target], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            valid &= np.isfinite(y) & (y > 0 if self.power == 2.0 else y >= 0)
+        offset = np.zeros(n_rows)
+        if self.exposure and self.exposure in df.columns:
+            exposure = pd.to_numeric(df[self.exposure], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            valid &= exposure > 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                offset = np.log(exposure)
+        prior = np.ones(n_rows)
+        if self.weights and self.weights in df.columns:
+            prior = pd.to_numeric(df[self.weights], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            valid &= prior > 0
+
+        X = np.ones((int(valid.sum()), 1 + len(self.numerical)))
+        for j, col in enumerate(self.numerical, start=1):
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+            X[:, j] = np.where(np.isnan(values), self.means.get(col, np.nan), values)
+        codes = [pd.Categorical(df[col], categories=self.levels[col]).codes[valid].astype(np.int64)
+                 if col in self.levels else None for col in self.categorical]
+        return X, codes, offset[valid], prior[valid], None if y is None else y[valid], valid
+
+    def summarize(self, df, target):
+        """First-pass statistics of a chunk"""
+        X, _, offset, prior, y, valid = self._inputs(df, target)
+        summary = DataSummary()
+        summary.rows, summary.skipped_rows = len(y), len(valid) - len(y)
+        summary.weighted_target = float(prior @ y)
+        summary.weighted_exposure = float(prior @ np.exp(offset))
+        for j, col in enumerate(self.numerical, start=1):
+            finite = np.isfinite(X[:, j])
+            summary.sums[col], summary.counts[col] = float(X[finite, j].sum()), int(finite.sum())
+        for col in self.categorical:
+            summary.levels[col] = df[col][valid].value_counts(dropna=True).astype(np.int64)
+        return summary
+
+    def _linear_predictor(self, X, codes, coef):
+        eta = X @ coef[:X.shape[1]]
+        offsets, _ = self._offsets()
+        for col, start, code in zip(self.categorical, offsets, codes):
+            block = np.append(coef[start:start + len(self.levels[col])], 0.0)  # code -1 -> reference
+            eta += block[code]
+        return eta
+
+    def normal_equations(self, df, target, coef):
+        """IRLS contribution of a chunk at coefficients coef"""
+        X, codes, offset, prior, y, _ = self._inputs(df, target)
+        _, size = self._offsets()
+        result = NormalEquations(size)
+        result.rows = len(y)
+        if not len(y):
+            return result
+
+        eta = self._linear_predictor(X, codes, coef)
+        mu = np.exp(np.minimum(eta + offset, MAX_ETA))
+        w = prior * np.power(mu, 2 - self.power)
+        wz = w * (eta + (y - mu) / mu)
+        result.deviance = float(prior @ unit_deviance(y, mu, self.power))
+        result.pearson = float(prior @ ((y - mu) ** 2 / np.power(mu, self.power)))
+
+        # Numerical block, then every factor against the numerical columns, itself and the earlier factors
+        q = X.shape[1]
+        Xw = X * w[:, None]
+        result.xtwx[:q, :q] = Xw.T @ X
+        result.xtwz[:q] = X.T @ wz
+        offsets, _ = self._offsets()
+        blocks = []
+        for col, start, code in zip(self.categorical, offsets, codes):
+            k = len(self.levels[col])
+            present = code >= 0
+            code_present = code[present]
+            cells = slice(start, start + k)
+            result.xtwx[cells, cells] = np.diag(np.bincount(code_present, w[present], k))
+            result.xtwz[cells] = np.bincount(code_present, wz[present], k)
+            for j in range(q):
+                result.xtwx[cells, j] = np.bincount(code_present, Xw[present, j], k)
+                result.xtwx[j, cells] = result.xtwx[cells, j]
+            for other_cells, other_code, other_k in blocks:
+                both = present & (other_code >= 0)
+                cross = np.bincount(code[both] * other_k + other_code[both], w[both], k * other_k).reshape(k, other_k)
+                result.xtwx[cells, other_cells] = cross
+                result.xtwx[other_cells, cells] = cross.T
+            blocks.append((cells, code, k))
+        return result
+
+    def predict(self, X):
+        """Expected value per row (times exposure when X has the exposure column)"""
+        if isinstance(X, dict):
+            X = pd.DataFrame([X])
+        design, codes, offset, _, _, _ = self._inputs(X)
+        return np.exp(np.minimum(self._linear_predictor(design, codes, self.coef) + offset, MAX_ETA))
+
+    def _active(self):
+        """Coefficients estimated: all but the reference levels"""
+        active = np.ones(self._offsets()[1], dtype=bool)
+        for col, start in zip(self.categorical, self._offsets()[0]):
+            active[start + self.levels[col].index(self.reference[col])] = False
+        return active
+
+    def _solve(self, equations):
+        active = self._active()
+        coef = np.zeros(len(active))
+        coef[active] = np.linalg.lstsq(equations.xtwx[np.ix_(active, active)], equations.xtwz[active], rcond=None)[0]
+        return coef
+
+    def _start(self, summary):
+        self.rows, self.skipped_rows = summary.rows, summary.skipped_rows
+        if not summary.rows or summary.weighted_target <= 0:
+            raise ValueError(f"No rows with a positive {self.target} to fit a {self.family} GLM on")
+        self.means = {col: summary.sums[col] / summary.counts[col] if summary.counts[col] else 0.0
+                      for col in self.numerical}
+        for col in self.categorical:
+            counts = summary.levels.get(col, pd.Series(dtype=np.int64))
+            counts = counts[counts > 0]
+            self.levels[col] = sorted(counts.index.tolist(), key=str)
+            if not self.levels[col]:
+                raise ValueError(f"Factor {col} has no observed levels")
+            self.reference[col] = counts.sort_index(key=lambda index: index.map(str)).idxmax()
+        coef = np.zeros(self._offsets()[1])
+        coef[0] = np.log(summary.weighted_target / summary.weighted_exposure)
+        return coef
+
+    @traced()
+    def fit(self, data, target, workers=None):
+        """
+        Fit by IRLS, reading the data once per pass.
+
+        Parameters:
+        -----------
+        data : DataFrame or ProcessedChunks
+            In-memory data, or a re-readable chunked dataset
+        target : str
+            Response column
+        workers : int, optional
+            Worker processes splitting every pass by Parquet row group
+            (ProcessedChunks only); default 1
+
+        Returns:
+        --------
+        self
+        """
+        self.target = target
+        self.levels, self.reference, self.means = {}, {}, {}
+        source = data if isinstance(data, ProcessedChunks) else None
+        parts = source.parts(workers or 1) if source is not None else [None]
+        pool = ProcessPoolExecutor(max_workers=len(parts)) if len(parts) > 1 else None
+
+        def run_pass(coef):
+            if pool is not None:
+                results = pool.map(_glm_pass, parts, [source] * len(parts), [self] * len(parts), [coef] * len(parts))
+            else:
+                results = [_glm_pass(None, source, self, coef, data if source is None else None)]
+            merged = None
+            for result in results:
+                merged = result if merged is None else merged.merge(result)
+            return merged
+
+        try:
+            start = time.perf_counter()
+            coef = self._start(run_pass(None))
+            accepted, previous, equations = None, np.inf, None
+            halvings, self.converged = 0, False
+            for self.iterations in range(1, self.max_iter + 1):
+                with span('irls_pass', 'glm', family=self.family, iteration=self.iterations):
+                    current = run_pass(coef)
+                change = abs(current.deviance - previous) / (abs(current.deviance) + 0.1)
+                if np.isfinite(current.deviance) and change < self.tol:
+                    accepted, equations, self.converged = coef, current, True
+                    break
+                if not np.isfinite(current.deviance) or current.deviance > previous:
+                    # Step halving towards the last accepted coefficients
+                    if accepted is None:
+                        raise FloatingPointError(f"{self.family} GLM on {target}: non-finite deviance at the start")
+                    if halvings >= MAX_STEP_HALVINGS:
+                        logger.warning(f"{self.family} GLM on {target}: no deviance decrease after "
+                                       f"{halvings} step halvings at pass {self.iterations}")
+                        break
+                    halvings += 1
+                    coef = (coef + accepted) / 2
+                    continue
+                halvings = 0
+                accepted, equations, previous = coef, current, current.deviance
+                coef = self._solve(current)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if not self.converged:
+            logger.warning(f"{self.family} GLM on {target} did not converge ({self.iterations} passes)")
+        active = self._active()
+        self.coef = accepted
+        self.deviance = equations.deviance
+        self.dispersion = 1.0 if self.power == 1.0 else equations.pearson / max(equations.rows - active.sum(), 1)
+        covariance = np.linalg.pinv(equations.xtwx[np.ix_(active, active)]) * self.dispersion
+        self.std_errors = np.full(len(active), np.nan)
+        self.std_errors[active] = np.sqrt(np.maximum(np.diag(covariance), 0.0))
+        self.fit_seconds = time.perf_counter() - start
+        logger.info(f"{self.family} GLM on {target}: {self.rows} rows, {self.iterations} passes, "
+                    f"deviance {self.deviance:,.1f}, dispersion {self.dispersion:.4g}")
+        return self
+
+    def coefficients(self):
+        """Coefficient table; relativity is exp(estimate), 1 for reference levels"""
+        table = pd.DataFrame({'term': self.terms, 'estimate': self.coef, 'std_error': self.std_errors})
+        table['relativity'] = np.exp(table['estimate'])
+        return table
+
+    def summary(self):
+        return {
+            'family': self.family,
+            'power': self.power,
+            'target': self.target,
+            'exposure': self.exposure,
+            'rows': self.rows,
+            'skipped_rows': self.skipped_rows,
+            'iterations': self.iterations,
+            'converged': self.converged,
+            'deviance': self.deviance,
+            'dispersion': self.dispersion,
+            'fit_seconds': self.fit_seconds,
+            'reference_levels': {col: str(level) for col, level in self.reference.items()},
+            'coefficients': self.coefficients().to_dict('records'),
+        }
+
+class ProcessedChunks:
+    """A processed dataset read chunk by chunk (storage.iter_processed), splittable by row group"""
+
+    def __init__(self, path, columns=None, filters=None, chunksize=100_000):
+        self.path = path
+        self.columns = columns
+        self.filters = filters
+        self.chunksize = chunksize
+
+    def parts(self, n):
+        """Up to n disjoint row group lists; one part (the whole file) for a CSV"""
+        row_groups = row_group_count(self.path)
+        if row_groups is None or n <= 1:
+            return [None]
+        return [list(part) for part in np.array_split(np.arange(row_groups), min(n, row_groups)) if len(part)]
+
+    def __call__(self, part=None):
+        return iter_processed(self.path, self.columns, self.filters, part, self.chunksize)
+
+def _glm_pass(part, source, glm, coef, df=None):
+    """One pass over a part: the data summary (coef None) or the normal equations at coef"""
+    chunks = source(part) if source is not None else [df]
+    result = None
+    for chunk in chunks:
+        partial = glm.summarize(chunk, glm.target) if coef is None else glm.normal_equations(chunk, glm.target, coef)
+        result = partial if result is None else result.merge(partial)
+    if result is None:
+        result = DataSummary() if coef is None else NormalEquations(glm._offsets()[1])
+    return result
+
+class FrequencySeverityModel:
+    """
+    Claim model from a frequency and a severity GLM.
+
+    predict() is the expected claim severity, as for any claim model;
+    predict_frequency() is the expected claim frequency, which
+    optimize_premium uses instead of the rating table's claim probability.
+    """
+
+    def __init__(self, frequency, severity, model_version=None):
+        self.frequency = frequency
+        self.severity = severity
+        self.model_version = model_version
+
+    @property
+    def features(self):
+        return list(dict.fromkeys(self.frequency.features + self.severity.features))
+
+    def predict(self, X):
+        return self.severity.predict(X)
+
+    def predict_frequency(self, X):
+        return self.frequency.predict(X)
+
+    def pure_premium(self, X):
+        return self.predict_frequency(X) * self.predict(X)
@@ -0,0 +1,143 @@
+# src/models/prediction_cache.py
+"""
+Memoizing wrapper around a claim-severity model.
+
+Each policy's feature vector is reduced to a 64-bit hash
+(pandas.util.hash_pandas_object over the model features, vectorized per
+batch). Repeated feature vectors -- renewals, quote retries and the many
+policies sharing VehicleType/Province/CubicCapacity/VehicleAge -- are served
+from an LRU cache bounded by entry count and optional TTL; only distinct
+misses reach model.predict, in one call. Entries belong to a model version
+and the cache is cleared when the version changes.
+Version: 1.0
+"""
+import threading
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+def model_features(model):
+    """Input columns of a model: ClaimModel.features or sklearn's feature_names_in_, else None"""
+    for attribute in ('features', 'feature_names_in_'):
+        features = getattr(model, attribute, None)
+        if features is not None and len(features):
+            return list(features)
+    return None
+
+class PredictionCache:
+    """
+    Drop-in replacement for claim_model in optimize_premium / optimize_premium_batch.
+
+    Parameters:
+    -----------
+    model : trained model
+        Model with predict(DataFrame)
+    features : list of str, optional
+        Columns the model uses; only these enter the cache key (default: the
+        model's own features, see model_features; ValueError if it has none)
+    max_size : int
+        Maximum cached predictions; least recently used entries are evicted first
+    ttl_seconds : float, optional
+        Maximum age of a cached prediction
+    model_version : str, optional
+        Identifies the model; defaults to joblib.hash(model)
+    """
+
+    def __init__(self, model, features=None, max_size=100_000, ttl_seconds=None, model_version=None):
+        self._given_features = list(features) if features else None
+        self.features = None
+        self.max_size = int(max_size)
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key hash -> (prediction, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.model = None
+        self.model_version = None
+        self.set_model(model, model_version)
+
+    def set_model(self, model, model_version=None):
+        """Swap in a model; cached predictions are dropped when the version changes"""
+        version = str(model_version or getattr(model, 'model_version', None) or joblib.hash(model))
+        features = self._given_features or model_features(model)
+        if not features:
+            # Hashing every column (IDs, dates, premiums) would make nearly every key unique
+            raise ValueError("PredictionCache needs the model's feature columns: pass features= or use a model "
+                             "with .features or .feature_names_in_")
+        with self._lock:
+            if self.model_version is not None and version != self.model_version:
+                self.invalidations += 1
+                self._entries.clear()
+            self.model, self.model_version, self.features = model, version, features
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def feature_hashes(self, X):
+        """uint64 hash of each row's feature vector"""
+        return pd.util.hash_pandas_object(X.reindex(columns=self.features), index=False).to_numpy()
+
+    def predict(self, X):
+        """model.predict(X), computing only feature vectors not already cached"""
+        frame = pd.DataFrame([X]) if isinstance(X, dict) else X
+        keys = self.feature_hashes(frame)
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        values = np.empty(len(unique_keys), dtype=np.float64)
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            model = self.model
+            for i, key in enumerate(unique_keys.tolist()):
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(key)
+                    values[i] = entry[0]
+            self.hits += len(keys) - len(missing)  # duplicates within a batch count as hits
+            self.misses += len(missing)
+
+        if missing:
+            rows = first[missing]
+            batch = X if isinstance(X, dict) else frame.iloc[rows]
+            predictions = np.asarray(model.predict(batch), dtype=np.float64).reshape(len(rows))
+            values[missing] = predictions
+            expires_at = now + self.ttl_seconds if self.ttl_seconds else np.inf
+            with self._lock:
+                if model is self.model:  # don't cache results of a model swapped out meanwhile
+                    for key, prediction in zip(unique_keys[missing].tolist(), predictions.tolist()):
+                        self._entries[key] = (prediction, expires_at)
+                        self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+
+        return values[inverse.reshape(-1)]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'model_version': self.model_version,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
@@ -1,60 +1,73 @@
+import numpy as np
+import pandas as pd
 
-def optimize_premium(policy_data, claim_model, current_premium):
+from src.models.prediction_cache import PredictionCache
+from src.models.rating_table import DEFAULT_RATING_TABLE, RatingTable, RatingTableSource
+
+# Rating factors shared by the single-policy and portfolio paths
+DEFAULT_TABLE = RatingTable(DEFAULT_RATING_TABLE)
+
+def resolve_rating_table(rating_table=None):
+    """The table to price with: the defaults, a RatingTable, or the live table of a RatingTableSource"""
+    if rating_table is None:
+        return DEFAULT_TABLE
+    if isinstance(rating_table, RatingTableSource):
+        return rating_table.table
+    return rating_table
+
+def predict_frequency(claim_model, policies):
+    """
+    Expected claim frequency from a claim model that models it (predict_frequency,
+    e.g. the GLM FrequencySeverityModel, also inside a PredictionCache); None otherwise
+    """
+    model = claim_model.model if isinstance(claim_model, PredictionCache) else claim_model
+    predict = getattr(model, 'predict_frequency', None)
+    return None if predict is None else np.asarray(predict(policies), dtype=np.float64)
+
+def optimize_premium(policy_data, claim_model, current_premium, rating_table=None):
     """
     Optimize insurance premium based on predicted risk.
-    
+
     Parameters:
     -----------
     policy_data : dict or DataFrame
         Policyholder information
     claim_model : trained model
-        Model to predict claim severity
+        Model to predict claim severity (or a PredictionCache wrapping one).
+        If it also predicts claim frequency, that frequency is the claim
+        probability instead of the rating table's base probability and factors.
     current_premium : float
         Current premium amount
-    
+    rating_table : RatingTable or RatingTableSource, optional
+        Rating factors (defaults to DEFAULT_RATING_TABLE)
+
     Returns:
     --------
     dict: Optimization results
     """
-    
+    table = resolve_rating_table(rating_table)
+
     # Predict claim severity
     predicted_severity = claim_model.predict(policy_data)[0]
-    
-    # Estimate claim probability (simplified)
-    base_prob = 0.7  # Base claim probability
-    
-    # Risk adjustments
-    risk_multiplier = 1.0
-    
-    # Province risk
-    province = policy_data.get('Province', 'Unknown')
-    if province == 'Gauteng':
-        risk_multiplier *= 1.3
-    elif province == 'Western Cape':
-        risk_multiplier *= 0.9
-    elif province == 'Free State':
-        risk_multiplier *= 0.8
-    
-    # Vehicle type risk
-    vehicle_type = policy_data.get('VehicleType', 'Unknown')
-    if vehicle_type in ['SUV', 'Bakkie']:
-        risk_multiplier *= 1.2
-    elif vehicle_type == 'Sedan':
-        risk_multiplier *= 0.9
-    
-    # Previous claims
-    prev_claims = policy_data.get('PreviousClaims', 0)
-    risk_multiplier *= (1 + prev_claims * 0.3)
-    
-    estimated_probability = min(base_prob * risk_multiplier, 0.95)
-    
+
+    frequency = predict_frequency(claim_model, policy_data)
+    if frequency is not None:
+        # Fitted claim frequency, already adjusted for the policy's risk factors
+        estimated_probability = min(frequency[0], table.max_probability)
+    else:
+        # Risk adjustments: province x vehicle type factor, then previous claims loading
+        province = policy_data.get('Province', 'Unknown')
+        vehicle_type = policy_data.get('VehicleType', 'Unknown')
+        prev_claims = policy_data.get('PreviousClaims', 0)
+        risk_multiplier = table.risk_multiplier(province, vehicle_type, prev_claims)
+
+        # Estimate claim probability (simplified)
+        estimated_probability = min(table.base_probability * risk_multiplier, table.max_probability)
+
     # Calculate optimized premium
     risk_component = estimated_probability * predicted_severity
-    expense_loading = 0.3  # 30% expenses
-    profit_margin = 0.15   # 15% profit
-    
-    optimized_premium = risk_component * (1 + expense_loading + profit_margin)
-    
+    optimized_premium = risk_component * table.premium_loading
+
     return {
         'current_premium': current_premium,
         'optimized_premium': optimized_premium,
@@ -63,3 +76,71 @@ def optimize_premium(policy_data, claim_model, current_premium):
         'recommendation': 'INCREASE' if optimized_premium > current_premium else 'DECREASE',
         'adjustment_percentage': ((optimized_premium - current_premium) / current_premium) * 100
     }
+
+def optimize_premium_batch(policies, claim_model, current_premiums, rating_table=None):
+    """
+    Optimize premiums for a whole portfolio in one pass.
+
+    Same pricing as optimize_premium, applied row-wise with one batched
+    model call and one gather from the compiled rating table. Results are
+    identical to calling optimize_premium on each policy with the same table.
+
+    Parameters:
+    -----------
+    policies : DataFrame or dict of arrays
+        One row per policy (Province, VehicleType, PreviousClaims, model features)
+    claim_model : trained model
+        Model to predict claim severity (or a PredictionCache wrapping one);
+        predict() is called once, as is predict_frequency() if it has one
+    current_premiums : array-like, float or str
+        Current premium per policy, a single premium, or the name of a column
+    rating_table : RatingTable or RatingTableSource, optional
+        Rating factors; a source is read once, so the whole batch uses one table
+
+    Returns:
+    --------
+    dict: Optimization results, one array per key of optimize_premium's result
+    """
+    table = resolve_rating_table(rating_table)
+    if not isinstance(policies, pd.DataFrame):
+        policies = pd.DataFrame(policies)
+    n_policies = len(policies)
+
+    if isinstance(current_premiums, str):
+        current_premiums = policies[current_premiums]
+    current = np.broadcast_to(np.asarray(current_premiums, dtype=np.float64), (n_policies,))
+
+    # Predict claim severity for every policy at once
+    predicted_severity = np.asarray(claim_model.predict(policies), dtype=np.float64).reshape(n_policies)
+
+    frequency = predict_frequency(claim_model, policies)
+    if frequency is not None:
+        estimated_probability = np.minimum(frequency.reshape(n_policies), table.max_probability)
+    else:
+        # Risk adjustments: one gather from the factor grid, then previous claims loading
+        unknown = np.full(n_policies, 'Unknown', dtype=object)
+        provinces = policies['Province'] if 'Province' in policies.columns else unknown
+        vehicle_types = policies['VehicleType'] if 'VehicleType' in policies.columns else unknown
+        if 'PreviousClaims' in policies.columns:
+            prev_claims = policies['PreviousClaims'].to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            prev_claims = np.zeros(n_policies)
+        risk_multiplier = table.risk_multipliers(provinces, vehicle_types, prev_claims)
+
+        estimated_probability = table.claim_probability(risk_multiplier)
+
+    # Calculate optimized premium
+    risk_component = estimated_probability * predicted_severity
+    optimized_premium = risk_component * table.premium_loading
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adjustment_percentage = ((optimized_premium - current) / current) * 100
+
+    return {
+        'current_premium': current,
+        'optimized_premium': optimized_premium,
+        'predicted_severity': predicted_severity,
+        'estimated_probability': estimated_probability,
+        'recommendation': np.where(optimized_premium > current, 'INCREASE', 'DECREASE'),
+        'adjustment_percentage': adjustment_percentage
+    }
@@ -0,0 +1,301 @@
+# src/models/quote_server.py
+"""
+Local premium quote service with micro-batching.
+
+Quote requests arrive over HTTP on localhost (POST /quote) and are queued.
+A single batcher task drains the queue into micro-batches bounded by size
+(max_batch_size) and by how long the oldest request may wait (max_wait_ms),
+then scores each batch with one optimize_premium_batch call -- one
+vectorized model.predict -- on a worker thread so the event loop keeps
+accepting connections. When the queue is full new requests are refused
+with 503 instead of queueing without bound. GET /stats reports p50/p99
+latency, throughput, batch sizes and, when predictions are cached, the
+PredictionCache hit/miss/eviction counters.
+
+Usage:
+    python -m src.models.quote_server --model models/random_forest.joblib
+    python -m src.models.quote_server --model models/random_forest.compiled
+Version: 1.0
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.models.compiled import load_model
+from src.models.prediction_cache import PredictionCache
+from src.models.premium_optimizer import optimize_premium_batch
+from src.models.rating_table import RatingTableSource
+
+DEFAULT_SERVING = {
+    'host': '127.0.0.1',
+    'port': 8765,
+    'model_path': 'models/random_forest.joblib',
+    'max_batch_size': 256,
+    'max_wait_ms': 2.0,
+    'max_queue': 4096,
+    'cache_size': 100_000,
+    'cache_ttl_s': None,
+}
+
+class QuoteRejected(Exception):
+    """Raised when the request queue is full"""
+
+class LatencyStats:
+    """Latency window, request/batch counters and throughput since start"""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.batches = 0
+        self.batch_rows = 0
+
+    def record_batch(self, latencies, failed=0):
+        self.latencies.extend(latencies)
+        self.completed += len(latencies) - failed
+        self.failed += failed
+        self.batches += 1
+        self.batch_rows += len(latencies)
+
+    def snapshot(self, queue_depth=0):
+        latencies_ms = np.asarray(self.latencies, dtype=np.float64) * 1000
+        p50, p99 = np.percentile(latencies_ms, [50, 99]) if len(latencies_ms) else (np.nan, np.nan)
+        elapsed = time.perf_counter() - self.started
+        return {
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'batches': self.batches,
+            'mean_batch_size': self.batch_rows / self.batches if self.batches else 0.0,
+            'latency_p50_ms': None if np.isnan(p50) else float(p50),
+            'latency_p99_ms': None if np.isnan(p99) else float(p99),
+            'throughput_per_s': self.completed / elapsed if elapsed > 0 else 0.0,
+            'queue_depth': queue_depth,
+            'uptime_s': elapsed,
+        }
+
+def quotes_from_batch(results):
+    """Split optimize_premium_batch output into one plain dict per policy"""
+    columns = {key: np.asarray(values).tolist() for key, values in results.items()}
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+class MicroBatcher:
+    """Bounded request queue drained into size- and time-bounded scoring batches"""
+
+    def __init__(self, score_batch, max_batch_size=256, max_wait_ms=2.0, max_queue=4096, stats=None):
+        self.score_batch = score_batch
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000
+        self.stats = stats or LatencyStats()
+        self.queue = asyncio.Queue(maxsize=int(max_queue))
+        self._batch_ready = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quote-scorer')
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, policy, current_premium):
+        """Queue one quote and wait for its result; raises QuoteRejected when full"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((policy, current_premium, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise QuoteRejected(f"Quote queue full ({self.queue.maxsize} pending)")
+        if self.queue.qsize() >= self.max_batch_size:
+            self._batch_ready.set()
+        return await future
+
+    async def _collect(self):
+        """Next batch: wait for one request, then fill up until full or max_wait has passed"""
+        items = [await self.queue.get()]
+        if self.queue.qsize() < self.max_batch_size - 1 and self.max_wait > 0:
+            self._batch_ready.clear()
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+        while len(items) < self.max_batch_size and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            policies = [item[0] for item in items]
+            premiums = [item[1] for item in items]
+            try:
+                quotes = await loop.run_in_executor(self._executor, self._score, policies, premiums)
+            except Exception as e:
+                quotes = [e] * len(items)
+
+            done = time.perf_counter()
+            failed = 0
+            for (_, _, future, queued), quote in zip(items, quotes):
+                if future.done():  # client went away
+                    continue
+                if isinstance(quote, Exception):
+                    failed += 1
+                    future.set_exception(quote)
+                else:
+                    future.set_result(quote)
+            self.stats.record_batch([done - item[3] for item in items], failed)
+
+    def _score(self, policies, premiums):
+        """One vectorized call per batch; if it fails, rescore one by one to isolate bad requests"""
+        try:
+            return quotes_from_batch(self.score_batch(pd.DataFrame(policies), np.asarray(premiums, dtype=np.float64)))
+        except Exception:
+            if len(policies) == 1:
+                raise
+        quotes = []
+        for policy, premium in zip(policies, premiums):
+            try:
+                quotes.extend(self._score([policy], [premium]))
+            except Exception as e:
+                quotes.append(e)
+        return quotes
+
+class QuoteServer:
+    """Minimal HTTP/1.1 (keep-alive) front end: POST /quote, GET /stats"""
+
+    def __init__(self, batcher, host='127.0.0.1', port=8765, cache=None):
+        self.batcher = batcher
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # resolves port 0
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _route(self, method, path, body):
+        if method == 'GET' and path == '/stats':
+            stats = self.batcher.stats.snapshot(self.batcher.queue.qsize())
+            if self.cache is not None:
+                stats['cache'] = self.cache.stats()
+            return 200, stats
+        if method != 'POST' or path != '/quote':
+            return 404, {'error': f'No route for {method} {path}'}
+        try:
+            request = json.loads(body)
+            policy = request['policy']
+            current_premium = float(request['current_premium'])
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': f'Bad quote request: {e}'}
+        try:
+            return 200, await self.batcher.submit(policy, current_premium)
+        except QuoteRejected as e:
+            return 503, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f'Scoring failed: {e}'}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self._route(method, path, body)
+                data = json.dumps(payload).encode()
+                reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                          500: 'Internal Server Error', 503: 'Service Unavailable'}[status]
+                writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+def make_scorer(claim_model, rating_source):
+    """Batch scoring function; picks up rating table file changes between batches"""
+    def score_batch(policies, current_premiums):
+        rating_source.reload_if_changed()
+        return optimize_premium_batch(policies, claim_model, current_premiums, rating_source.table)
+    return score_batch
+
+async def run_server(claim_model, rating_source, host, port, max_batch_size, max_wait_ms, max_queue):
+    batcher = MicroBatcher(make_scorer(claim_model, rating_source), max_batch_size, max_wait_ms, max_queue)
+    cache = claim_model if isinstance(claim_model, PredictionCache) else None
+    server = await QuoteServer(batcher, host, port, cache).start()
+    print(f"Quote server listening on http://{server.host}:{server.port} "
+          f"(batch <= {max_batch_size}, wait <= {max_wait_ms}ms, queue <= {max_queue})")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.batcher.stop()
+
+def main():
+    with open('config/params.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    serving = {**DEFAULT_SERVING, **(config.get('serving', {}) or {})}
+
+    parser = argparse.ArgumentParser(description='Micro-batching premium quote server')
+    parser.add_argument('--model', default=serving['model_path'],
+                        help='Claim severity model: joblib file or compiled model directory')
+    parser.add_argument('--host', default=serving['host'])
+    parser.add_argument('--port', type=int, default=serving['port'])
+    parser.add_argument('--max-batch-size', type=int, default=serving['max_batch_size'])
+    parser.add_argument('--max-wait-ms', type=float, default=serving['max_wait_ms'])
+    parser.add_argument('--max-queue', type=int, default=serving['max_queue'])
+    parser.add_argument('--cache-size', type=int, default=serving['cache_size'],
+                        help='Cached predictions (0 disables the cache)')
+    parser.add_argument('--cache-ttl', type=float, default=serving['cache_ttl_s'], help='Seconds')
+    args = parser.parse_args()
+
+    claim_model = load_model(args.model)
+    if args.cache_size > 0:
+        claim_model = PredictionCache(claim_model, max_size=args.cache_size, ttl_seconds=args.cache_ttl)
+    rating_source = RatingTableSource(config.get('pricing', {}).get('rating_table_path'), config)
+    try:
+        asyncio.run(run_server(claim_model, rating_source, args.host, args.port,
+                               args.max_batch_size, args.max_wait_ms, args.max_queue))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
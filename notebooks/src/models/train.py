@@ -0,0 +1,299 @@
+# src/models/train.py
+"""
+Claim model training stage.
+
+Fits the claim-severity models from the processed data, driven by the
+model section of config/params.yaml (target, features, random_forest,
+linear_regression, test_size, search):
+  1. test_size of the rows are held out; the features of the rest are
+     encoded as a sparse design matrix (src/models/design.py).
+  2. Cross-validated grid search over the random forest: the design matrix,
+     the target and the fold of every row are copied into shared memory
+     once, and each (candidate, fold) fit runs on a process pool whose
+     workers attach to them, so a task only carries its parameters.
+  3. The best candidate and a linear regression are refitted on all
+     training rows and scored on the held-out rows.
+Per-fold fit/predict times and worker peak memory, the search summary and
+the test scores go to reports/metrics/model_performance.json; the models
+are saved as ClaimModel objects with predict(DataFrame).
+
+Usage:
+    python -m src.models.train [--workers N]
+Version: 1.0
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from src.data.storage import load_processed
+from src.models.design import ClaimModel, DesignEncoder, design_digest
+from src.utils.instrument import peak_rss_mb, reset_peak_rss, traced
+from src.utils.shared import SharedColumns
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DATA_PATH = 'data/processed/cleaned_data.csv'
+MODEL_DIR = 'models'
+METRICS_PATH = 'reports/metrics/model_performance.json'
+DEFAULT_FOLDS = 5
+
+_SEARCH_DATA = {}
+
+def load_config(config_path="config/params.yaml"):
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
+def split_features(df, features):
+    """Numerical and categorical model features present in df; missing ones are skipped with a warning"""
+    missing = [col for col in features if col not in df.columns]
+    if missing:
+        logger.warning(f"Features not in the processed data are skipped: {missing}")
+    present = [col for col in features if col in df.columns]
+    numerical = [col for col in present if pd.api.types.is_numeric_dtype(df[col])
+                 and not isinstance(df[col].dtype, pd.CategoricalDtype)]
+    return numerical, [col for col in present if col not in numerical]
+
+def candidate_grid(base, grid):
+    """Every combination of the grid values, on top of the base parameters"""
+    grid = grid or {}
+    names = list(grid)
+    return [{**base, **dict(zip(names, values))} for values in itertools.product(*(grid[name] for name in names))]
+
+def fold_assignment(n_rows, n_folds, seed):
+    """Fold number of every row, balanced and shuffled"""
+    folds = np.empty(n_rows, dtype=np.int8)
+    folds[np.random.default_rng(seed).permutation(n_rows)] = np.arange(n_rows) % n_folds
+    return folds
+
+def regression_scores(y_true, y_pred):
+    return {
+        'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'r2': float(r2_score(y_true, y_pred)),
+    }
+
+def _init_search_worker(specs, shape):
+    """Attach the shared design matrix, target and folds once per worker"""
+    _SEARCH_DATA['blocks'], arrays = SharedColumns.attach(specs)
+    _SEARCH_DATA['X'] = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape,
+                                          copy=False)
+    _SEARCH_DATA['y'] = arrays['y']
+    _SEARCH_DATA['fold'] = arrays['fold']
+
+def _fit_fold(params, fold):
+    """Fit one candidate on all folds but `fold` and score it on `fold`"""
+    X, y, folds = _SEARCH_DATA['X'], _SEARCH_DATA['y'], _SEARCH_DATA['fold']
+    validation = folds == fold
+    reset_peak_rss()
+    start = time.perf_counter()
+    model = RandomForestRegressor(**params, n_jobs=1).fit(X[~validation], y[~validation])
+    fit_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = model.predict(X[validation])
+    return {
+        'fold': int(fold),
+        'train_rows': int((~validation).sum()),
+        'validation_rows': int(validation.sum()),
+        'fit_seconds': fit_seconds,
+        'predict_seconds': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(),
+        'pid': os.getpid(),
+        **regression_scores(y[validation], predictions),
+    }
+
+@traced()
+def cross_validate(X, y, candidates, n_folds=DEFAULT_FOLDS, workers=None, seed=42):
+    """
+    K-fold cross-validation of random forest candidates on a process pool.
+
+    Parameters:
+    -----------
+    X : scipy.sparse.csr_matrix
+        Training design matrix
+    y : array-like
+        Target
+    candidates : list of dict
+        RandomForestRegressor parameters to compare
+    n_folds : int
+        Folds
+    workers : int, optional
+        Worker processes (default: all cores); 1 runs in process
+    seed : int
+        Seed of the fold assignment
+
+    Returns:
+    --------
+    list of dict: per candidate its parameters, mean/std scores and per-fold results
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(params, fold) for params in candidates for fold in range(n_folds)]
+    shared = SharedColumns()
+    try:
+        for name, values in (('data', X.data), ('indices', X.indices), ('indptr', X.indptr),
+                             ('y', np.asarray(y, dtype=np.float64)), ('fold', fold_assignment(X.shape[0], n_folds, seed))):
+            shared.add(name, values)
+        if workers == 1 or len(tasks) == 1:
+            _init_search_worker(shared.specs, X.shape)
+            results = [_fit_fold(params, fold) for params, fold in tasks]
+            _SEARCH_DATA.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_search_worker,
+                                     initargs=(shared.specs, X.shape)) as pool:
+                results = list(pool.map(_fit_fold, *zip(*tasks)))
+    finally:
+        shared.release()
+
+    summary = []
+    for i, params in enumerate(candidates):
+        folds = results[i * n_folds:(i + 1) * n_folds]
+        rmse = np.array([result['rmse'] for result in folds])
+        summary.append({
+            'params': params,
+            'mean_rmse': float(rmse.mean()),
+            'std_rmse': float(rmse.std()),
+            'mean_mae': float(np.mean([result['mae'] for result in folds])),
+            'mean_r2': float(np.mean([result['r2'] for result in folds])),
+            'mean_fit_seconds': float(np.mean([result['fit_seconds'] for result in folds])),
+            'max_peak_rss_mb': float(max(result['peak_rss_mb'] for result in folds)),
+            'folds': folds,
+        })
+    return summary
+
+def fit_model(estimator, encoder, X, y, name, params):
+    """Fit an estimator on the design matrix and wrap it as a ClaimModel; returns (model, seconds)"""
+    start = time.perf_counter()
+    estimator.fit(X, y)
+    seconds = time.perf_counter() - start
+    version = f"{name}-{design_digest(X, y)[:8]}-{joblib.hash(params)[:8]}"
+    return ClaimModel(encoder, estimator, name, params, model_version=version), seconds
+
+@traced()
+def train(df, model_config, workers=None):
+    """
+    Train the random forest (with grid search) and linear regression models.
+
+    Parameters:
+    -----------
+    df : pd.DataFrame
+        Processed data with the target and feature columns
+    model_config : dict
+        The model section of params.yaml
+    workers : int, optional
+        Search worker processes (overrides model.search.workers)
+
+    Returns:
+    --------
+    tuple: ({'random_forest': ClaimModel, 'linear_regression': ClaimModel}, metrics dict)
+    """
+    target = model_config.get('target', 'TotalClaims')
+    search_config = model_config.get('search', {}) or {}
+    forest_params = dict(model_config.get('random_forest', {}) or {})
+    seed = forest_params.get('random_state', 42)
+    if workers is None:
+        workers = search_config.get('workers')
+
+    df = df[df[target].notna()]
+    numerical, categorical = split_features(df, model_config.get('features', []))
+    train_rows, test_rows = train_test_split(np.arange(len(df)), test_size=model_config.get('test_size', 0.2),
+                                             random_state=seed)
+    train_df, test_df = df.iloc[train_rows], df.iloc[test_rows]
+    y_train = train_df[target].to_numpy(dtype=np.float64)
+    y_test = test_df[target].to_numpy(dtype=np.float64)
+
+    encoder = DesignEncoder(numerical, categorical).fit(train_df)
+    X_train = encoder.transform(train_df)
+    X_test = encoder.transform(test_df)
+    sparse_bytes = X_train.data.nbytes + X_train.indices.nbytes + X_train.indptr.nbytes
+    logger.info(f"Design matrix: {X_train.shape[0]} x {X_train.shape[1]}, {X_train.nnz} non-zeros "
+                f"({sparse_bytes / 1024 / 1024:.1f} MB sparse vs "
+                f"{X_train.shape[0] * X_train.shape[1] * 8 / 1024 / 1024:.1f} MB dense)")
+
+    # Grid search
+    candidates = candidate_grid(forest_params, search_config.get('grid'))
+    n_folds = search_config.get('cv_folds', DEFAULT_FOLDS)
+    logger.info(f"Cross-validating {len(candidates)} candidates x {n_folds} folds on {workers or os.cpu_count()} workers")
+    start = time.perf_counter()
+    search = cross_validate(X_train, y_train, candidates, n_folds, workers, seed)
+    search_seconds = time.perf_counter() - start
+    best = min(search, key=lambda candidate: candidate['mean_rmse'])
+    logger.info(f"Best random forest: {best['params']} (CV RMSE {best['mean_rmse']:,.0f})")
+
+    # Final models on all training rows
+    models, scores = {}, {}
+    final_forest = RandomForestRegressor(**best['params'], n_jobs=workers or -1)
+    linear_params = dict(model_config.get('linear_regression', {}) or {})
+    for name, estimator, params in (('random_forest', final_forest, best['params']),
+                                    ('linear_regression', LinearRegression(**linear_params), linear_params)):
+        models[name], fit_seconds = fit_model(estimator, encoder, X_train, y_train, name, params)
+        if estimator is final_forest:
+            # Fit on all cores but predict on one (as the CV fits do): threaded prediction sums the
+            # trees in no fixed order, so the saved model would vary between calls and batch sizes
+            final_forest.n_jobs = 1
+        scores[name] = {'params': params, 'fit_seconds': fit_seconds, 'model_version': models[name].model_version,
+                        **regression_scores(y_test, estimator.predict(X_test))}
+        logger.info(f"{name}: test RMSE {scores[name]['rmse']:,.0f}, R2 {scores[name]['r2']:.3f}")
+
+    metrics = {
+        'target': target,
+        'features': encoder.features,
+        'rows': {'train': len(train_df), 'test': len(test_df)},
+        'design_matrix': {
+            'format': 'csr',
+            'columns': int(X_train.shape[1]),
+            'nnz': int(X_train.nnz),
+            'sparse_mb': float(sparse_bytes / 1024 / 1024),
+            'dense_mb': float(X_train.shape[0] * X_train.shape[1] * 8 / 1024 / 1024),
+        },
+        'search': {
+            'folds': n_folds,
+            'workers': workers or os.cpu_count(),
+            'seconds': search_seconds,
+            'best_params': best['params'],
+            'candidates': search,
+        },
+        **scores,
+    }
+    return models, metrics
+
+def main(workers=None):
+    """Train the claim models and save them with their metrics"""
+    config = load_config()
+    model_config = config.get('model', {})
+    columns = list(model_config.get('features', [])) + [model_config.get('target', 'TotalClaims')]
+
+    logger.info(f"Loading training data from {DATA_PATH}")
+    df = load_processed(DATA_PATH, columns=columns)
+    models, metrics = train(df, model_config, workers)
+
+    Path(MODEL_DIR).mkdir(parents=True, exist_ok=True)
+    for name, model in models.items():
+        joblib.dump(model, Path(MODEL_DIR) / f'{name}.joblib')
+        logger.info(f"Saved {Path(MODEL_DIR) / f'{name}.joblib'} ({model.model_version})")
+
+    Path(METRICS_PATH).parent.mkdir(parents=True, exist_ok=True)
+    with open(METRICS_PATH, 'w') as f:
+        json.dump(metrics, f, indent=2, default=str)
+    logger.info(f"Metrics saved to {METRICS_PATH}")
+    return metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the claim models")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes for the cross-validated search (overrides model.search.workers)")
+    args = parser.parse_args()
+    main(workers=args.workers)
@@ -0,0 +1,89 @@
+# src/models/train_glm.py
+"""
+Frequency-severity GLM stage.
+
+Fits the claim frequency GLM (Poisson on HasClaim by default) and the
+claim severity GLM (Gamma on TotalClaims, rows with a claim only) of
+src/models/glm.py on the processed data, streaming it by Parquet row group
+with the passes split across worker processes, as configured in the
+model.glm section of config/params.yaml. Saves the pair as one
+FrequencySeverityModel, usable as the claim model of optimize_premium and
+the quote server, and the fit summaries with coefficient tables to
+reports/metrics/glm_performance.json.
+
+Usage:
+    python -m src.models.train_glm [--workers N]
+Version: 1.0
+"""
+import argparse
+import json
+import logging
+import os
+import joblib
+import yaml
+from pathlib import Path
+
+from src.data.storage import available_columns
+from src.models.glm import DEFAULT_MAX_ITER, DEFAULT_TOL, GLM, FrequencySeverityModel, ProcessedChunks
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DATA_PATH = 'data/processed/cleaned_data.csv'
+MODEL_PATH = 'models/frequency_severity.joblib'
+METRICS_PATH = 'reports/metrics/glm_performance.json'
+
+def load_config(config_path="config/params.yaml"):
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
+def split_features(columns, features, categorical):
+    """Numerical and categorical features, the latter as listed in preprocessing.categorical_cols"""
+    present = [col for col in features if col in columns]
+    missing = [col for col in features if col not in columns]
+    if missing:
+        logger.warning(f"Features not in the processed data are skipped: {missing}")
+    return [col for col in present if col not in categorical], [col for col in present if col in categorical]
+
+def main(workers=None):
+    """Fit the frequency and severity GLMs on the processed data and save the model with its metrics"""
+    config = load_config()
+    glm_config = config.get('model', {}).get('glm', {}) or {}
+    features = glm_config.get('features') or config.get('model', {}).get('features', [])
+    categorical_cols = config.get('preprocessing', {}).get('categorical_cols', [])
+    if workers is None:
+        workers = glm_config.get('workers') or os.cpu_count()
+
+    numerical, categorical = split_features(available_columns(DATA_PATH), features, categorical_cols)
+    models = {}
+    for part in ('frequency', 'severity'):
+        part_config = glm_config.get(part, {}) or {}
+        target = part_config['target']
+        glm = GLM(numerical, categorical, part_config.get('family', 'poisson'), glm_config.get('exposure'),
+                  part_config.get('weights'), glm_config.get('max_iter', DEFAULT_MAX_ITER),
+                  glm_config.get('tol', DEFAULT_TOL))
+        filters = [(target, '>', 0)] if part == 'severity' else None
+        source = ProcessedChunks(DATA_PATH, glm.columns + [target], filters, glm_config.get('chunksize', 100_000))
+        logger.info(f"Fitting the {part} GLM ({glm.family}) on {target} with {workers} workers")
+        models[part] = glm.fit(source, target, workers)
+
+    model = FrequencySeverityModel(models['frequency'], models['severity'])
+    model.model_version = f"glm-{joblib.hash((model.frequency.coef, model.severity.coef))[:8]}"
+    Path(MODEL_PATH).parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, MODEL_PATH)
+    logger.info(f"Saved {MODEL_PATH} ({model.model_version})")
+
+    metrics = {'model_version': model.model_version, 'features': model.features, 'workers': workers,
+               **{part: glm.summary() for part, glm in models.items()}}
+    Path(METRICS_PATH).parent.mkdir(parents=True, exist_ok=True)
+    with open(METRICS_PATH, 'w') as f:
+        json.dump(metrics, f, indent=2, default=str)
+    logger.info(f"Metrics saved to {METRICS_PATH}")
+    return metrics
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the frequency-severity GLMs out of core")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes per IRLS pass, each reading its own row groups (overrides model.glm.workers)")
+    args = parser.parse_args()
+    main(workers=args.workers)
@@ -0,0 +1,344 @@
+# src/utils/pipeline.py
+"""
+Incremental, content-hashed runner for the dvc.yaml pipeline.
+
+Reads the stages in dvc.yaml, derives the DAG from deps/outs, and reruns a
+stage only when its command, the MD5 of a dependency, one of its params
+values or one of its outputs differs from what dvc.lock recorded. Stages
+whose upstream stages are done run concurrently, each in its own process.
+File hashes are cached in .pipeline/state.json keyed by size, mtime and
+inode, so a no-op rerun only stats files. dvc.lock is written in DVC's
+schema 2.0 layout after every successful stage.
+
+Usage:
+    python -m src.utils.pipeline repro [stage ...] [--force] [--jobs N] [--dry]
+    python -m src.utils.pipeline status
+    python -m src.utils.pipeline repro --trace reports/trace/pipeline.jsonl
+Version: 1.0
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import yaml
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from src.utils.instrument import PROFILE_ENV, PROFILE_MODES, enable, span
+
+DVC_FILE = 'dvc.yaml'
+LOCK_FILE = 'dvc.lock'
+STATE_FILE = '.pipeline/state.json'
+DEFAULT_PARAMS_FILE = 'params.yaml'
+HASH_CHUNK = 1 << 20
+
+class HashState:
+    """MD5 of files, remembered per (size, mtime, inode) so unchanged files are not reread"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = Path(path)
+        self.entries = {}
+        self.dirty = False
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+
+    def file_md5(self, path):
+        st = os.stat(path)
+        signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+        entry = self.entries.get(str(path))
+        if entry is not None and entry[:3] == signature:
+            return entry[3]
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(block)
+        self.entries[str(path)] = signature + [digest.hexdigest()]
+        self.dirty = True
+        return digest.hexdigest()
+
+    def hash_path(self, path):
+        """Lock-file hash info for a file or directory; None if it does not exist"""
+        path = Path(path)
+        if path.is_file():
+            return {'hash': 'md5', 'md5': self.file_md5(path), 'size': path.stat().st_size}
+        if path.is_dir():
+            files = sorted(p for p in path.rglob('*') if p.is_file())
+            listing = [{'md5': self.file_md5(p), 'relpath': p.relative_to(path).as_posix()} for p in files]
+            md5 = hashlib.md5(json.dumps(listing, sort_keys=True).encode()).hexdigest()
+            return {'hash': 'md5', 'md5': md5 + '.dir', 'size': sum(p.stat().st_size for p in files),
+                    'nfiles': len(files)}
+        return None
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+def entry_paths(entries):
+    """Paths from a dvc.yaml deps/outs list (plain strings or {path: options})"""
+    paths = []
+    for entry in entries or []:
+        if isinstance(entry, dict):
+            paths.extend(entry)
+        else:
+            paths.append(entry)
+    return [str(path).rstrip('/') for path in paths]
+
+def lookup(config, dotted):
+    value = config
+    for part in dotted.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(dotted)
+        value = value[part]
+    return value
+
+def is_within(path, parent):
+    return path == parent or path.startswith(parent + '/')
+
+class Stage:
+    def __init__(self, name, spec):
+        self.name = name
+        cmd = spec['cmd']
+        self.cmd = ' && '.join(cmd) if isinstance(cmd, list) else cmd
+        self.deps = entry_paths(spec.get('deps'))
+        self.outs = entry_paths(spec.get('outs')) + entry_paths(spec.get('metrics')) + entry_paths(spec.get('plots'))
+        self.always_changed = bool(spec.get('always_changed', False))
+
+        self.params = {}  # params file -> keys
+        for entry in spec.get('params', []) or []:
+            if isinstance(entry, dict):
+                for params_file, keys in entry.items():
+                    self.params.setdefault(params_file, []).extend(keys or [])
+            else:
+                self.params.setdefault(DEFAULT_PARAMS_FILE, []).append(entry)
+
+class Pipeline:
+    """Stages of a dvc.yaml file, their dependency graph and lock state"""
+
+    def __init__(self, dvcfile=DVC_FILE, lockfile=LOCK_FILE, state=None):
+        with open(dvcfile, 'r') as f:
+            spec = yaml.safe_load(f)
+        self.stages = {name: Stage(name, stage) for name, stage in spec['stages'].items()}
+        self.lockfile = Path(lockfile)
+        self.state = state or HashState()
+        self.lock = {'schema': '2.0', 'stages': {}}
+        if self.lockfile.exists():
+            with open(self.lockfile, 'r') as f:
+                self.lock = yaml.safe_load(f) or self.lock
+            self.lock.setdefault('stages', {})
+
+        self.upstream = {name: set() for name in self.stages}
+        for name, stage in self.stages.items():
+            for other in self.stages.values():
+                if other.name != name and any(is_within(dep, out) or is_within(out, dep)
+                                              for dep in stage.deps for out in other.outs):
+                    self.upstream[name].add(other.name)
+        self._params_cache = {}
+
+    def ancestors(self, names):
+        """names plus everything they depend on, in dvc.yaml order"""
+        selected, todo = set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage: {name}")
+            if name not in selected:
+                selected.add(name)
+                todo.extend(self.upstream[name])
+        return [name for name in self.stages if name in selected]
+
+    def params_values(self, stage):
+        values = {}
+        for params_file, keys in stage.params.items():
+            if params_file not in self._params_cache:
+                with open(params_file, 'r') as f:
+                    self._params_cache[params_file] = yaml.safe_load(f) or {}
+            values[params_file] = {key: lookup(self._params_cache[params_file], key) for key in keys}
+        return values
+
+    def lock_entry(self, stage):
+        entry = {'cmd': stage.cmd}
+        entry['deps'] = [{'path': dep, **(self.state.hash_path(dep) or {})} for dep in stage.deps]
+        if stage.params:
+            entry['params'] = self.params_values(stage)
+        entry['outs'] = [{'path': out, **(self.state.hash_path(out) or {})} for out in stage.outs]
+        return entry
+
+    def changes(self, stage):
+        """Why the stage must run; an empty list means it is up to date"""
+        if stage.always_changed:
+            return ['always_changed']
+        locked = self.lock['stages'].get(stage.name)
+        if locked is None:
+            return ['not in dvc.lock']
+
+        reasons = []
+        if locked.get('cmd') != stage.cmd:
+            reasons.append('command changed')
+        locked_deps = {dep['path']: dep.get('md5') for dep in locked.get('deps', [])}
+        for dep in stage.deps:
+            info = self.state.hash_path(dep)
+            if info is None:
+                reasons.append(f'missing dependency: {dep}')
+            elif locked_deps.get(dep) != info['md5']:
+                reasons.append(f'modified dependency: {dep}')
+        try:
+            if self.params_values(stage) != (locked.get('params') or {}):
+                reasons.append('params changed')
+        except KeyError as e:
+            reasons.append(f'missing param: {e.args[0]}')
+        locked_outs = {out['path']: out.get('md5') for out in locked.get('outs', [])}
+        for out in stage.outs:
+            info = self.state.hash_path(out)
+            if info is None:
+                reasons.append(f'missing output: {out}')
+            elif locked_outs.get(out) != info['md5']:
+                reasons.append(f'modified output: {out}')
+        return reasons
+
+    def write_lock(self):
+        ordered = {name: self.lock['stages'][name] for name in self.stages if name in self.lock['stages']}
+        lock = {'schema': '2.0', 'stages': ordered}
+        tmp = self.lockfile.with_suffix('.lock.tmp')
+        with open(tmp, 'w') as f:
+            yaml.safe_dump(lock, f, sort_keys=False)
+        os.replace(tmp, self.lockfile)
+
+    def status(self, targets=None):
+        names = self.ancestors(targets) if targets else list(self.stages)
+        result = {name: self.changes(self.stages[name]) for name in names}
+        self.state.save()
+        return result
+
+    def repro(self, targets=None, force=False, jobs=None, dry=False):
+        """
+        Bring stages (default: all) up to date.
+
+        Parameters:
+        -----------
+        targets : list of str, optional
+            Stages to reproduce, together with their upstream stages
+        force : bool
+            Run every selected stage regardless of hashes
+        jobs : int, optional
+            Stages run at the same time (default: CPU count)
+        dry : bool
+            Only report what would run
+
+        Returns:
+        --------
+        dict: stage name -> 'ran', 'skipped', 'would run' (dry), 'failed' or 'blocked'
+        """
+        names = self.ancestors(targets) if targets else list(self.stages)
+        results = {}
+        pending = list(names)
+        running = {}
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            while pending or running:
+                progressed = True
+                while progressed:
+                    progressed = False
+                    for name in list(pending):
+                        upstream = self.upstream[name] & set(names)
+                        if any(results.get(up) in ('failed', 'blocked') for up in upstream):
+                            pending.remove(name)
+                            results[name] = 'blocked'
+                            print(f"Stage '{name}' blocked by a failed upstream stage")
+                            progressed = True
+                        elif all(results.get(up) in ('ran', 'skipped', 'would run') for up in upstream):
+                            pending.remove(name)
+                            progressed = True
+                            stage = self.stages[name]
+                            if dry and any(results.get(up) == 'would run' for up in upstream):
+                                reasons = ['upstream changed']
+                            else:
+                                reasons = ['forced'] if force else self.changes(stage)
+                            missing = [dep for dep in stage.deps if not os.path.exists(dep)]
+                            if missing and not dry:
+                                results[name] = 'failed'
+                                print(f"ERROR: stage '{name}' has missing dependencies: {', '.join(missing)}")
+                            elif not reasons:
+                                results[name] = 'skipped'
+                                print(f"Stage '{name}' didn't change, skipping")
+                            elif dry:
+                                results[name] = 'would run'
+                                print(f"Would run stage '{name}': {', '.join(reasons)}")
+                            else:
+                                print(f"Running stage '{name}': {', '.join(reasons)}")
+                                running[pool.submit(run_command, stage.cmd, name)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    returncode, output, seconds = future.result()
+                    if output:
+                        print(output.rstrip())
+                    stage = self.stages[name]
+                    missing = [out for out in stage.outs if not os.path.exists(out)]
+                    if returncode != 0 or missing:
+                        results[name] = 'failed'
+                        detail = f'exit code {returncode}' if returncode else f'missing outputs {missing}'
+                        print(f"ERROR: stage '{name}' failed ({detail})")
+                        continue
+                    self.lock['stages'][name] = self.lock_entry(stage)
+                    self.write_lock()
+                    results[name] = 'ran'
+                    print(f"Stage '{name}' finished in {seconds:.1f}s")
+        self.state.save()
+        return results
+
+def run_command(cmd, name=None):
+    """Run one stage command in its own process; returns (exit code, combined output, seconds)"""
+    start = time.perf_counter()
+    with span(name or cmd, 'stage', cmd=cmd) as stage_span:
+        proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        stage_span.set(returncode=proc.returncode)
+    return proc.returncode, proc.stdout, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental dvc.yaml pipeline runner')
+    parser.add_argument('command', choices=['repro', 'status'])
+    parser.add_argument('targets', nargs='*', help='Stages (default: all)')
+    parser.add_argument('--force', '-f', action='store_true', help='Run stages even if unchanged')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='Parallel stages')
+    parser.add_argument('--dry', action='store_true', help='Only show what would run')
+    parser.add_argument('--file', default=DVC_FILE, help='Pipeline file')
+    parser.add_argument('--trace', default=None,
+                        help='Record stage and function spans of the run to this JSON lines trace')
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=None,
+                        help='With --trace: cProfile each outermost span, or sample stacks')
+    args = parser.parse_args(argv)
+    if args.trace:
+        enable(args.trace)
+        if args.profile:
+            os.environ[PROFILE_ENV] = args.profile  # profile the stage processes, not the runner's waiting threads
+
+    pipeline = Pipeline(args.file)
+    if args.command == 'status':
+        changed = {name: reasons for name, reasons in pipeline.status(args.targets).items() if reasons}
+        if not changed:
+            print("Data and pipelines are up to date.")
+        for name, reasons in changed.items():
+            print(f"{name}:")
+            for reason in reasons:
+                print(f"    {reason}")
+        return 0
+
+    start = time.perf_counter()
+    results = pipeline.repro(args.targets, force=args.force, jobs=args.jobs, dry=args.dry)
+    print(f"Pipeline finished in {time.perf_counter() - start:.2f}s: "
+          + ', '.join(f"{name} {result}" for name, result in results.items()))
+    return 1 if any(result in ('failed', 'blocked') for result in results.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
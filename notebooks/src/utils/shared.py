@@ -0,0 +1,49 @@
+# src/utils/shared.py
+"""
+Numpy arrays in shared memory for process pools.
+
+The parent copies each array into its own multiprocessing.shared_memory
+block once; workers attach to the blocks by name in their initializer and
+get zero-copy views, so large inputs are never pickled per task.
+Version: 1.0
+"""
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedColumns:
+    """Named numpy arrays in shared memory blocks, attachable from worker processes by spec"""
+
+    def __init__(self):
+        self.blocks = []
+        self.specs = {}
+        self.arrays = {}
+
+    def empty(self, name, dtype, length):
+        dtype = np.dtype(dtype)
+        block = shared_memory.SharedMemory(create=True, size=max(int(length) * dtype.itemsize, 1))
+        self.blocks.append(block)
+        self.specs[name] = (block.name, dtype.str, int(length))
+        self.arrays[name] = np.ndarray((length,), dtype=dtype, buffer=block.buf)
+        return self.arrays[name]
+
+    def add(self, name, values):
+        values = np.asarray(values)
+        self.empty(name, values.dtype, len(values))[:] = values
+        return self.arrays[name]
+
+    @staticmethod
+    def attach(specs):
+        """Views of the arrays in another process; keep `blocks` alive while using them"""
+        blocks, arrays = [], {}
+        for name, (block_name, dtype, length) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+        return blocks, arrays
+
+    def release(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
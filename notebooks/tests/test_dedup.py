@@ -0,0 +1,54 @@
+# tests/test_dedup.py
+"""
+Streaming duplicate elimination (user-017) against DataFrame.duplicated:
+across chunks, with a key, with disk spills, for 64 and 128-bit
+fingerprints, and for integer IDs above 2**53.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.dedup import Deduplicator, row_fingerprints
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.default_rng(17)
+    n = 20_000
+    df = pd.DataFrame({
+        'PolicyID': rng.integers(0, 6000, n),
+        'TransactionMonth': rng.choice(['2015-01', '2015-02', '2015-03'], n),
+        'TotalPremium': rng.choice([0.5, 21.9, 100.0, np.nan], n),
+        'Province': rng.choice(['Gauteng', 'Free State', None], n),
+    })
+    return df
+
+def streamed_keep(df, dedup, chunksize=1500):
+    with dedup:
+        keep = np.concatenate([dedup.new_rows(df.iloc[start:start + chunksize])
+                               for start in range(0, len(df), chunksize)])
+    return keep, dedup
+
+@pytest.mark.parametrize('bits', [64, 128])
+@pytest.mark.parametrize('max_memory_rows', [None, 1000])
+def test_streaming_matches_duplicated(frame, bits, max_memory_rows, tmp_path):
+    keep, dedup = streamed_keep(frame, Deduplicator(bits=bits, max_memory_rows=max_memory_rows,
+                                                    spill_dir=tmp_path))
+    np.testing.assert_array_equal(keep, ~frame.duplicated().to_numpy())
+    assert dedup.duplicates_removed == frame.duplicated().sum()
+    assert (dedup.seen.spills > 0) == (max_memory_rows is not None)
+
+def test_key_columns(frame):
+    key = ['PolicyID', 'TransactionMonth']
+    keep, _ = streamed_keep(frame, Deduplicator(key=key))
+    np.testing.assert_array_equal(keep, ~frame.duplicated(subset=key).to_numpy())
+
+def test_dtype_drift_between_chunks():
+    as_int = pd.DataFrame({'PolicyID': [1, 2, 3], 'Amount': [0.5, 2.0, -0.0]})
+    as_float = pd.DataFrame({'PolicyID': [1.0, 2.0, np.nan], 'Amount': [0.5, 2.0, 0.0]})
+    np.testing.assert_array_equal(row_fingerprints(as_int)[:2], row_fingerprints(as_float)[:2])
+
+def test_large_integer_ids_stay_distinct():
+    ids = pd.DataFrame({'PolicyID': np.arange(2 ** 53, 2 ** 53 + 1000, dtype=np.int64)})
+    keep, dedup = streamed_keep(pd.concat([ids, ids]), Deduplicator(key=['PolicyID']), chunksize=700)
+    assert keep[:1000].all() and not keep[1000:].any()
+    assert dedup.duplicates_removed == 1000
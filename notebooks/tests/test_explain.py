@@ -0,0 +1,115 @@
+# tests/test_explain.py
+"""
+TreeSHAP explanations (user-024) against exact Shapley values enumerated
+over all feature coalitions on the fitted sklearn trees, plus additivity
+against estimator.predict and cached/parallel explain_batch against serial.
+"""
+from itertools import combinations
+from math import factorial
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from src.models.design import ClaimModel, DesignEncoder
+from src.models.explain import ExplanationStore, TreeExplainer, explain_batch
+
+ESTIMATORS = [
+    RandomForestRegressor(n_estimators=8, max_depth=5, random_state=0),
+    GradientBoostingRegressor(n_estimators=10, max_depth=3, random_state=0),
+    DecisionTreeRegressor(max_depth=6, random_state=0),
+]
+
+@pytest.fixture(scope='module')
+def frames():
+    rng = np.random.default_rng(24)
+    n = 2000
+    df = pd.DataFrame({
+        'VehicleAge': rng.integers(0, 25, n).astype(float),
+        'CubicCapacity': rng.normal(2000, 500, n),
+        'Province': rng.choice(['Gauteng', 'Western Cape', 'Free State'], n),
+        'Gender': rng.choice(['Male', 'Female'], n),
+    })
+    df['TotalClaims'] = (df['VehicleAge'] * 30 + (df['Province'] == 'Gauteng') * 400
+                         + (df['CubicCapacity'] > 2200) * (df['Gender'] == 'Male') * 250
+                         + rng.gamma(2.0, 100.0, n))
+    scoring = df.sample(30, random_state=1).reset_index(drop=True)
+    scoring.loc[::7, 'Province'] = 'Limpopo'  # not seen in training
+    return df, scoring
+
+@pytest.fixture(scope='module', params=ESTIMATORS, ids=lambda estimator: type(estimator).__name__)
+def model(request, frames):
+    train, _ = frames
+    encoder = DesignEncoder(['VehicleAge', 'CubicCapacity'], ['Province', 'Gender']).fit(train)
+    estimator = request.param.fit(encoder.transform(train), train['TotalClaims'])
+    return ClaimModel(encoder, estimator, type(estimator).__name__)
+
+def _conditional_expectation(tree, x, group, coalition, node=0):
+    """E[tree(x)] with the features in coalition fixed to x, the others averaged by cover"""
+    left, right = tree.children_left[node], tree.children_right[node]
+    if left < 0:
+        return tree.value[node].ravel()[0]
+    if group[tree.feature[node]] in coalition:
+        return _conditional_expectation(tree, x, group, coalition,
+                                        left if x[tree.feature[node]] <= tree.threshold[node] else right)
+    cover = tree.weighted_n_node_samples
+    return (cover[left] * _conditional_expectation(tree, x, group, coalition, left)
+            + cover[right] * _conditional_expectation(tree, x, group, coalition, right)) / cover[node]
+
+def _exact_shap(estimator, x, group, n_groups):
+    """Shapley values of one encoded row by enumerating every coalition of the feature groups"""
+    if isinstance(estimator, RandomForestRegressor):
+        trees, scale = [e.tree_ for e in estimator.estimators_], 1.0 / len(estimator.estimators_)
+    elif isinstance(estimator, GradientBoostingRegressor):
+        trees, scale = [e.tree_ for e in estimator.estimators_.ravel()], estimator.learning_rate
+    else:
+        trees, scale = [estimator.tree_], 1.0
+
+    def value(coalition):
+        return scale * sum(_conditional_expectation(tree, x, group, coalition) for tree in trees)
+
+    phi = np.zeros(n_groups)
+    for k in range(n_groups):
+        others = [g for g in range(n_groups) if g != k]
+        for size in range(n_groups):
+            weight = factorial(size) * factorial(n_groups - size - 1) / factorial(n_groups)
+            for subset in combinations(others, size):
+                phi[k] += weight * (value(set(subset) | {k}) - value(set(subset)))
+    return phi
+
+def test_matches_exact_shapley_values(model, frames):
+    _, scoring = frames
+    explainer = TreeExplainer(model)
+    rows = explainer.encode(scoring)
+    expected = np.array([_exact_shap(model.estimator, row, explainer.column_group, len(explainer.feature_names))
+                         for row in rows])
+    np.testing.assert_allclose(explainer.shap_values(scoring), expected, rtol=1e-9, atol=1e-7)
+
+def test_values_sum_to_prediction(model, frames):
+    _, scoring = frames
+    explainer = TreeExplainer(model)
+    values = explainer.shap_values(scoring)
+    np.testing.assert_allclose(values.sum(axis=1) + explainer.expected_value, model.predict(scoring), rtol=1e-9)
+
+def test_untabulated_values_match(model, frames):
+    _, scoring = frames
+    np.testing.assert_allclose(TreeExplainer(model, table_mb=0).shap_values(scoring),
+                               TreeExplainer(model).shap_values(scoring), rtol=1e-9, atol=1e-9)
+
+def test_stored_parallel_batch_matches_serial(model, frames, tmp_path):
+    _, scoring = frames
+    explainer = TreeExplainer(model)
+    policies = pd.concat([scoring, scoring.head(10)], ignore_index=True)
+    serial, _ = explain_batch(policies, explainer, workers=1)
+    np.testing.assert_allclose(serial.to_numpy(), explainer.shap_values(policies), rtol=1e-12)
+
+    store = ExplanationStore(tmp_path / 'store')
+    parallel, stats = explain_batch(policies, explainer, store=store, workers=2, batch_rows=8)
+    assert stats['unique_rows'] == stats['computed_rows'] == len(scoring)
+    pd.testing.assert_frame_equal(parallel, serial)
+
+    cached, stats = explain_batch(policies, explainer, store=store, workers=2)
+    assert stats['stored_rows'] == len(scoring) and stats['computed_rows'] == 0
+    pd.testing.assert_frame_equal(cached, serial)
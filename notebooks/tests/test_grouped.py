@@ -0,0 +1,63 @@
+# tests/test_grouped.py
+"""
+Single-pass grouped statistics (user-004) against pandas and scipy on
+fixed data with missing keys, missing values and a large common offset.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from src.analysis.grouped import GroupMoments, anova_oneway, contingency_table, factorize, welch_ttest
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.default_rng(4)
+    n = 5000
+    df = pd.DataFrame({
+        'Province': rng.choice(['Gauteng', 'Western Cape', 'Free State', 'Limpopo'], n),
+        'Gender': rng.choice(['Male', 'Female', 'Not specified'], n),
+        'LossRatio': 1e6 + rng.gamma(2.0, 0.5, n),
+    })
+    df.loc[rng.random(n) < 0.03, 'Province'] = None
+    df.loc[rng.random(n) < 0.03, 'LossRatio'] = np.nan
+    return df
+
+def groups(df, key):
+    return [values.dropna().to_numpy() for _, values in df.groupby(key)['LossRatio']]
+
+def test_moments_match_groupby(frame):
+    moments = GroupMoments.from_frame(frame, 'Province', 'LossRatio')
+    expected = frame.groupby('Province')['LossRatio'].agg(['size', 'count', 'mean', 'var'])
+    result = moments.to_frame().loc[expected.index]
+    np.testing.assert_array_equal(result['rows'], expected['size'])
+    np.testing.assert_array_equal(result['count'], expected['count'])
+    np.testing.assert_allclose(result['mean'], expected['mean'], rtol=1e-14)
+    np.testing.assert_allclose(result['std'] ** 2, expected['var'], rtol=1e-9)
+
+def test_multi_key_codes(frame):
+    codes, labels = factorize(frame['Province'], frame['Gender'])
+    assert (codes[frame['Province'].isna().to_numpy()] == -1).all()
+    expected = frame.groupby(['Province', 'Gender']).size()
+    counts = pd.Series(np.bincount(codes[codes >= 0], minlength=len(labels)), index=labels)
+    pd.testing.assert_series_equal(counts.loc[expected.index], expected, check_names=False)
+
+def test_anova_matches_scipy(frame):
+    f_stat, p_value = anova_oneway(GroupMoments.from_frame(frame, 'Province', 'LossRatio'))
+    expected = stats.f_oneway(*groups(frame, 'Province'))
+    assert f_stat == pytest.approx(expected.statistic, rel=1e-8)
+    assert p_value == pytest.approx(expected.pvalue, rel=1e-6)
+
+def test_welch_matches_scipy(frame):
+    moments = GroupMoments.from_frame(frame, 'Gender', 'LossRatio')
+    t_stat, p_value = welch_ttest(*moments.get('Male'), *moments.get('Female'))
+    male, female = (frame.loc[frame['Gender'] == g, 'LossRatio'].dropna() for g in ('Male', 'Female'))
+    expected = stats.ttest_ind(male, female, equal_var=False)
+    assert t_stat == pytest.approx(expected.statistic, rel=1e-8)
+    assert p_value == pytest.approx(expected.pvalue, rel=1e-6)
+
+def test_contingency_table_matches_crosstab(frame):
+    expected = pd.crosstab(frame['Province'], frame['Gender'])
+    result = contingency_table(frame['Province'], frame['Gender'])
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+    assert list(result.index) == list(expected.index) and list(result.columns) == list(expected.columns)
@@ -0,0 +1,50 @@
+# tests/test_preprocess.py
+"""
+The chunked (user-001) and partitioned (user-015) preprocessing paths
+against the in-memory clean_data on a synthetic portfolio with missing
+values and duplicates. Medians are exact (quantile_error=None), so the
+outputs must match row for row.
+"""
+import pandas as pd
+import pytest
+import yaml
+from pathlib import Path
+
+from src.data.preprocess import (calculate_business_metrics, clean_data, clean_data_parallel,
+                                 clean_data_streaming, load_data)
+from src.data.schema import CategoryDictionary, apply_schema, load_schema
+from src.data.synthetic import write_portfolio
+
+PARAMS = Path(__file__).resolve().parents[1] / 'config' / 'params.yaml'
+
+@pytest.fixture(scope='module')
+def schema():
+    with open(PARAMS) as f:
+        return load_schema(yaml.safe_load(f))
+
+@pytest.fixture(scope='module')
+def raw_path(tmp_path_factory):
+    return write_portfolio(tmp_path_factory.mktemp('raw') / 'insurance_data.csv', 3000, seed=3,
+                           missing_rate=0.05, duplicate_rate=0.02)
+
+@pytest.fixture(scope='module')
+def in_memory(raw_path, schema):
+    df = calculate_business_metrics(load_data(raw_path, schema), verbose=False)
+    return clean_data(df, quantile_error=None)
+
+def test_streaming_matches_in_memory(raw_path, schema, in_memory, tmp_path):
+    expected = apply_schema(in_memory, schema, CategoryDictionary()).reset_index(drop=True)
+    metrics = clean_data_streaming(raw_path, tmp_path / 'cleaned_data.csv', chunksize=700, write_csv=False,
+                                   schema=schema, quantile_error=None)
+    streamed = pd.read_parquet(tmp_path / 'cleaned_data.parquet')
+    pd.testing.assert_frame_equal(streamed, expected, check_categorical=False)
+    assert metrics['preprocessing']['final_rows'] == len(expected)
+    assert metrics['preprocessing']['duplicates_removed'] == 3000 - len(expected)
+
+@pytest.mark.parametrize('partition_by', [None, 'Province'])
+def test_partitioned_matches_in_memory(raw_path, schema, in_memory, partition_by):
+    imputation = {}
+    result = clean_data_parallel(load_data(raw_path, schema), workers=2, partition_by=partition_by,
+                                 min_partition_rows=500, quantile_error=None, imputation=imputation)
+    pd.testing.assert_frame_equal(result, in_memory)
+    assert imputation and all(record['missing'] > 0 for record in imputation.values())
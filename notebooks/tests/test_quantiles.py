@@ -0,0 +1,49 @@
+# tests/test_quantiles.py
+"""
+KLL quantile sketches (user-016) against numpy/pandas: exact before the
+first compaction, within the rank error after it, and mergeable.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.quantiles import QuantileSketch, median_imputation
+
+@pytest.fixture(scope='module')
+def values():
+    return np.random.default_rng(16).lognormal(8.0, 1.5, 200_000)
+
+def rank_error(sorted_values, estimate, q):
+    """Distance between q and the normalized rank range of the estimate"""
+    low = np.searchsorted(sorted_values, estimate, side='left') / len(sorted_values)
+    high = np.searchsorted(sorted_values, estimate, side='right') / len(sorted_values)
+    return max(low - q, q - high, 0.0)
+
+def test_exact_until_first_compaction():
+    series = pd.Series([4.0, np.nan, 1.0, 7.0, 2.0, np.nan, 9.0])
+    fill, record = median_imputation(QuantileSketch().update(series), series.isna().sum())
+    assert fill == series.median()
+    assert record['missing'] == 2 and record['rank_error'] == 0.0
+    np.testing.assert_allclose(QuantileSketch(None).update(series).quantile([0.1, 0.9]),
+                               series.quantile([0.1, 0.9]))
+
+@pytest.mark.parametrize('error', [0.01, 0.001])
+def test_rank_error_within_bound(values, error):
+    sketch = QuantileSketch(error)
+    for chunk in np.array_split(values, 40):
+        sketch.update(chunk)
+    assert not sketch.exact
+    sorted_values = np.sort(values)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        assert rank_error(sorted_values, sketch.quantile(q), q) <= error
+    assert sketch.min == values.min() and sketch.max == values.max()
+
+def test_merged_partitions_within_bound(values):
+    partitions = [QuantileSketch(0.001, seed=i).update(part) for i, part in enumerate(np.array_split(values, 8))]
+    merged = partitions[0]
+    for sketch in partitions[1:]:
+        merged = merged.merge(sketch)
+    assert merged.n == len(values)
+    assert rank_error(np.sort(values), merged.median(), 0.5) <= 0.001
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch(0.01))
@@ -0,0 +1,60 @@
+# tests/test_resampling.py
+"""
+Batched permutation and bootstrap engine (user-006): observed statistics
+against scipy, p-values against scipy.stats.permutation_test, results
+independent of the number of workers, and undefined cases reported as such.
+"""
+import numpy as np
+import pytest
+from scipy import stats
+
+from src.analysis.resampling import ResamplingEngine
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(6)
+    codes = rng.integers(0, 3, 3000)
+    values = 1e9 + rng.normal(0, 1e-3, 3000) + 2e-4 * (codes == 1)  # large mean, small variance
+    return codes, values
+
+def test_observed_statistics_match_scipy(data):
+    codes, values = data
+    engine = ResamplingEngine(n_permutations=200, n_bootstrap=200, n_jobs=1)
+    centred = values - 1e9  # exact here, so scipy sees the same data without cancellation
+    groups = [centred[codes == g] for g in range(3)]
+    anova = engine.permutation_test(codes, values, 'anova_f')
+    assert anova['observed'] == pytest.approx(stats.f_oneway(*groups).statistic, rel=1e-9)
+    welch = engine.permutation_test(codes, values, 'welch_t')
+    expected = stats.ttest_ind(groups[1], groups[0], equal_var=False).statistic
+    assert welch['observed'] == pytest.approx(abs(expected), rel=1e-9)
+    effect = engine.bootstrap_ci(codes, values, 'mean_difference')
+    assert effect['estimate'] == pytest.approx(groups[1].mean() - groups[0].mean(), rel=1e-9)
+    assert effect['ci_low'] < effect['estimate'] < effect['ci_high']
+
+def test_p_value_matches_scipy_permutation_test():
+    rng = np.random.default_rng(7)
+    codes = np.repeat([0, 1], 60)
+    values = rng.normal(0, 1, 120) + 0.3 * codes
+    engine = ResamplingEngine(n_permutations=4000, n_jobs=1, decision_level=1e-12)
+    result = engine.permutation_test(codes, values, 'welch_t')
+    expected = stats.permutation_test(
+        (values[codes == 0], values[codes == 1]),
+        lambda x, y: abs(stats.ttest_ind(x, y, equal_var=False).statistic),
+        n_resamples=4000, alternative='greater', random_state=0).pvalue
+    assert result['p_value'] == pytest.approx(expected, abs=0.02)
+
+def test_results_do_not_depend_on_workers(data):
+    codes, values = data
+    serial = ResamplingEngine(n_permutations=300, n_bootstrap=300, n_jobs=1, memory_budget_mb=1)
+    parallel = ResamplingEngine(n_permutations=300, n_bootstrap=300, n_jobs=2, memory_budget_mb=1)
+    assert serial.permutation_test(codes, values, 'anova_f') == parallel.permutation_test(codes, values, 'anova_f')
+    assert serial.bootstrap_ci(codes, values, 'mean_range') == parallel.bootstrap_ci(codes, values, 'mean_range')
+
+def test_undefined_statistics_are_not_significant():
+    engine = ResamplingEngine(n_permutations=100, n_bootstrap=100, n_jobs=1)
+    single = engine.permutation_test(np.zeros(20, dtype=int), np.arange(20.0), 'anova_f')
+    assert np.isnan(single['p_value']) and not single['reject_null'] and 'reason' in single
+    constant = engine.permutation_test(np.repeat([0, 1], 10), np.ones(20), 'welch_t')
+    assert np.isnan(constant['p_value']) and not constant['reject_null'] and 'reason' in constant
+    ci = engine.bootstrap_ci(np.zeros(20, dtype=int), np.arange(20.0), 'mean_difference')
+    assert np.isnan(ci['ci_low']) and 'reason' in ci
@@ -0,0 +1,55 @@
+# tests/test_stats_store.py
+"""
+Mergeable segment statistics (user-005): a store built month by month,
+saved and reloaded, must equal the statistics of all rows at once.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from src.analysis.grouped import anova_oneway
+from src.analysis.stats_store import SegmentStats
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.default_rng(5)
+    n = 6000
+    df = pd.DataFrame({
+        'Month': rng.integers(1, 7, n),
+        'Province': rng.choice(['Gauteng', 'Western Cape', 'Free State', 'Limpopo'], n),
+        'Gender': rng.choice(['Male', 'Female'], n),
+        'PostalCode': rng.integers(1000, 1100, n),
+        'LossRatio': 5e3 + rng.gamma(2.0, 0.5, n),
+        'HasClaim': (rng.random(n) < 0.2).astype(int),
+    })
+    df.loc[(df['Month'] == 2) & (df['Province'] == 'Limpopo'), 'Province'] = 'Gauteng'  # a month without Limpopo
+    df.loc[rng.random(n) < 0.02, 'LossRatio'] = np.nan
+    return df
+
+@pytest.fixture(scope='module')
+def incremental(frame, tmp_path_factory):
+    path = tmp_path_factory.mktemp('store') / 'segment_stats.json'
+    for month, batch in frame.groupby('Month'):
+        SegmentStats.load(path).merge(SegmentStats.from_frame(batch, batch_id=f'2015-{month:02d}')).save(path)
+    return SegmentStats.load(path)
+
+def test_merged_moments_match_single_pass(frame, incremental):
+    full = SegmentStats.from_frame(frame)
+    for dim in ('Province', 'PostalCode', 'Gender'):
+        merged = incremental.moments[dim].to_frame()
+        expected = full.moments[dim].to_frame().loc[merged.index]
+        np.testing.assert_array_equal(merged[['rows', 'count']], expected[['rows', 'count']])
+        np.testing.assert_allclose(merged[['mean', 'std']], expected[['mean', 'std']], rtol=1e-10)
+        pd.testing.assert_frame_equal(incremental.claims[dim], full.claims[dim], check_names=False,
+                                      check_index_type=False, check_column_type=False)
+
+def test_merged_anova_matches_scipy(frame, incremental):
+    f_stat, p_value = anova_oneway(incremental.moments['Province'])
+    expected = stats.f_oneway(*[values.dropna() for _, values in frame.groupby('Province')['LossRatio']])
+    assert f_stat == pytest.approx(expected.statistic, rel=1e-8)
+    assert p_value == pytest.approx(expected.pvalue, rel=1e-6)
+
+def test_batch_merged_twice_is_refused(frame, incremental):
+    with pytest.raises(ValueError, match='2015-03'):
+        incremental.merge(SegmentStats.from_frame(frame[frame['Month'] == 3], batch_id='2015-03'))
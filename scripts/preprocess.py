@@ -3,6 +3,9 @@ import json
 from pathlib import Path
 import sys
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.data.storage import write_parquet
+
 def main():
     print("🚀 Starting data preprocessing...")
     
@@ -23,6 +26,10 @@ def main():
         df.to_csv(output_path, index=False)
         print(f"💾 Saved processed data to: {output_path}")
         
+        # Columnar copy for downstream stages (typed, compressed, row-group stats)
+        parquet_path = write_parquet(df, output_path)
+        print(f"💾 Saved columnar data to: {parquet_path}")
+        
         # Save metrics
         Path('reports/metrics').mkdir(parents=True, exist_ok=True)
         metrics = {
@@ -1,24 +1,27 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.visualization.aggregate import load_or_build_cube
 
 print("🎨 Creating visualizations...")
 
 try:
-    # Load processed data
-    df = pd.read_csv('data/processed/cleaned_data.csv')
-    print(f"✅ Data loaded: {df.shape}")
+    # Load the pre-aggregated cube (built from the processed data if stale)
+    cube = load_or_build_cube()
+    print(f"✅ Cube loaded: {cube.n_rows} rows aggregated")
     
     # Create output directories
     Path('reports/figures').mkdir(parents=True, exist_ok=True)
     Path('reports/metrics').mkdir(parents=True, exist_ok=True)
     
     # 1. Loss Ratio by Province (if columns exist)
-    if 'Province' in df.columns and 'LossRatio' in df.columns:
+    if cube.has('province', 'loss_ratio'):
         plt.figure(figsize=(12, 6))
-        province_stats = df.groupby('Province')['LossRatio'].mean().sort_values()
+        province_stats = cube.marginal('province')['mean'].sort_values()
         colors = plt.cm.RdYlGn(range(len(province_stats)))
         plt.bar(province_stats.index, province_stats.values, color=colors)
         plt.title('Loss Ratio by Province')
@@ -31,10 +34,10 @@ try:
         print("✅ Created: loss_ratio_by_province.png")
     
     # 2. Simple correlation matrix
-    numeric_cols = df.select_dtypes(include=['number']).columns
+    numeric_cols = cube.columns
     if len(numeric_cols) > 1:
         plt.figure(figsize=(10, 8))
-        corr_matrix = df[numeric_cols].corr()
+        corr_matrix = cube.correlation()
         sns.heatmap(corr_matrix, annot=True, fmt='.2f', cmap='coolwarm')
         plt.title('Correlation Matrix')
         plt.tight_layout()
@@ -45,7 +48,7 @@ try:
     # Save visualization metrics
     metrics = {
         'figures_created': 2,
-        'data_shape': df.shape,
+        'data_shape': (cube.n_rows, cube.frame_info['columns']),
         'numeric_columns': len(numeric_cols)
     }
     
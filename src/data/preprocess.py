@@ -1,8 +1,13 @@
 import pandas as pd
 import numpy as np
 import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.data.quantiles import DEFAULT_ERROR, QuantileSketch, median_imputation
+from src.data.storage import write_parquet
+
 # Simple config since yaml might not be installed
 CONFIG = {
     'data': {
@@ -10,21 +15,85 @@ CONFIG = {
         'processed_path': 'data/processed/cleaned_data.csv'
     },
     'preprocessing': {
-        'missing_threshold': 0.3
+        'missing_threshold': 0.3,
+        'quantile_error': DEFAULT_ERROR,
+        'categorical_cols': ['province', 'vehicle_type', 'gender'],
+        'numerical_cols': ['vehicle_age', 'cubic_capacity', 'premium']
     }
 }
 
+INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+def load_config(config_path='params.yaml'):
+    """Load params.yaml, falling back to CONFIG when yaml is unavailable"""
+    try:
+        import yaml
+    except ImportError:
+        return CONFIG
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
 def load_data(filepath):
     """Load insurance data"""
     return pd.read_csv(filepath)
 
-def clean_data(df):
-    """Clean the insurance data"""
+def load_categories(filepath):
+    """Load the persisted category dictionary ({column: [categories in code order]})"""
+    path = Path(filepath).with_suffix('.categories.json')
+    if not path.exists():
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_categories(categories, filepath):
+    """Persist the category dictionary alongside the processed data"""
+    path = Path(filepath).with_suffix('.categories.json')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(categories, f, indent=2)
+
+def apply_schema(df, config, categories):
+    """
+    Apply the declared compact schema.
+    
+    categorical_cols become category dtype with codes fixed by `categories`
+    (new values are appended, existing codes never move); numerical_cols are
+    downcast to the narrowest integer type, or float32 when lossless.
+    """
+    preprocessing = config.get('preprocessing', {})
+    for col in preprocessing.get('categorical_cols', []):
+        if col in df.columns:
+            known = categories.setdefault(col, [])
+            new_values = sorted(set(df[col].dropna().astype(str).unique()) - set(known))
+            known.extend(new_values)
+            df[col] = df[col].astype(str).where(df[col].notna()).astype(pd.CategoricalDtype(known))
+    
+    for col in preprocessing.get('numerical_cols', []):
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        if pd.api.types.is_integer_dtype(df[col]):
+            low, high = df[col].min(), df[col].max()
+            # An empty column has no range (NaN min/max): keep its dtype
+            df[col] = df[col].astype(next((t for t in INTEGER_TYPES
+                                           if np.iinfo(t).min <= low and high <= np.iinfo(t).max), df[col].dtype))
+        elif pd.api.types.is_float_dtype(df[col]):
+            as_float32 = df[col].astype('float32')
+            if np.array_equal(as_float32.astype('float64'), df[col], equal_nan=True):
+                df[col] = as_float32
+    
+    return df
+
+def clean_data(df, quantile_error=DEFAULT_ERROR, imputation=None):
+    """Clean the insurance data; medians come from quantile sketches, recorded in `imputation`"""
+    imputation = {} if imputation is None else imputation
+    
     # Handle missing values
     numeric_cols = df.select_dtypes(include=[np.number]).columns
     for col in numeric_cols:
         if df[col].isnull().any():
-            df[col] = df[col].fillna(df[col].median())
+            sketch = QuantileSketch(quantile_error).update(df[col])
+            fill, imputation[col] = median_imputation(sketch, df[col].isnull().sum())
+            df[col] = df[col].fillna(fill)
     
     # Create new features
     if 'premium' in df.columns and 'total_claims' in df.columns:
@@ -33,51 +102,67 @@ def clean_data(df):
     if 'previous_claims' in df.columns:
         df['has_previous_claims'] = (df['previous_claims'] > 0).astype(int)
     
-    # Encode categorical variables
-    categorical_cols = df.select_dtypes(include=['object']).columns
+    # Encode categorical variables (category columns carry their stable codes)
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns
     for col in categorical_cols:
         if col in df.columns:
-            df[f'{col}_code'] = pd.Categorical(df[col]).codes
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[f'{col}_code'] = df[col].cat.codes
+            else:
+                df[f'{col}_code'] = pd.Categorical(df[col]).codes
     
     return df
 def save_data(df, filepath):
-    """Save processed data"""
+    """Save processed data as CSV plus a Parquet copy for downstream stages"""
     Path(filepath).parent.mkdir(parents=True, exist_ok=True)
     df.to_csv(filepath, index=False)
     print(f"Data saved to {filepath}")
+    
+    parquet_path = write_parquet(df, filepath)
+    print(f"Data saved to {parquet_path}")
 
 def main():
     """Main preprocessing function"""
     config = load_config()
     
-    # Load raw data
+    # Load raw data and apply the compact schema straight away
     raw_path = config['data']['raw_path']
+    processed_path = config['data']['processed_path']
     print(f"Loading data from {raw_path}")
     df = load_data(raw_path)
+    memory_before = df.memory_usage(deep=True).sum()
+    categories = load_categories(processed_path)
+    df = apply_schema(df, config, categories)
+    memory_after = df.memory_usage(deep=True).sum()
     print(f"Original shape: {df.shape}")
     
     # Clean data
-    df = clean_data(df)
+    imputation = {}
+    df = clean_data(df, config.get('preprocessing', {}).get('quantile_error', DEFAULT_ERROR), imputation)
     print(f"Cleaned shape: {df.shape}")
     
     # Save processed data
-    processed_path = config['data']['processed_path']
     save_data(df, processed_path)
+    save_categories(categories, processed_path)
     
     # Create metrics
     metrics = {
-        'original_rows': df.shape[0],
-        'original_columns': df.shape[1],
-        'missing_values': df.isnull().sum().sum(),
-        'average_loss_ratio': df['loss_ratio'].mean() if 'loss_ratio' in df.columns else 0
+        'original_rows': int(df.shape[0]),
+        'original_columns': int(df.shape[1]),
+        'missing_values': int(df.isnull().sum().sum()),
+        'average_loss_ratio': float(df['loss_ratio'].mean()) if 'loss_ratio' in df.columns else 0,
+        'memory_usage_before_mb': float(memory_before / 1024 / 1024),
+        'memory_usage_mb': float(memory_after / 1024 / 1024),
+        'memory_reduction_pct': float((1 - memory_after / memory_before) * 100) if memory_before else 0,
+        'imputation': imputation
     }
     
     # Save metrics
-    import json
+    Path('reports/metrics').mkdir(parents=True, exist_ok=True)
     with open('reports/metrics/preprocess_metrics.json', 'w') as f:
         json.dump(metrics, f, indent=2)
     
     print("Preprocessing complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,12 @@
 import pandas as pd
 import numpy as np
 import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.data.quantiles import QuantileSketch, median_imputation
+
 print("Starting data preprocessing...")
 
 # Load data
@@ -10,11 +14,13 @@ df = pd.read_csv('data/raw/insurance_sample_data.csv')
 print(f"Loaded data: {df.shape}")
 print(f"Columns: {list(df.columns)}")
 
-# Basic cleaning
+# Basic cleaning (medians from quantile sketches, recorded in the metrics)
+imputation = {}
 numeric_cols = df.select_dtypes(include=[np.number]).columns
 for col in numeric_cols:
     if df[col].isnull().any():
-        df[col] = df[col].fillna(df[col].median())
+        fill, imputation[col] = median_imputation(QuantileSketch().update(df[col]), df[col].isnull().sum())
+        df[col] = df[col].fillna(fill)
         print(f"Filled missing values in {col}")
 
 # Create loss ratio if columns exist
@@ -50,7 +56,8 @@ metrics = {
     'original_rows': int(df.shape[0]),  # Convert to int
     'original_columns': int(df.shape[1]),  # Convert to int
     'missing_values_total': int(df.isnull().sum().sum()),  # Convert to int
-    'columns_with_missing': int(df.isnull().any().sum())  # Convert to int
+    'columns_with_missing': int(df.isnull().any().sum()),  # Convert to int
+    'imputation': imputation
 }
 
 if 'LossRatio' in df.columns:
@@ -0,0 +1,126 @@
+# src/data/quantiles.py
+"""
+Mergeable quantile sketches for median imputation at scale.
+
+QuantileSketch is a KLL sketch: a stack of compactors where an item on
+level h stands for 2^h input values. A level that outgrows its capacity is
+sorted and every other item (random offset) is promoted to the next level.
+Capacities shrink by 2/3 per level below the top one, so a sketch keeps
+O(k) items however many values it has seen, and the rank error of any
+quantile is about `error` (k is derived from it). Sketches built on chunks
+or partitions merge into the sketch of all their values.
+
+Until its first compaction a sketch holds every value and its quantiles are
+exact (the median matches Series.median()); error=None never compacts.
+Version: 1.0
+"""
+import math
+import numpy as np
+
+DEFAULT_ERROR = 0.001
+SUMMARY_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+def k_for_error(error):
+    """Top compactor size for a normalized rank error (DataSketches' empirical KLL bound, 99% confidence)"""
+    return max(8, math.ceil((2.296 / error) ** (1 / 0.9723)))
+
+class QuantileSketch:
+    """KLL quantile sketch over float values; NaN is ignored"""
+
+    def __init__(self, error=DEFAULT_ERROR, seed=0):
+        self.error = None if error is None else float(error)
+        self.k = None if error is None else k_for_error(self.error)
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def exact(self):
+        return len(self.levels) == 1
+
+    def _capacity(self, level):
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level)))
+
+    def update(self, values):
+        """Add a batch of values (array-like or Series)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        if self.k is None:
+            return
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            odd = len(items) % 2  # an odd item out stays behind
+            promoted = items[odd + self._rng.integers(2)::2]
+            self.levels[level] = items[:odd]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level = 0  # a new top level shrinks the capacities below it
+
+    def merge(self, other):
+        """Sketch of the values of both (e.g. two chunks or worker partitions)"""
+        if other.error != self.error:
+            raise ValueError(f"Cannot merge quantile sketches with error {self.error} and {other.error}")
+        merged = QuantileSketch(self.error)
+        merged._rng = self._rng
+        depth = max(len(self.levels), len(other.levels))
+        merged.levels = [np.concatenate([levels[h] for levels in (self.levels, other.levels) if h < len(levels)])
+                         for h in range(depth)]
+        merged.n = self.n + other.n
+        merged.min = min(self.min, other.min)
+        merged.max = max(self.max, other.max)
+        merged._compress()
+        return merged
+
+    def quantile(self, q):
+        """Quantile(s) q in [0, 1]; NaN when no values were seen"""
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)[()]
+        if self.exact:
+            with np.errstate(invalid='ignore'):  # interpolating between infinite values
+                return np.quantile(self.levels[0], q)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * (self.n - 1) + 1, side='left')
+        values = items[order][np.minimum(position, len(items) - 1)]
+        return np.clip(values, self.min, self.max)[()]
+
+    def median(self):
+        if self.n and self.exact:
+            return float(np.median(self.levels[0]))
+        return float(self.quantile(0.5))
+
+    def summary(self, quantiles=SUMMARY_QUANTILES):
+        """Count, range and quantiles for the metrics file"""
+        values = np.atleast_1d(self.quantile(quantiles))
+        return {
+            'count': int(self.n),
+            'min': float(self.min) if self.n else None,
+            'max': float(self.max) if self.n else None,
+            'quantiles': {f'{q:g}': float(v) for q, v in zip(quantiles, values)},
+            'rank_error': 0.0 if self.exact else self.error,
+        }
+
+def median_imputation(sketch, missing):
+    """Median fill value from a column's quantile sketch, with the audit record for the metrics"""
+    value = sketch.median()
+    return value, {'method': 'median', 'value': value, 'missing': int(missing), **sketch.summary()}
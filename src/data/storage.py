@@ -0,0 +1,173 @@
+# src/data/storage.py
+"""
+Columnar storage for processed datasets.
+
+Processed data is written as a zstd-compressed Parquet file next to the CSV
+(cleaned_data.csv -> cleaned_data.parquet). Row groups carry min/max
+statistics, so readers can project columns and let pyarrow skip row groups
+that a filter rules out. Readers fall back to the CSV when no Parquet file
+has been produced yet.
+Version: 1.0
+"""
+import operator
+import pandas as pd
+from pathlib import Path
+
+DEFAULT_ROW_GROUP_SIZE = 100_000
+COMPRESSION = 'zstd'
+
+# Filter operators applied in memory when only the CSV is available
+_CSV_FILTER_OPS = {
+    '=': operator.eq, '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'in': lambda series, values: series.isin(values),
+    'not in': lambda series, values: ~series.isin(values),
+}
+
+def parquet_path(path):
+    """Parquet sibling of a processed data path"""
+    return Path(path).with_suffix('.parquet')
+
+def write_parquet(df, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Write a DataFrame as Parquet with per-row-group statistics"""
+    path = parquet_path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, index=False, compression=COMPRESSION,
+                  row_group_size=row_group_size, write_statistics=True)
+    return path
+
+class ParquetChunkWriter:
+    """Append DataFrame chunks to one Parquet file, one or more row groups per chunk"""
+
+    def __init__(self, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        self.path = parquet_path(path)
+        self.row_group_size = row_group_size
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression=COMPRESSION,
+                                           write_statistics=True)
+        else:
+            table = pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+
+    def close(self, empty_frame=None):
+        """Close the file; writes an empty file from empty_frame if nothing was appended"""
+        if self.writer is not None:
+            self.writer.close()
+        elif empty_frame is not None:
+            write_parquet(empty_frame, self.path, self.row_group_size)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.writer is not None:
+            self.writer.close()
+        return False
+
+def available_columns(path):
+    """Column names of a processed dataset without reading any rows"""
+    parquet = parquet_path(path)
+    if parquet.exists():
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(parquet).names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def load_processed(path, columns=None, filters=None):
+    """
+    Load a processed dataset, reading only what is needed.
+
+    Parameters:
+    -----------
+    path : str or Path
+        Processed data path (.csv or .parquet); the Parquet sibling is preferred
+    columns : list, optional
+        Columns to read. Names not present in the file are ignored so callers
+        can keep their own "column missing" handling.
+    filters : list, optional
+        pyarrow filter expressions, e.g. [('Province', 'in', ['Gauteng'])].
+        Row groups whose statistics exclude the filter are never read.
+
+    Returns:
+    --------
+    DataFrame
+    """
+    parquet = parquet_path(path)
+    if parquet.exists():
+        if columns is not None:
+            present = set(available_columns(parquet))
+            columns = [col for col in columns if col in present]
+        return pd.read_parquet(parquet, columns=columns, filters=filters)
+
+    usecols = None if columns is None else (lambda col: col in set(columns))
+    return _filter_csv_rows(pd.read_csv(path, usecols=usecols), filters)
+
+def _filter_csv_rows(df, filters):
+    for col, op, value in filters or []:
+        if op not in _CSV_FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        df = df[_CSV_FILTER_OPS[op](df[col], value)]
+    return df
+
+def row_group_count(path):
+    """Row groups of the Parquet sibling of a processed dataset; None when only the CSV exists"""
+    parquet = parquet_path(path)
+    if not parquet.exists():
+        return None
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(parquet).num_row_groups
+
+def iter_processed(path, columns=None, filters=None, row_groups=None, chunksize=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Read a processed dataset chunk by chunk, holding one chunk in memory.
+
+    Parameters:
+    -----------
+    path : str or Path
+        Processed data path (.csv or .parquet); the Parquet sibling is preferred
+    columns : list, optional
+        Columns to read; names not present in the file are ignored
+    filters : list, optional
+        Row filters as for load_processed, applied to every chunk
+    row_groups : list of int, optional
+        Parquet row groups to read (default: all), so that workers can split
+        a file by row group; not supported for CSV
+    chunksize : int
+        Rows per chunk when reading the CSV
+
+    Yields:
+    -------
+    DataFrame, one per Parquet row group or CSV chunk
+    """
+    parquet = parquet_path(path)
+    if parquet.exists():
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(parquet)
+        if columns is not None:
+            present = set(parquet_file.schema_arrow.names)
+            columns = [col for col in columns if col in present]
+        expression = pq.filters_to_expression(filters) if filters else None
+        read_columns = columns
+        if columns is not None and filters:  # filter columns are read, then dropped
+            read_columns = columns + list(dict.fromkeys(col for col, _, _ in filters if col not in columns))
+        for i in range(parquet_file.num_row_groups) if row_groups is None else row_groups:
+            table = parquet_file.read_row_group(i, columns=read_columns)
+            if expression is not None:
+                table = table.filter(expression)
+            yield table.to_pandas() if read_columns == columns else table.select(columns).to_pandas()
+        return
+
+    if row_groups is not None:
+        raise ValueError(f"{path} has no Parquet sibling to read by row group")
+    usecols = None if columns is None else (lambda col: col in set(columns))
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+        yield _filter_csv_rows(chunk, filters)
@@ -0,0 +1,397 @@
+# src/utils/instrument.py
+"""
+Stage-level instrumentation: spans with wall/CPU time, memory, rows and bytes read.
+
+Decorate a function with @traced() or wrap a block in `with span(name):`.
+Nothing is recorded unless tracing is enabled, with enable(path) or by
+setting PIPELINE_TRACE=<trace.jsonl> in the environment, so a span costs
+one global lookup when tracing is off. Every finished span is appended to
+the trace as one JSON line:
+    name, cat, pid, tid, ts and dur (microseconds), wall_s, cpu_s (process
+    CPU), rss_mb and rss_delta_mb (resident memory at the end, change over
+    the span), peak_rss_mb (process high-water mark), rows_in and rows_out
+    (first DataFrame-like argument, return value), bytes_read (read
+    syscalls, Linux), parent (enclosing span) and fields set on the span.
+Worker and stage processes started while tracing inherit the environment
+and append to the same file. When the process that enabled tracing exits,
+the trace is also written in Chrome trace format (<trace>.chrome.json, for
+chrome://tracing or Perfetto).
+
+PIPELINE_PROFILE=cprofile also runs cProfile over every outermost span
+(<trace>.profiles/<span>.<pid>.<n>.prof); PIPELINE_PROFILE=sample samples
+the stacks of threads inside a span every PIPELINE_SAMPLE_INTERVAL seconds
+(default 0.005) and writes them, prefixed with the active spans, as
+collapsed stacks for flame graphs (<trace>.<pid>.collapsed).
+
+Usage:
+    PIPELINE_TRACE=reports/trace/pipeline.jsonl python -m src.data.preprocess
+    python -m src.utils.instrument reports/trace/pipeline.jsonl
+Version: 1.0
+"""
+import argparse
+import atexit
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+TRACE_ENV = 'PIPELINE_TRACE'
+PROFILE_ENV = 'PIPELINE_PROFILE'
+INTERVAL_ENV = 'PIPELINE_SAMPLE_INTERVAL'
+OWNER_ENV = 'PIPELINE_TRACE_OWNER'
+PROFILE_MODES = ('cprofile', 'sample')
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+_PAGE_MB = os.sysconf('SC_PAGE_SIZE') / 1024 / 1024 if hasattr(os, 'sysconf') else 4096 / 1024 / 1024
+_tracer = None
+
+def _rss_mb():
+    """Resident memory of this process (Linux), else None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except OSError:
+        return None
+
+def reset_peak_rss():
+    """Restart the process's peak RSS counter (Linux), so peak_rss_mb() covers what follows; False if unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, since start or the last reset_peak_rss()"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _bytes_read():
+    """Bytes this process has read through read syscalls (Linux), else None"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _rows(value):
+    """Rows of a DataFrame/Series, or of an aggregate exposing n_rows (PlotCube)"""
+    if hasattr(value, 'iloc') and hasattr(value, 'shape'):
+        return len(value)
+    n_rows = getattr(value, 'n_rows', None)
+    return n_rows if isinstance(n_rows, int) else None
+
+def _rows_in(args, kwargs):
+    """Rows of the first DataFrame-like argument, else of the instance's df (e.g. a tester's data)"""
+    for value in list(args) + list(kwargs.values()):
+        rows = _rows(value)
+        if rows is not None:
+            return rows
+    return _rows(getattr(args[0], 'df', None)) if args else None
+
+class Span:
+    """One timed region; fields set on it go to its trace record"""
+
+    def __init__(self, tracer, name, category=None, fields=None):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.fields = dict(fields or {})
+        self.profiler = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+        return self
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        if self.tracer.profile == 'cprofile' and len(stack) == 1:
+            self.profiler = cProfile.Profile()
+        self._bytes = _bytes_read()
+        self._rss = _rss_mb()
+        self._cpu = time.process_time()
+        self._ts = time.time()
+        self._start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profiler is not None:
+            self.profiler.disable()
+        wall = time.perf_counter() - self._start
+        cpu = time.process_time() - self._cpu
+        rss, bytes_read = _rss_mb(), _bytes_read()
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        record = {
+            'name': self.name, 'cat': self.category, 'pid': os.getpid(), 'tid': threading.get_ident(),
+            'ts': int(self._ts * 1e6), 'dur': int(wall * 1e6), 'wall_s': wall, 'cpu_s': cpu,
+            'rss_mb': rss, 'rss_delta_mb': rss - self._rss if rss is not None and self._rss is not None else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'bytes_read': bytes_read - self._bytes if bytes_read is not None and self._bytes is not None else None,
+            'parent': self.parent,
+        }
+        record.update(self.fields)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if self.profiler is not None:
+            record['profile'] = self.tracer.save_profile(self.name, self.profiler)
+        self.tracer.write({key: value for key, value in record.items() if value is not None})
+        return False
+
+class _NullSpan:
+    """Stand-in returned by span() while tracing is off"""
+
+    def set(self, **fields):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Tracer:
+    """Appends span records to a JSON lines trace; owns the optional profilers of this process"""
+
+    def __init__(self, path, profile=None, interval=DEFAULT_SAMPLE_INTERVAL, owner=True):
+        if profile not in (None, '') + PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {profile} (choose from {', '.join(PROFILE_MODES)})")
+        self.path = Path(path)
+        self.profile = profile or None
+        self.interval = float(interval)
+        self.owner_pid = os.getpid() if owner else None
+        self.stacks = defaultdict(list)  # thread id -> open spans
+        self.samples = Counter()
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_pid = None
+        self._profiles = 0
+        self._sampler = None
+        self._stop = threading.Event()
+        if self.profile == 'sample':
+            self.start_sampler()
+
+    def stack(self):
+        return self.stacks[threading.get_ident()]
+
+    def write(self, record):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            if self._file_pid != os.getpid():  # first record, or a forked worker
+                self._file = open(self.path, 'a')
+                self._file_pid = os.getpid()
+            self._file.write(line)
+            self._file.flush()
+
+    def after_fork(self):
+        """Reset per-process state in a forked worker (the lock may have been held by another thread)"""
+        self._lock = threading.Lock()
+        self._file, self._file_pid = None, None
+        self.samples = Counter()
+        self.owner_pid = None
+        if self.profile == 'sample':
+            self.start_sampler()
+
+    def save_profile(self, name, profiler):
+        directory = self.path.with_suffix('.profiles')
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._profiles += 1
+            path = directory / f"{name.replace('/', '_')}.{os.getpid()}.{self._profiles}.prof"
+        profiler.dump_stats(path)
+        return str(path)
+
+    def start_sampler(self):
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='trace-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                spans = self.stacks.get(tid)
+                if tid == me or not spans:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(f'{Path(frame.f_code.co_filename).name}:{frame.f_code.co_name}')
+                    frame = frame.f_back
+                self.samples[';'.join([span.name for span in list(spans)] + frames[::-1])] += 1
+
+    def close(self):
+        """Stop the sampler, write its stacks, close the trace; the owner also writes the Chrome trace"""
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+            if self.samples:
+                with open(self.path.with_suffix(f'.{os.getpid()}.collapsed'), 'w') as f:
+                    for stack, count in self.samples.most_common():
+                        f.write(f'{stack} {count}\n')
+        with self._lock:
+            if self._file is not None and self._file_pid == os.getpid():
+                self._file.close()
+            self._file, self._file_pid = None, None
+        if self.owner_pid == os.getpid() and self.path.exists():
+            write_chrome_trace(self.path)
+
+def enabled():
+    return _tracer is not None
+
+def span(name, category=None, **fields):
+    """Context manager timing a block; a no-op while tracing is off"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, category, fields)
+
+def traced(name=None, category=None):
+    """Decorator recording a span per call, with rows in (first DataFrame argument) and rows out"""
+    def decorate(func):
+        span_name = name or func.__qualname__
+        spec = func.__globals__.get('__spec__')  # a module run with -m is __main__ but keeps its spec
+        span_category = category or (spec.name if spec is not None else func.__module__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with Span(tracer, span_name, span_category, {'rows_in': _rows_in(args, kwargs)}) as current:
+                result = func(*args, **kwargs)
+                current.fields['rows_out'] = _rows(result)
+            return result
+        return wrapper
+
+    if callable(name):  # used as @traced without arguments
+        func, name = name, None
+        return decorate(func)
+    return decorate
+
+def enable(path, profile=None, interval=None):
+    """Start a new trace at path (truncated); processes started from here on join it"""
+    global _tracer
+    disable()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('')
+    interval = interval or float(os.environ.get(INTERVAL_ENV, DEFAULT_SAMPLE_INTERVAL))
+    _tracer = Tracer(path, profile, interval)
+    os.environ[TRACE_ENV] = str(path.resolve())
+    os.environ[OWNER_ENV] = str(os.getpid())
+    if profile:
+        os.environ[PROFILE_ENV] = profile
+    return _tracer
+
+def disable():
+    """Stop tracing in this process (the owner writes the Chrome trace)"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    tracer.close()
+    if tracer.owner_pid == os.getpid():
+        for key in (TRACE_ENV, OWNER_ENV, PROFILE_ENV):
+            os.environ.pop(key, None)
+
+def _configure_from_env():
+    """Join the trace named in the environment, or start it when no parent process owns it"""
+    global _tracer
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return
+    profile = os.environ.get(PROFILE_ENV) or None
+    interval = float(os.environ.get(INTERVAL_ENV, DEFAULT_SAMPLE_INTERVAL))
+    if os.environ.get(OWNER_ENV, str(os.getpid())) != str(os.getpid()):
+        _tracer = Tracer(path, profile, interval, owner=False)
+    else:
+        enable(path, profile, interval)
+
+def _after_fork():
+    if _tracer is not None:
+        _tracer.after_fork()
+
+def read_trace(path):
+    """Span records of a JSON lines trace (a line cut short by a crash is skipped)"""
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+def write_chrome_trace(path, output_path=None):
+    """Convert a JSON lines trace to Chrome trace format (complete events)"""
+    path = Path(path)
+    output_path = Path(output_path) if output_path else path.with_suffix('.chrome.json')
+    events = [{'name': record['name'], 'cat': record.get('cat') or 'span', 'ph': 'X',
+               'ts': record['ts'], 'dur': record['dur'], 'pid': record['pid'], 'tid': record['tid'],
+               'args': {key: value for key, value in record.items()
+                        if key not in ('name', 'cat', 'ts', 'dur', 'pid', 'tid')}}
+              for record in read_trace(path)]
+    with open(output_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return output_path
+
+def summarize(records):
+    """Per span name: calls, total wall/CPU seconds, rows, bytes read and the highest peak RSS"""
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(record['name'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0,
+                                                    'rows_out': 0, 'bytes_read': 0, 'peak_rss_mb': 0.0})
+        entry['calls'] += 1
+        for key in ('wall_s', 'cpu_s', 'rows_in', 'rows_out', 'bytes_read'):
+            entry[key] += record.get(key, 0)
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], record.get('peak_rss_mb', 0.0))
+    return dict(sorted(summary.items(), key=lambda item: -item[1]['wall_s']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a pipeline trace')
+    parser.add_argument('trace', help='JSON lines trace')
+    parser.add_argument('--chrome', default=None, help='Chrome trace output (default: <trace>.chrome.json)')
+    args = parser.parse_args()
+
+    records = read_trace(args.trace)
+    print(f"{'Span':48} {'Calls':>6} {'Wall s':>9} {'CPU s':>9} {'Rows in':>12} {'Rows out':>12} "
+          f"{'MB read':>9} {'Peak MB':>9}")
+    for name, entry in summarize(records).items():
+        print(f"{name[:48]:48} {entry['calls']:>6} {entry['wall_s']:>9.3f} {entry['cpu_s']:>9.3f} "
+              f"{entry['rows_in']:>12,} {entry['rows_out']:>12,} {entry['bytes_read'] / 1024 / 1024:>9.1f} "
+              f"{entry['peak_rss_mb']:>9.1f}")
+    print(f"\nChrome trace: {write_chrome_trace(args.trace, args.chrome)}")
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+atexit.register(disable)
+
+if __name__ == "__main__":
+    main()
+else:
+    _configure_from_env()
@@ -0,0 +1,269 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.data.storage import parquet_path
+from src.visualization.correlation import CorrelationAccumulator
+
+# Cube dimensions and measure, with the column names they go by in the two pipelines
+# (src/data/preprocess.py writes snake_case, scripts/preprocess.py keeps the raw names)
+COLUMN_ALIASES = {
+    'province': ['province', 'Province'],
+    'vehicle_type': ['vehicle_type', 'VehicleType'],
+    'gender': ['gender', 'Gender'],
+    'loss_ratio': ['loss_ratio', 'LossRatio'],
+}
+DIMENSIONS = ['province', 'vehicle_type', 'gender']
+MEASURE = 'loss_ratio'
+CUBE_PATH = 'data/processed/plot_cube.json'
+CHUNK_ROWS = 100_000
+
+def resolve_column(columns, name):
+    """Column in `columns` that plays the role of `name`, or None"""
+    return next((alias for alias in COLUMN_ALIASES.get(name, [name]) if alias in columns), None)
+
+def dimension_codes(series):
+    """Integer codes and labels; missing values get the extra last code"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+        labels = series.cat.categories.tolist()
+    else:
+        codes, uniques = pd.factorize(series, sort=True)
+        codes = codes.astype(np.int64)
+        labels = pd.Index(uniques).tolist()
+    codes[codes < 0] = len(labels)
+    return codes, labels
+
+class PlotCube:
+    """
+    Loss ratio count/sum/sum of squares by province x vehicle_type x gender,
+    plus a CorrelationAccumulator over the numeric columns. Everything the
+    plots and EDA metrics need, independent of the number of rows. Cubes of
+    separate chunks or partitions merge into the cube of all their rows.
+    """
+
+    def __init__(self, dims, names, labels, rows, count, total, total_sq, shift, moments, frame_info):
+        self.dims = list(dims)
+        self.names = dict(names)            # dimension/measure -> source column name
+        self.labels = [list(l) for l in labels]  # per dimension; missing is the extra last slot
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.count = np.asarray(count, dtype=np.int64)
+        self.total = np.asarray(total, dtype=np.float64)      # sums of (loss_ratio - shift)
+        self.total_sq = np.asarray(total_sq, dtype=np.float64)
+        self.shift = float(shift)
+        self.moments = moments
+        self.frame_info = dict(frame_info)
+
+    @property
+    def n_rows(self):
+        return int(self.frame_info['rows'])
+
+    @property
+    def columns(self):
+        return self.moments.columns
+
+    def has(self, *names):
+        return all(name in self.names for name in names)
+
+    def _collapse(self, keep):
+        """count, total, total_sq and rows summed over every dimension not in `keep`"""
+        axes = tuple(i for i, dim in enumerate(self.dims) if dim not in keep)
+        return (self.count.sum(axis=axes), self.total.sum(axis=axes),
+                self.total_sq.sum(axis=axes), self.rows.sum(axis=axes))
+
+    def marginal(self, dim):
+        """Per-label count, mean and std (ddof=1) of the measure, like df.groupby(dim)[measure].agg"""
+        count, total, total_sq, _ = self._collapse([dim])
+        count, total, total_sq = count[:-1], total[:-1], total_sq[:-1]  # drop the missing slot
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.shift + total / count
+            var = np.maximum(total_sq - total * total / count, 0.0) / (count - 1)
+        stats = pd.DataFrame({'count': count, 'mean': mean, 'std': np.sqrt(var)},
+                             index=pd.Index(self.labels[self.dims.index(dim)], name=self.names[dim]))
+        return stats[stats['count'] > 0]
+
+    def pivot_mean(self, index, columns):
+        """Mean of the measure by two dimensions, like pd.pivot_table(..., aggfunc='mean')"""
+        i, j = self.dims.index(index), self.dims.index(columns)
+        count, total, _, _ = self._collapse([index, columns])
+        if i > j:
+            count, total = count.T, total.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, self.shift + total / count, np.nan)[:-1, :-1]
+        pivot = pd.DataFrame(mean, index=pd.Index(self.labels[i], name=self.names[index]),
+                             columns=pd.Index(self.labels[j], name=self.names[columns]))
+        return pivot.dropna(how='all').dropna(axis=1, how='all')
+
+    def nunique(self, dim):
+        _, _, _, rows = self._collapse([dim])
+        return int((rows[:-1] > 0).sum())
+
+    def overall_mean(self):
+        count = self.count.sum()
+        return self.shift + self.total.sum() / count if count else float('nan')
+
+    def column_mean(self, column):
+        i = self.columns.index(column)
+        return float(self.moments.mean[i, i])
+
+    def correlation(self):
+        """Pearson correlation over pairwise-complete rows, like df[columns].corr()"""
+        return self.moments.pearson()
+
+    def _expand(self, labels):
+        """Cell arrays laid out on a wider label set (same dims), measure sums unchanged"""
+        index = []
+        for own, wide in zip(self.labels, labels):
+            position = {label: k for k, label in enumerate(wide)}
+            index.append([position[label] for label in own] + [len(wide)])
+        shape = tuple(len(l) + 1 for l in labels)
+        arrays = []
+        for values in (self.rows, self.count, self.total, self.total_sq):
+            out = np.zeros(shape, dtype=values.dtype)
+            out[np.ix_(*index)] = values
+            arrays.append(out)
+        return arrays
+
+    def merge(self, other):
+        """Cube over the rows of both cubes"""
+        if self.dims != other.dims or self.columns != other.columns:
+            raise ValueError("Cannot merge cubes with different dimensions or numeric columns")
+        labels = []
+        for own, theirs in zip(self.labels, other.labels):
+            union = own + [label for label in theirs if label not in set(own)]
+            try:
+                union = sorted(union)
+            except TypeError:
+                pass
+            labels.append(union)
+        rows_a, count_a, total_a, total_sq_a = self._expand(labels)
+        rows_b, count_b, total_b, total_sq_b = other._expand(labels)
+
+        # Re-express other's sums around this cube's shift
+        d = other.shift - self.shift
+        total_sq_b = total_sq_b + 2 * d * total_b + count_b * d * d
+        total_b = total_b + count_b * d
+
+        info = dict(self.frame_info, rows=self.frame_info['rows'] + other.frame_info['rows'])
+        return PlotCube(self.dims, {**other.names, **self.names}, labels, rows_a + rows_b,
+                        count_a + count_b, total_a + total_b, total_sq_a + total_sq_b, self.shift,
+                        self.moments.merge(other.moments), info)
+
+    def to_dict(self):
+        return {
+            'dims': self.dims, 'names': self.names, 'labels': self.labels,
+            'rows': self.rows.tolist(), 'count': self.count.tolist(),
+            'total': self.total.tolist(), 'total_sq': self.total_sq.tolist(), 'shift': self.shift,
+            'moments': self.moments.to_dict(),
+            'frame_info': self.frame_info,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['dims'], data['names'], data['labels'], data['rows'], data['count'],
+                   data['total'], data['total_sq'], data['shift'],
+                   CorrelationAccumulator.from_dict(data['moments']), data['frame_info'])
+
+    def save(self, path=CUBE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        print(f"Cube saved to {path}")
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+def build_cube(df, dimensions=DIMENSIONS, measure=MEASURE, columns=None):
+    """
+    Aggregate a processed DataFrame (or one chunk of it) into a PlotCube in
+    one vectorized pass. Dimensions that are not in df are left out; numeric
+    columns for the correlation moments default to every numeric column.
+    """
+    names = {}
+    codes, labels = [], []
+    for dim in dimensions:
+        column = resolve_column(df.columns, dim)
+        if column is None:
+            continue
+        names[dim] = column
+        dim_codes, dim_labels = dimension_codes(df[column])
+        codes.append(dim_codes)
+        labels.append(dim_labels)
+    dims = list(names)
+    shape = tuple(len(l) + 1 for l in labels)
+    flat = np.ravel_multi_index(codes, shape) if codes else np.zeros(len(df), dtype=np.int64)
+    size = int(np.prod(shape))
+
+    # Loss ratio moments per cell, shifted by the overall mean for numerical stability
+    measure_column = resolve_column(df.columns, measure)
+    if measure_column is not None:
+        names[measure] = measure_column
+        values = df[measure_column].to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        values = np.full(len(df), np.nan)
+    valid = ~np.isnan(values)
+    shift = values[valid].mean() if valid.any() else 0.0
+    shifted = values[valid] - shift
+    rows = np.bincount(flat, minlength=size).reshape(shape)
+    count = np.bincount(flat[valid], minlength=size).reshape(shape)
+    total = np.bincount(flat[valid], weights=shifted, minlength=size).reshape(shape)
+    total_sq = np.bincount(flat[valid], weights=shifted * shifted, minlength=size).reshape(shape)
+
+    # Pairwise co-moments of the numeric columns (pairwise-complete, like DataFrame.corr)
+    if columns is None:
+        columns = df.select_dtypes(include=[np.number]).columns.tolist()
+    moments = CorrelationAccumulator(columns).update(df)
+
+    return PlotCube(dims, names, labels, rows, count, total, total_sq, shift, moments,
+                    {'rows': len(df), 'columns': len(df.columns),
+                     'object_columns': len(df.select_dtypes(include=['object', 'string']).columns)})
+
+def build_cube_chunked(chunks, dimensions=DIMENSIONS, measure=MEASURE):
+    """Cube of a stream of DataFrame chunks; memory is bounded by one chunk plus the cube"""
+    cube = None
+    for chunk in chunks:
+        if cube is None:
+            cube = build_cube(chunk, dimensions, measure)
+        else:
+            cube = cube.merge(build_cube(chunk, dimensions, measure, columns=cube.columns))
+    return cube
+
+def as_cube(data):
+    """Plot input as a cube: cubes pass through, DataFrames are aggregated"""
+    return data if isinstance(data, PlotCube) else build_cube(data)
+
+def iter_processed(path='data/processed/cleaned_data.csv', chunksize=CHUNK_ROWS):
+    """Processed data in chunks, from the Parquet copy when available"""
+    parquet_file = parquet_path(path)
+    if parquet_file.exists():
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(parquet_file).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+def load_or_build_cube(data_path='data/processed/cleaned_data.csv', cube_path=CUBE_PATH):
+    """The saved cube, unless it is missing or older than the processed data"""
+    cube_file = Path(cube_path)
+    sources = [p for p in (Path(data_path), parquet_path(data_path)) if p.exists()]
+    if cube_file.exists() and all(p.stat().st_mtime <= cube_file.stat().st_mtime for p in sources):
+        return PlotCube.load(cube_path)
+    cube = build_cube_chunked(iter_processed(data_path))
+    cube.save(cube_path)
+    return cube
+
+def main():
+    """Pre-aggregation stage: processed data -> plot cube, streamed in chunks"""
+    data_path = sys.argv[1] if len(sys.argv) > 1 else 'data/processed/cleaned_data.csv'
+    cube_path = sys.argv[2] if len(sys.argv) > 2 else CUBE_PATH
+    cube = build_cube_chunked(iter_processed(data_path))
+    print(f"Data aggregated: {cube.n_rows} rows, {len(cube.columns)} numeric columns")
+    cube.save(cube_path)
+
+if __name__ == "__main__":
+    main()
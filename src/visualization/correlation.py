@@ -0,0 +1,169 @@
+import pandas as pd
+import numpy as np
+import warnings
+
+class CorrelationAccumulator:
+    """
+    One-pass, mergeable Pearson (and approximate Spearman) correlation.
+
+    For every pair of columns (i, j) it keeps, over the rows where both are
+    present: the row count, the mean of each column, the sums of squared
+    deviations and the co-moment. Chunks are folded in with Chan's parallel
+    update (Welford generalised to blocks), so memory is O(columns^2) however
+    many rows are seen, and accumulators built on separate partitions can be
+    merged. Pairwise-complete handling matches DataFrame.corr().
+
+    With spearman=True it also keeps, per pair, a joint histogram over
+    `bins` quantile bins per column (edges fixed from the first chunk).
+    Spearman is then Pearson of the bins' mid-ranks: exact for columns with
+    fewer distinct values than bins, approximate otherwise.
+    """
+
+    def __init__(self, columns, spearman=False, bins=64, edges=None):
+        k = len(columns)
+        self.columns = list(columns)
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))      # [i, j]: mean of column i over rows where i and j are present
+        self.m2 = np.zeros((k, k))        # [i, j]: squared deviations of column i over those rows
+        self.comoment = np.zeros((k, k))  # [i, j]: sum of (x_i - mean_i)(x_j - mean_j)
+        self.spearman = spearman
+        self.bins = int(bins)
+        self.edges = None if edges is None else np.asarray(edges, dtype=np.float64)
+        self.pairs = np.triu_indices(k, 1)
+        self.joint = np.zeros((len(self.pairs[0]), self.bins, self.bins), dtype=np.int64) if spearman else None
+
+    @classmethod
+    def from_frame(cls, df, columns=None, chunksize=None, **kwargs):
+        columns = list(columns) if columns is not None else df.select_dtypes(include=[np.number]).columns.tolist()
+        acc = cls(columns, **kwargs)
+        step = chunksize or max(len(df), 1)
+        for start in range(0, len(df), step):
+            acc.update(df.iloc[start:start + step])
+        return acc
+
+    def spawn(self):
+        """Empty accumulator with the same columns and Spearman bin edges, for another partition"""
+        return CorrelationAccumulator(self.columns, self.spearman, self.bins, self.edges)
+
+    def _values(self, data):
+        if isinstance(data, pd.DataFrame):
+            return data[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.asarray(data, dtype=np.float64)
+
+    def update(self, data):
+        """Fold in a chunk of rows (DataFrame with the columns, or a 2-D array in column order)"""
+        X = self._values(data)
+        if len(X) == 0:
+            return self
+        present = ~np.isnan(X)
+        mask = present.astype(np.float64)
+
+        # Chunk moments around the chunk's column means (keeps the sums small)
+        counts = present.sum(axis=0)
+        center = np.where(counts > 0, np.where(present, X, 0.0).sum(axis=0) / np.maximum(counts, 1), 0.0)
+        centered = np.where(present, X - center, 0.0)
+        n = mask.T @ mask
+        total = centered.T @ mask
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_centered = np.where(n > 0, total / n, 0.0)
+        m2 = np.maximum((centered * centered).T @ mask - total * mean_centered, 0.0)
+        comoment = centered.T @ centered - total * mean_centered.T
+        self._combine(n, mean_centered + center[:, None], m2, comoment)
+
+        if self.spearman:
+            if self.edges is None:
+                self.edges = self._fit_edges(X)
+            self._update_joint(X, present)
+        return self
+
+    def _combine(self, n, mean, m2, comoment):
+        total = self.n + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, n / total, 0.0)
+        delta = mean - self.mean
+        self.comoment = self.comoment + comoment + delta * delta.T * self.n * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * self.n * weight
+        self.mean = self.mean + delta * weight
+        self.n = total
+
+    def _fit_edges(self, X):
+        quantiles = np.linspace(0, 1, self.bins + 1)[1:-1]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-missing columns
+            edges = np.nanquantile(X, quantiles, axis=0).T if len(X) else np.zeros((X.shape[1], self.bins - 1))
+        return np.nan_to_num(edges)
+
+    def _update_joint(self, X, present):
+        binned = np.empty(X.shape, dtype=np.int64)
+        for i in range(X.shape[1]):
+            binned[:, i] = np.searchsorted(self.edges[i], X[:, i], side='right')
+        for p, (i, j) in enumerate(zip(*self.pairs)):
+            both = present[:, i] & present[:, j]
+            flat = binned[both, i] * self.bins + binned[both, j]
+            self.joint[p] += np.bincount(flat, minlength=self.bins * self.bins).reshape(self.bins, self.bins)
+
+    def merge(self, other):
+        """Accumulator covering the rows of both (e.g. two worker partitions)"""
+        if other.columns != self.columns:
+            raise ValueError("Cannot merge correlation accumulators over different columns")
+        merged = self.spawn()
+        merged.n, merged.mean, merged.m2, merged.comoment = self.n, self.mean, self.m2, self.comoment
+        merged._combine(other.n, other.mean, other.m2, other.comoment)
+        if self.spearman:
+            if self.edges is not None and other.edges is not None and not np.array_equal(self.edges, other.edges):
+                raise ValueError("Spearman accumulators must share bin edges; create partitions with spawn()")
+            merged.edges = self.edges if self.edges is not None else other.edges
+            merged.joint = self.joint + other.joint
+        return merged
+
+    def column_means(self):
+        return pd.Series(np.diag(self.mean), index=self.columns)
+
+    def pearson(self):
+        """Pearson correlation matrix, like df[columns].corr()"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.clip(self.comoment / np.sqrt(self.m2 * self.m2.T), -1.0, 1.0)
+        corr[np.diag_indices_from(corr)] = np.where(np.diag(self.m2) > 0, 1.0, np.nan)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def spearman_corr(self):
+        """Approximate Spearman correlation from the binned joint distributions"""
+        if not self.spearman:
+            raise ValueError("Accumulator was created without spearman=True")
+        k = len(self.columns)
+        corr = np.full((k, k), np.nan)
+        for p, (i, j) in enumerate(zip(*self.pairs)):
+            joint = self.joint[p].astype(np.float64)
+            total = joint.sum()
+            if total < 2:
+                continue
+            rows, cols = joint.sum(axis=1), joint.sum(axis=0)
+            rank_i = np.cumsum(rows) - (rows - 1) / 2  # mid-rank of each bin
+            rank_j = np.cumsum(cols) - (cols - 1) / 2
+            dev_i = rank_i - (rows @ rank_i) / total
+            dev_j = rank_j - (cols @ rank_j) / total
+            denominator = np.sqrt((rows @ dev_i ** 2) * (cols @ dev_j ** 2))
+            if denominator > 0:
+                corr[i, j] = corr[j, i] = (dev_i @ joint @ dev_j) / denominator
+        diagonal = np.diag(self.m2) > 0
+        corr[np.diag_indices_from(corr)] = np.where(diagonal, 1.0, np.nan)
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=self.columns, columns=self.columns)
+
+    def to_dict(self):
+        data = {'columns': self.columns, 'n': self.n.tolist(), 'mean': self.mean.tolist(),
+                'm2': self.m2.tolist(), 'comoment': self.comoment.tolist(),
+                'spearman': self.spearman, 'bins': self.bins}
+        if self.spearman:
+            data['edges'] = None if self.edges is None else self.edges.tolist()
+            data['joint'] = self.joint.tolist()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        acc = cls(data['columns'], data.get('spearman', False), data.get('bins', 64), data.get('edges'))
+        k = len(acc.columns)
+        acc.n, acc.mean, acc.m2, acc.comoment = (np.asarray(data[key], dtype=np.float64).reshape(k, k)
+                                                 for key in ('n', 'mean', 'm2', 'comoment'))
+        if acc.spearman:
+            acc.joint = np.asarray(data['joint'], dtype=np.int64).reshape(acc.joint.shape)
+        return acc
@@ -1,9 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 from pathlib import Path
 import json
+import sys
+import argparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.visualization.aggregate import as_cube, load_or_build_cube
+from src.visualization.render import PROFILES, FigureTarget, render_figures
+from src.utils.instrument import traced
 
 def setup_plotting():
     """Setup matplotlib style"""
@@ -13,13 +19,15 @@ def setup_plotting():
     plt.rcParams['savefig.dpi'] = 300
     plt.rcParams['figure.figsize'] = [12, 8]
 
-def plot_loss_ratio_by_province(df, save_path):
-    """Create loss ratio by province bar chart"""
-    if 'province' not in df.columns or 'loss_ratio' not in df.columns:
+@traced()
+def plot_loss_ratio_by_province(cube, save_path):
+    """Create loss ratio by province bar chart from the plot cube (or a DataFrame)"""
+    cube = as_cube(cube)
+    if not cube.has('province', 'loss_ratio'):
         print("Missing required columns for province plot")
         return
     
-    province_stats = df.groupby('province')['loss_ratio'].agg(['mean', 'std']).sort_values('mean')
+    province_stats = cube.marginal('province')[['mean', 'std']].sort_values('mean')
     
     fig, ax = plt.subplots(figsize=(12, 6))
     bars = ax.bar(province_stats.index, province_stats['mean'], 
@@ -41,16 +49,16 @@ def plot_loss_ratio_by_province(df, save_path):
     Path(save_path).parent.mkdir(parents=True, exist_ok=True)
     plt.savefig(save_path, bbox_inches='tight')
     plt.close()
-    print(f"Saved: {save_path}")
 
-def plot_correlation_matrix(df, save_path):
-    """Create correlation matrix heatmap"""
-    numerical_cols = df.select_dtypes(include=[np.number]).columns
-    if len(numerical_cols) < 2:
+@traced()
+def plot_correlation_matrix(cube, save_path):
+    """Create correlation matrix heatmap from the cube's moment matrices"""
+    cube = as_cube(cube)
+    if len(cube.columns) < 2:
         print("Not enough numerical columns for correlation matrix")
         return
     
-    corr_matrix = df[numerical_cols].corr()
+    corr_matrix = cube.correlation()
     
     fig, ax = plt.subplots(figsize=(10, 8))
     sns.heatmap(corr_matrix, annot=True, fmt='.2f', cmap='coolwarm', 
@@ -62,18 +70,16 @@ def plot_correlation_matrix(df, save_path):
     Path(save_path).parent.mkdir(parents=True, exist_ok=True)
     plt.savefig(save_path, bbox_inches='tight')
     plt.close()
-    print(f"Saved: {save_path}")
 
-def plot_risk_heatmap(df, save_path):
-    """Create province vs vehicle type risk heatmap"""
-    if 'province' not in df.columns or 'vehicle_type' not in df.columns or 'loss_ratio' not in df.columns:
+@traced()
+def plot_risk_heatmap(cube, save_path):
+    """Create province vs vehicle type risk heatmap from the plot cube"""
+    cube = as_cube(cube)
+    if not cube.has('province', 'vehicle_type', 'loss_ratio'):
         print("Missing required columns for heatmap")
         return
     
-    pivot = pd.pivot_table(df, values='loss_ratio', 
-                          index='province', 
-                          columns='vehicle_type', 
-                          aggfunc='mean')
+    pivot = cube.pivot_mean('province', 'vehicle_type')
     
     fig, ax = plt.subplots(figsize=(12, 8))
     sns.heatmap(pivot, annot=True, fmt='.2f', cmap='RdYlGn_r',
@@ -87,33 +93,35 @@ def plot_risk_heatmap(df, save_path):
     Path(save_path).parent.mkdir(parents=True, exist_ok=True)
     plt.savefig(save_path, bbox_inches='tight')
     plt.close()
-    print(f"Saved: {save_path}")
 
-def main():
+# Report figures; dpi/format come from the render profile unless set here
+FIGURES = [
+    FigureTarget('loss_ratio_by_province', plot_loss_ratio_by_province),
+    FigureTarget('correlation_matrix', plot_correlation_matrix),
+    FigureTarget('risk_heatmap', plot_risk_heatmap),
+]
+
+def main(profile='report', jobs=None):
     """Main visualization function"""
-    setup_plotting()
-    
-    # Load processed data
-    df = pd.read_csv('data/processed/cleaned_data.csv')
-    print(f"Data loaded: {df.shape}")
+    # Load the pre-aggregated cube (rebuilt only when the processed data is newer)
+    cube = load_or_build_cube('data/processed/cleaned_data.csv')
+    print(f"Cube loaded: {cube.n_rows} rows aggregated")
     
     # Create output directory
     Path('reports/figures').mkdir(parents=True, exist_ok=True)
     Path('reports/metrics').mkdir(parents=True, exist_ok=True)
     
-    # Create plots
-    plot_loss_ratio_by_province(df, 'reports/figures/loss_ratio_by_province.png')
-    plot_correlation_matrix(df, 'reports/figures/correlation_matrix.png')
-    plot_risk_heatmap(df, 'reports/figures/risk_heatmap.png')
+    # Create plots (in parallel; figures whose inputs did not change come from the cache)
+    render_figures(cube, FIGURES, profile, setup=setup_plotting, jobs=jobs)
     
     # Create EDA metrics
     metrics = {
-        'total_policies': len(df),
-        'average_premium': df['premium'].mean() if 'premium' in df.columns else 0,
-        'average_claims': df['total_claims'].mean() if 'total_claims' in df.columns else 0,
-        'overall_loss_ratio': df['loss_ratio'].mean() if 'loss_ratio' in df.columns else 0,
-        'unique_provinces': df['province'].nunique() if 'province' in df.columns else 0,
-        'unique_vehicle_types': df['vehicle_type'].nunique() if 'vehicle_type' in df.columns else 0
+        'total_policies': cube.n_rows,
+        'average_premium': cube.column_mean('premium') if 'premium' in cube.columns else 0,
+        'average_claims': cube.column_mean('total_claims') if 'total_claims' in cube.columns else 0,
+        'overall_loss_ratio': cube.overall_mean() if cube.has('loss_ratio') else 0,
+        'unique_provinces': cube.nunique('province') if cube.has('province') else 0,
+        'unique_vehicle_types': cube.nunique('vehicle_type') if cube.has('vehicle_type') else 0
     }
     
     # Save metrics
@@ -123,4 +131,9 @@ def main():
     print("Visualization complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Render report figures')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='report',
+                        help='preview: fast low-DPI figures; report: final 300 DPI figures')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes')
+    args = parser.parse_args()
+    main(args.profile, args.jobs)
\ No newline at end of file
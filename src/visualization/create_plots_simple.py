@@ -1,23 +1,26 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 from pathlib import Path
 import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.visualization.aggregate import load_or_build_cube
 
 print("Creating visualizations...")
 
-# Load processed data
-df = pd.read_csv('data/processed/cleaned_data.csv')
-print(f"Loaded data: {df.shape}")
+# Load the pre-aggregated cube of the processed data
+cube = load_or_build_cube('data/processed/cleaned_data.csv')
+print(f"Loaded cube: {cube.n_rows} rows aggregated")
 
 # Create output directory
 Path('reports/figures').mkdir(parents=True, exist_ok=True)
 
 # 1. Loss Ratio by Province (if province column exists)
-if 'province' in df.columns and 'loss_ratio' in df.columns:
+if cube.has('province', 'loss_ratio'):
     plt.figure(figsize=(12, 6))
-    province_stats = df.groupby('province')['loss_ratio'].mean().sort_values()
+    province_stats = cube.marginal('province')['mean'].sort_values()
     
     colors = plt.cm.RdYlGn(np.linspace(0, 1, len(province_stats)))
     bars = plt.bar(province_stats.index, province_stats.values, color=colors)
@@ -39,10 +42,10 @@ if 'province' in df.columns and 'loss_ratio' in df.columns:
     print("✅ Created loss_ratio_by_province.png")
 
 # 2. Correlation Matrix
-numeric_cols = df.select_dtypes(include=[np.number]).columns
+numeric_cols = cube.columns
 if len(numeric_cols) > 1:
     plt.figure(figsize=(10, 8))
-    corr_matrix = df[numeric_cols].corr()
+    corr_matrix = cube.correlation()
     sns.heatmap(corr_matrix, annot=True, fmt='.2f', cmap='coolwarm', center=0)
     plt.title('Correlation Matrix', fontsize=16, fontweight='bold')
     plt.tight_layout()
@@ -51,12 +54,9 @@ if len(numeric_cols) > 1:
     print("✅ Created correlation_matrix.png")
 
 # 3. Risk Heatmap (if both province and vehicle_type exist)
-if 'province' in df.columns and 'vehicle_type' in df.columns and 'loss_ratio' in df.columns:
+if cube.has('province', 'vehicle_type', 'loss_ratio'):
     try:
-        pivot = pd.pivot_table(df, values='loss_ratio', 
-                              index='province', 
-                              columns='vehicle_type', 
-                              aggfunc='mean')
+        pivot = cube.pivot_mean('province', 'vehicle_type')
         
         plt.figure(figsize=(12, 8))
         sns.heatmap(pivot, annot=True, fmt='.2f', cmap='RdYlGn_r')
@@ -70,20 +70,20 @@ if 'province' in df.columns and 'vehicle_type' in df.columns and 'loss_ratio' in
 
 # Save EDA metrics
 metrics = {
-    'total_policies': len(df),
-    'total_columns': len(df.columns),
+    'total_policies': cube.n_rows,
+    'total_columns': cube.frame_info['columns'],
     'numeric_columns': len(numeric_cols),
-    'categorical_columns': len(df.select_dtypes(include=['object']).columns)
+    'categorical_columns': cube.frame_info['object_columns']
 }
 
-if 'premium' in df.columns:
-    metrics['average_premium'] = float(df['premium'].mean())
+if 'premium' in cube.columns:
+    metrics['average_premium'] = float(cube.column_mean('premium'))
 
-if 'total_claims' in df.columns:
-    metrics['average_claims'] = float(df['total_claims'].mean())
+if 'total_claims' in cube.columns:
+    metrics['average_claims'] = float(cube.column_mean('total_claims'))
 
-if 'loss_ratio' in df.columns:
-    metrics['overall_loss_ratio'] = float(df['loss_ratio'].mean())
+if cube.has('loss_ratio'):
+    metrics['overall_loss_ratio'] = float(cube.overall_mean())
 
 Path('reports/metrics').mkdir(parents=True, exist_ok=True)
 with open('reports/metrics/eda_metrics.json', 'w') as f:
@@ -0,0 +1,130 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Output settings per target audience; a figure target can override dpi/format
+PROFILES = {
+    'preview': {'dpi': 72, 'format': 'png', 'output_dir': 'reports/figures/preview'},
+    'report': {'dpi': 300, 'format': 'png', 'output_dir': 'reports/figures'},
+}
+CACHE_DIR = 'reports/figures/.cache'
+
+class FigureTarget:
+    """One figure: a plot function (cube, save_path, **params) and its output settings"""
+
+    def __init__(self, name, plot, dpi=None, format=None, params=None):
+        self.name = name
+        self.plot = plot
+        self.dpi = dpi
+        self.format = format
+        self.params = params or {}
+
+def figure_key(cube_digest, target, dpi, fmt, setup=None):
+    """
+    Hash of everything that determines the image: input aggregate, plot and
+    style setup code, parameters, dpi, format and the matplotlib version
+    """
+    import matplotlib
+
+    digest = hashlib.sha256(cube_digest.encode())
+    digest.update(inspect.getsource(target.plot).encode())
+    if setup is not None:
+        digest.update(inspect.getsource(setup).encode())
+    digest.update(matplotlib.__version__.encode())
+    digest.update(json.dumps({'plot': target.plot.__qualname__, 'params': target.params,
+                              'dpi': dpi, 'format': fmt}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:32]
+
+def render_one(plot, setup, cube_data, path, dpi, params):
+    """Worker: draw one figure with the Agg backend and save it at the requested dpi"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from src.visualization.aggregate import PlotCube
+
+    if setup is not None:
+        setup()
+    plt.rcParams['figure.dpi'] = dpi
+    plt.rcParams['savefig.dpi'] = dpi
+    plot(PlotCube.from_dict(cube_data), path, **params)
+    plt.close('all')
+    return path
+
+def load_manifest(cache_dir):
+    path = Path(cache_dir) / 'manifest.json'
+    if not path.exists():
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(manifest, cache_dir):
+    path = Path(cache_dir) / 'manifest.json'
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def render_figures(cube, targets, profile='report', setup=None, jobs=None, cache_dir=CACHE_DIR):
+    """
+    Render figure targets from a cube, in parallel worker processes, reusing cached images.
+
+    Each image is cached under the hash of its inputs (figure_key). A figure
+    whose output already holds that image is left alone; a cached image is
+    copied into place; only the rest are drawn, one process per figure
+    (matplotlib's pyplot state is not thread-safe).
+
+    Prints each figure's output path and status.
+    Returns {target name: (output path, 'unchanged' | 'cached' | 'rendered' | 'skipped')}
+    """
+    settings = PROFILES[profile] if isinstance(profile, str) else profile
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    output_dir = Path(settings['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    cube_data = cube.to_dict()
+    cube_digest = hashlib.sha256(json.dumps(cube_data, sort_keys=True).encode()).hexdigest()
+    manifest = load_manifest(cache_dir)
+
+    results, to_render = {}, {}
+    for target in targets:
+        dpi = target.dpi or settings['dpi']
+        fmt = target.format or settings['format']
+        key = figure_key(cube_digest, target, dpi, fmt, setup)
+        output = output_dir / f'{target.name}.{fmt}'
+        cached = cache_dir / f'{key}.{fmt}'
+        if manifest.get(str(output)) == key and output.exists():
+            results[target.name] = (str(output), 'unchanged')
+        elif cached.exists():
+            results[target.name] = (str(output), 'cached')
+        else:
+            results[target.name] = (str(output), 'rendered')
+            to_render[target.name] = (target, dpi, cached)
+        manifest[str(output)] = key
+
+    if to_render:
+        with ProcessPoolExecutor(max_workers=jobs or min(len(to_render), os.cpu_count() or 1)) as pool:
+            futures = {name: pool.submit(render_one, target.plot, setup, cube_data,
+                                         str(cached.with_name(f'{cached.stem}.tmp{cached.suffix}')),
+                                         dpi, target.params)
+                       for name, (target, dpi, cached) in to_render.items()}
+            for name, future in futures.items():
+                tmp_path = Path(future.result())
+                if not tmp_path.exists():  # the plot function declined (e.g. missing columns)
+                    manifest.pop(results[name][0], None)
+                    results[name] = (results[name][0], 'skipped')
+                    continue
+                os.replace(tmp_path, to_render[name][2])
+
+    for name, (output, status) in results.items():
+        if status in ('cached', 'rendered'):
+            cached = cache_dir / f'{manifest[output]}{Path(output).suffix}'
+            shutil.copyfile(cached, output)
+    save_manifest(manifest, cache_dir)
+    for output, status in results.values():
+        print(f"{status.capitalize()}: {output}")
+    return results
@@ -0,0 +1,42 @@
+# tests/test_correlation.py
+"""
+Streaming correlation (user-014) against DataFrame.corr on fixed data with
+missing values: chunked, merged across partitions and serialized.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.visualization.correlation import CorrelationAccumulator
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.default_rng(14)
+    n = 4000
+    base = rng.normal(size=n)
+    df = pd.DataFrame({
+        'premium': 1e5 + 50 * base + rng.normal(size=n),
+        'claims': rng.gamma(2.0, 1.0, n) + base,
+        'age': rng.integers(0, 20, n).astype(float),
+        'flag': (rng.random(n) < 0.3).astype(float),
+        'constant': np.ones(n),
+    })
+    for col in ('premium', 'claims', 'age'):
+        df.loc[rng.random(n) < 0.05, col] = np.nan
+    return df
+
+def test_chunked_pearson_matches_pandas(frame):
+    acc = CorrelationAccumulator.from_frame(frame, chunksize=333)
+    pd.testing.assert_frame_equal(acc.pearson(), frame.corr(), rtol=1e-10, atol=1e-12)
+    pd.testing.assert_series_equal(acc.column_means(), frame.mean(), rtol=1e-12)
+
+def test_merged_partitions_match_pandas(frame):
+    left = CorrelationAccumulator.from_frame(frame.iloc[:1500], chunksize=500)
+    right = left.spawn().update(frame.iloc[1500:])
+    merged = CorrelationAccumulator.from_dict(left.merge(right).to_dict())
+    pd.testing.assert_frame_equal(merged.pearson(), frame.corr(), rtol=1e-10, atol=1e-12)
+
+def test_spearman_exact_for_few_distinct_values(frame):
+    columns = ['age', 'flag']
+    acc = CorrelationAccumulator.from_frame(frame, columns=columns, chunksize=1000, spearman=True)
+    pd.testing.assert_frame_equal(acc.spearman_corr(), frame[columns].corr(method='spearman'), rtol=1e-10)
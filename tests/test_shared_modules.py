@@ -0,0 +1,15 @@
+# tests/test_shared_modules.py
+"""
+Modules carried by both pipelines (src/ and notebooks/src/) are identical
+copies; each project imports its own, so a change must go into both.
+"""
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+SHARED_MODULES = ['src/data/quantiles.py', 'src/data/storage.py', 'src/utils/instrument.py']
+
+@pytest.mark.parametrize('module', SHARED_MODULES)
+def test_copies_are_identical(module):
+    copy = ROOT / 'notebooks' / module
+    assert (ROOT / module).read_text() == copy.read_text(), f"{module} and {copy.relative_to(ROOT)} differ"